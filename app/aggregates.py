@@ -0,0 +1,151 @@
+import pandas as pd
+
+from constants import CLUB_LIST, DIST_MAP
+from queries import CLUB_DIST_STATS, fetch_frame
+
+# ==========================================
+# 🧮 集計テーブル (クラブ × 距離)
+# ==========================================
+# approach_logs への INSERT / DELETE / UPDATE と同じトランザクションの中で
+# トリガが club_dist_stats を加算・減算する。ステートメント単位のトリガなので
+# 複数行 INSERT や COPY でも1文につき1回の GROUP BY で済む。
+# 集計画面はこのテーブル (数十〜数百行) だけを読めばよい。
+# キーにプレーヤーを含むので、同じラウンドを複数人が同時に記録しても集計行を取り合わない。
+
+STATS_KEYS = ("player_id", "course_name", "club", "dist_range", "lie_type")
+# マイグレーション v5 時点のキー (適用済みの SQL を変えないために残す)
+V5_STATS_KEYS = ("course_name", "club", "dist_range", "lie_type")
+# TEXT 以外のキー列の型
+KEY_TYPES = {"player_id": "INTEGER"}
+
+# (列名, 1行あたりの加算値)  sign は +1 (追加) / -1 (削除)
+STATS_COLUMNS = (
+    ("shots", "1"),
+    ("gir", "CASE WHEN is_green_on THEN 1 ELSE 0 END"),
+    ("prox_u15", "CASE WHEN proximity = 'UNDER_1.5' THEN 1 ELSE 0 END"),
+    ("prox_u30", "CASE WHEN proximity = 'UNDER_3.0' THEN 1 ELSE 0 END"),
+    ("prox_u50", "CASE WHEN proximity = 'UNDER_5.0' THEN 1 ELSE 0 END"),
+    ("prox_o60", "CASE WHEN proximity = 'OVER_6.0' THEN 1 ELSE 0 END"),
+    ("putts_sum", "coalesce(putts, 0)"),
+    ("putts_n", "CASE WHEN putts IS NOT NULL THEN 1 ELSE 0 END"),
+    ("score_sum", "coalesce(hole_score, 0)"),
+    ("over_par_sum", "coalesce(hole_score - par, 0)"),
+    ("penalties", "CASE WHEN penalty IN ('OB', 'PENALTY') THEN 1 ELSE 0 END"),
+)
+
+_TRIGGER_SOURCES = {
+    "ins": ("INSERT", "REFERENCING NEW TABLE AS new_rows", "SELECT 1 AS sign, * FROM new_rows"),
+    "del": ("DELETE", "REFERENCING OLD TABLE AS old_rows", "SELECT -1 AS sign, * FROM old_rows"),
+    "upd": ("UPDATE", "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows",
+            "SELECT 1 AS sign, * FROM new_rows UNION ALL SELECT -1 AS sign, * FROM old_rows"),
+}
+
+
+def _key_expr(key):
+    # 属性の列は列挙型 (categories.py) なので、'' と比べる前に TEXT にする
+    return key if key in KEY_TYPES else f"coalesce({key}::text, '')"
+
+
+def _apply_sql(source, stats_keys=STATS_KEYS):
+    """source の各行を sign 付きでキーごとに集計し、club_dist_stats に足し込む SQL
+
+    同時に書き込むトランザクション同士がデッドロックしないよう、行ロックは常にキー順に取る。
+    """
+    keys = ", ".join(stats_keys)
+    key_exprs = ", ".join(_key_expr(k) for k in stats_keys)
+    cols = ", ".join(c for c, _ in STATS_COLUMNS)
+    sums = ", ".join(f"sum(sign * ({expr}))" for _, expr in STATS_COLUMNS)
+    updates = ", ".join(f"{c} = s.{c} + EXCLUDED.{c}" for c, _ in STATS_COLUMNS)
+    return f"""
+        INSERT INTO club_dist_stats AS s ({keys}, {cols})
+        SELECT {key_exprs}, {sums}
+        FROM ({source}) d
+        GROUP BY {key_exprs}
+        ORDER BY {key_exprs}
+        ON CONFLICT ({keys}) DO UPDATE SET {updates}
+    """
+
+
+def migration_sql(stats_keys=STATS_KEYS):
+    """集計テーブル・トリガ関数・トリガを作り、既存データから集計し直す SQL"""
+    cols = ",\n".join(f"            {c} BIGINT NOT NULL DEFAULT 0" for c, _ in STATS_COLUMNS)
+    keys = ",\n".join(f"            {k} {KEY_TYPES.get(k, 'TEXT')} NOT NULL" for k in stats_keys)
+    parts = [
+        # 作り直しの間に書き込みが割り込まないようにする
+        "LOCK TABLE approach_logs IN SHARE ROW EXCLUSIVE MODE;",
+        f"""
+        CREATE TABLE IF NOT EXISTS club_dist_stats (
+{keys},
+{cols},
+            PRIMARY KEY ({', '.join(stats_keys)})
+        );
+        """,
+        trigger_sql(stats_keys),
+        "TRUNCATE club_dist_stats;",
+        _apply_sql("SELECT 1 AS sign, * FROM approach_logs", stats_keys) + ";",
+    ]
+    return "\n".join(parts)
+
+
+def trigger_sql(stats_keys=STATS_KEYS):
+    """トリガ関数とトリガを作り直す SQL (集計テーブルの中身はそのまま)"""
+    parts = []
+    for op, (event, referencing, source) in _TRIGGER_SOURCES.items():
+        parts.append(f"""
+        CREATE OR REPLACE FUNCTION club_dist_stats_{op}() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            {_apply_sql(source, stats_keys)};
+            RETURN NULL;
+        END
+        $$;
+        DROP TRIGGER IF EXISTS approach_logs_stats_{op} ON approach_logs;
+        CREATE TRIGGER approach_logs_stats_{op} AFTER {event} ON approach_logs
+            {referencing} FOR EACH STATEMENT EXECUTE FUNCTION club_dist_stats_{op}();
+        """)
+    return "\n".join(parts)
+
+
+# --- 読み出し ---
+def load_club_dist_stats(conn):
+    """集計テーブルにプレーヤー名を付けて返す (キーの組み合わせ数の行数しかない)"""
+    return fetch_frame(conn, CLUB_DIST_STATS)
+
+
+def club_dist_table(stats, course_name=None, player=None):
+    """クラブ × 距離の表にまとめる。course_name / player を渡すとそのコース・プレーヤーだけ"""
+    if course_name:
+        stats = stats[stats["course_name"] == course_name]
+    if player:
+        stats = stats[stats["player"] == player]
+    sums = [c for c, _ in STATS_COLUMNS]
+    out = stats.groupby(["club", "dist_range"], sort=False)[sums].sum()
+    out = out[out["shots"] > 0]
+    shots = out["shots"]
+    gir = out["gir"].where(out["gir"] > 0)
+    table = pd.DataFrame({
+        "shots": shots,
+        "gir_pct": (out["gir"] / shots * 100).round(1),
+        "u1.5m_pct": (out["prox_u15"] / gir * 100).round(1),
+        "u3m_pct": ((out["prox_u15"] + out["prox_u30"]) / gir * 100).round(1),
+        "avg_putts": (out["putts_sum"] / out["putts_n"].where(out["putts_n"] > 0)).round(2),
+        "avg_over_par": (out["over_par_sum"] / shots).round(2),
+        "penalty_pct": (out["penalties"] / shots * 100).round(1),
+    })
+    order = {
+        "club": {c: i for i, c in enumerate(CLUB_LIST)},
+        "dist_range": {d: i for i, d in enumerate(DIST_MAP.values())},
+    }
+    table = table.reset_index()
+    return table.sort_values(
+        ["club", "dist_range"], key=lambda s: s.map(order[s.name]).fillna(len(order[s.name])),
+    ).reset_index(drop=True)
+
+
+def gir_pivot(table):
+    """club_dist_table の結果をクラブ (行) × 距離 (列) のパーオン率にする"""
+    dists = table.sort_values(
+        "dist_range", key=lambda s: s.map({d: i for i, d in enumerate(DIST_MAP.values())}).fillna(len(DIST_MAP)),
+    )["dist_range"].unique()
+    return table.pivot(index="club", columns="dist_range", values="gir_pct").reindex(
+        index=table["club"].unique(), columns=dists,
+    )
@@ -0,0 +1,263 @@
+import numpy as np
+import pandas as pd
+
+from constants import PENALTY_STROKES, SHOT_CATEGORIES, SHOT_COLUMNS
+from queries import LOAD_SHOTS, LOAD_SHOTS_SQL, fetch_frame
+from telemetry import get_telemetry
+
+# ==========================================
+# 📊 分析
+# ==========================================
+# approach_logs を一度だけ型付きの DataFrame に読み込み、以降の集計はすべて
+# groupby / NumPy のベクトル演算で行う (行ごとの Python ループは使わない)。
+# 1行 = 1ホール (2打目 = アプローチ) なので、is_green_on がそのまま GIR になる。
+
+# 既知の値の並び順 (表示順) を持つカテゴリ列
+CATEGORY_ORDER = {**SHOT_CATEGORIES, "course_name": []}
+SMALL_INT_COLUMNS = ("hole_no", "par", "recovery_strokes", "hole_score", "putts")
+
+
+def _to_category(series, known):
+    """既知の順序を保ったカテゴリ型にする。未知の値は末尾に追加して落とさない"""
+    values = pd.unique(series.dropna())
+    extra = sorted(set(values) - set(known))
+    return pd.Categorical(series, categories=list(known) + extra)
+
+
+def _cat_lookup(series, mapping, default=0):
+    """カテゴリ列をコード経由で数値に引き当てる (カテゴリ数ぶんの辞書参照だけで済む)"""
+    table = np.array([mapping.get(c, default) for c in series.cat.categories] + [default])
+    # 欠損のコード -1 は末尾の default を指す
+    return table[series.cat.codes.to_numpy()]
+
+
+def prepare(df):
+    """読み込んだ生データを分析用の型に揃える"""
+    df = df.copy()
+    for col, known in CATEGORY_ORDER.items():
+        if col in df:
+            df[col] = _to_category(df[col], known)
+    for col in SMALL_INT_COLUMNS:
+        if col in df:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int16")
+    if "is_green_on" in df:
+        df["is_green_on"] = df["is_green_on"].astype("boolean").fillna(False).astype(bool)
+    if "round_date" in df:
+        df["round_date"] = pd.to_datetime(df["round_date"])
+    for col in ("id", "round_id", "player_id"):
+        if col in df:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int32")
+    return df
+
+
+def for_player(df, player_id):
+    """player_id のプレーヤーの行だけにする (None なら全員)"""
+    if player_id is None:
+        return df
+    return df[df["player_id"].eq(player_id).fillna(False).astype(bool)]
+
+
+def load_shots(conn):
+    return prepare(fetch_frame(conn, LOAD_SHOTS))
+
+
+def iter_shots(conn, chunk_size=50_000, round_ids=None):
+    """サーバ側カーソルで approach_logs を chunk_size 行ずつ読み、型付きの DataFrame を返す
+
+    クライアント側に全件を載せないので、メモリは chunk_size 行分で頭打ちになる。
+    round_ids を渡すとそのラウンドの行だけを読む (round_id の索引を使う)。
+    """
+    sql, params = LOAD_SHOTS_SQL, None
+    if round_ids is not None:
+        sql, params = f"{LOAD_SHOTS_SQL} WHERE round_id = ANY(%(ids)s)", {"ids": [int(i) for i in round_ids]}
+    with get_telemetry().timed("execute", "iter_shots", sql) as info:
+        info["rows"] = 0
+        # 名前付きカーソル = サーバ側カーソル (DECLARE ... CURSOR)
+        with conn.cursor(name="iter_shots") as cur:
+            cur.itersize = chunk_size
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                info["rows"] += len(rows)
+                yield prepare(pd.DataFrame.from_records(rows, columns=SHOT_COLUMNS))
+
+
+# --- 指標 ---
+# 各指標は「足し合わせられる部分集計 (_partial_*)」と「比率などの仕上げ (_finish_*)」に
+# 分けてある。全件の DataFrame なら partial → finish、チャンク読み込みなら
+# チャンクごとの partial を足し込んでから finish する。
+
+def _partial_gir(df):
+    return (
+        df.groupby(["club", "dist_range"], observed=True)["is_green_on"]
+        .agg(shots="size", gir="sum")
+        .reset_index()
+    )
+
+
+def _finish_gir(out):
+    out["gir_pct"] = (out["gir"] / out["shots"] * 100).round(1)
+    return out
+
+
+def _partial_proximity(df):
+    on = df[df["is_green_on"] & (df["proximity"] != "NONE") & df["proximity"].notna()]
+    return (
+        on.groupby(["club", "dist_range", "proximity"], observed=True)
+        .size()
+        .rename("n")
+        .reset_index()
+    )
+
+
+def _finish_proximity(part):
+    counts = part.pivot_table(
+        index=["club", "dist_range"], columns="proximity", values="n",
+        aggfunc="sum", fill_value=0, observed=True,
+    )
+    known = [p for p in CATEGORY_ORDER["proximity"] if p in counts.columns and p != "NONE"]
+    counts = counts[known + [c for c in counts.columns if c not in known and c != "NONE"]]
+    counts.columns = list(counts.columns)
+    total = counts.sum(axis=1)
+    share = counts.div(total.where(total > 0), axis=0).mul(100).round(1)
+    share.insert(0, "shots", total)
+    return share.reset_index()
+
+
+def _partial_putts(df):
+    putts = df["putts"].astype("float64")
+    has_putts = putts.notna()
+    frame = pd.DataFrame({
+        "gir": df["is_green_on"],
+        "holes": 1,
+        "putts_sum": putts.fillna(0),
+        "putts_n": has_putts.astype("int64"),
+        "one_putt": ((putts <= 1) & has_putts).astype("int64"),
+        "three_putt": ((putts >= 3) & has_putts).astype("int64"),
+    })
+    return frame.groupby("gir").sum().reset_index()
+
+
+def _finish_putts(out):
+    n = out["putts_n"].where(out["putts_n"] > 0)
+    return pd.DataFrame({
+        "gir": out["gir"],
+        "holes": out["holes"],
+        "avg_putts": (out["putts_sum"] / n).round(2),
+        "one_putt_pct": (out["one_putt"] / n * 100).round(2),
+        "three_putt_pct": (out["three_putt"] / n * 100).round(2),
+    })
+
+
+SCRAMBLE_BY = ("lie_type", "miss_dir")
+
+
+def _partial_scrambling(df, by=SCRAMBLE_BY):
+    miss = df[~df["is_green_on"]]
+    saved = (miss["hole_score"] <= miss["par"]).fillna(False)
+    return (
+        saved.groupby([miss[c] for c in by], observed=True)
+        .agg(chances="size", saves="sum")
+        .reset_index()
+    )
+
+
+def _finish_scrambling(out):
+    out["scramble_pct"] = (out["saves"] / out["chances"] * 100).round(1)
+    return out
+
+
+# 同じラウンドを複数人で回るので、ラウンド × プレーヤーで分ける
+PENALTY_KEYS = ["round_id", "player_id", "round_date", "course_name"]
+
+
+def _partial_penalty(df):
+    strokes = _cat_lookup(df["penalty"], PENALTY_STROKES)
+    over_par = (df["hole_score"] - df["par"]).astype("float64").fillna(0).to_numpy()
+    has_pen = strokes > 0
+    frame = pd.DataFrame({
+        "round_id": df["round_id"],
+        "player_id": df["player_id"],
+        "round_date": df["round_date"],
+        "course_name": df["course_name"].astype("object"),
+        "penalty_strokes": strokes,
+        "penalty_holes": has_pen.astype("int64"),
+        "over_par_pen": np.where(has_pen, over_par, 0.0),
+        "over_par_clean": np.where(has_pen, 0.0, over_par),
+        "clean_holes": (~has_pen).astype("int64"),
+    })
+    return frame.groupby(PENALTY_KEYS, dropna=False).sum().reset_index()
+
+
+def _finish_penalty(out):
+    # ペナルティのあったホールが、同じラウンドの他のホールより何打多く叩いたか
+    clean_avg = out["over_par_clean"] / out["clean_holes"].where(out["clean_holes"] > 0)
+    out["strokes_lost"] = (out["over_par_pen"] - out["penalty_holes"] * clean_avg.fillna(0)).round(2)
+    out = out.drop(columns=["over_par_clean", "clean_holes"])
+    return out.sort_values("round_date", ascending=False).reset_index(drop=True)
+
+
+# 名前: (部分集計, 仕上げ, 部分集計を足し込むときのキー)
+METRICS = {
+    "gir": (_partial_gir, _finish_gir, ["club", "dist_range"]),
+    "proximity": (_partial_proximity, _finish_proximity, ["club", "dist_range", "proximity"]),
+    "putts": (_partial_putts, _finish_putts, ["gir"]),
+    "scrambling": (_partial_scrambling, _finish_scrambling, list(SCRAMBLE_BY)),
+    "penalty": (_partial_penalty, _finish_penalty, PENALTY_KEYS),
+}
+
+
+def gir_by_club_dist(df):
+    """クラブ × 残り距離ごとのパーオン率"""
+    return _finish_gir(_partial_gir(df))
+
+
+def proximity_by_club_dist(df):
+    """パーオンしたときのピンまでの距離の分布 (行ごとに割合)"""
+    return _finish_proximity(_partial_proximity(df))
+
+
+def putts_by_gir(df):
+    """パーオン時 / 非パーオン時のパット数"""
+    return _finish_putts(_partial_putts(df))
+
+
+def scrambling(df):
+    """パーオンしなかったホールでパー以内に収めた割合"""
+    return _finish_scrambling(_partial_scrambling(df))
+
+
+def penalty_cost_by_round(df):
+    """ラウンドごとのペナルティ打数と、ペナルティで失ったスコアの推定"""
+    return _finish_penalty(_partial_penalty(df))
+
+
+def summarize(df, player_id=None):
+    """分析画面で使う指標をまとめて返す (player_id を渡すとそのプレーヤーだけ)"""
+    df = for_player(df, player_id)
+    return {name: finish(partial(df)) for name, (partial, finish, _) in METRICS.items()}
+
+
+def summarize_chunks(chunks, player_id=None):
+    """iter_shots のチャンクを1つずつ部分集計に畳み込み、summarize と同じ結果を返す
+
+    保持するのは部分集計 (グループ数ぶんの行) だけなので、履歴全体の行数に依存しない。
+    """
+    acc = {name: None for name in METRICS}
+    for chunk in chunks:
+        chunk = for_player(chunk, player_id)
+        for name, (partial, _, keys) in METRICS.items():
+            part = partial(chunk)
+            if acc[name] is not None:
+                # チャンクごとにカテゴリの集合が違いうるので、キーは素の値に戻してから合算する
+                part = pd.concat([acc[name], part], ignore_index=True)
+                part = part.astype({k: "object" for k in keys if isinstance(part[k].dtype, pd.CategoricalDtype)})
+                part = part.groupby(keys, dropna=False, sort=False).sum().reset_index()
+            acc[name] = part
+    empty = prepare(pd.DataFrame(columns=SHOT_COLUMNS))
+    return {
+        name: finish(acc[name] if acc[name] is not None else partial(empty))
+        for name, (partial, finish, _) in METRICS.items()
+    }
@@ -0,0 +1,360 @@
+"""ベンチマーク (合成ラウンドで主要な処理の時間を測り、JSON に書き出す)
+
+    python bench.py --throwaway                       # 使い捨ての PostgreSQL を立てて 1k / 100k / 1M 行で測る
+    python bench.py --rows 1000 100000 --reset-db     # DB_* の DB で測る (中身はすべて消える)
+    python bench.py --no-db --out results.json        # DB を使わない処理だけ測る
+    python bench.py --throwaway --compare baseline.json   # 前回の結果と比べて遅くなったものを表示する
+
+--throwaway は PATH にある initdb / pg_ctl で一時ディレクトリにクラスタを作り、終わったら消す。
+接続先は環境変数 DB_* で渡すので、secrets.toml に DB_* があるとそちらが優先される点に注意。
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import synth
+from constants import LOG_COLUMNS
+
+# ==========================================
+# ⏱ ベンチマーク
+# ==========================================
+# 1件ごとの所要時間を集めて p50 / p95 / 平均を出す。各サイズの前に表を空にして
+# 合成ラウンドを COPY で入れ直すので、同じ引数・同じ seed なら同じデータで測れる。
+# 読み取りはクエリキャッシュを通さない (rounds / analytics の関数を直接呼ぶ)。
+
+DEFAULT_ROWS = (1_000, 100_000, 1_000_000)
+# rounds / players を参照する表はすべて含める (players は既定のプレーヤーを残すため消さない)
+RESET_TABLES = "approach_logs, round_summaries, rounds, approach_logs_changes, club_dist_stats"
+
+
+def _summary(name, rows, samples, n_items=None):
+    """所要時間 (秒) のリストを結果1件にまとめる"""
+    ms = np.array(samples) * 1000
+    result = {
+        "name": name,
+        "rows": rows,
+        "n": len(samples),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+    }
+    if n_items:
+        result["items_per_s"] = round(n_items * len(samples) / (ms.sum() / 1000), 1)
+    return result
+
+
+def measure(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+# --- 使い捨ての PostgreSQL ---
+@contextmanager
+def throwaway_postgres():
+    """一時ディレクトリに PostgreSQL を立て、DB_* 環境変数をそこに向ける"""
+    for cmd in ("initdb", "pg_ctl"):
+        if shutil.which(cmd) is None:
+            sys.exit(f"{cmd} が見つかりません (--throwaway には PostgreSQL のサーバが必要です)")
+    root = tempfile.mkdtemp(prefix="golf_bench_")
+    data = os.path.join(root, "data")
+    user = "bench"
+    port = "55432"
+    subprocess.run(["initdb", "-D", data, "-U", user, "--auth=trust", "-E", "UTF8", "--no-locale"],
+                   check=True, stdout=subprocess.DEVNULL)
+    # unix ソケットだけで待ち受ける (ほかのサーバとポートが重ならない)
+    opts = f"-k {root} -c listen_addresses='' -p {port} -c fsync=off -c synchronous_commit=off"
+    subprocess.run(["pg_ctl", "-D", data, "-o", opts, "-w", "-l", os.path.join(root, "log"), "start"],
+                   check=True, stdout=subprocess.DEVNULL)
+    os.environ.update(DB_HOST=root, DB_PORT=port, DB_USER=user, DB_NAME="postgres", DB_PASS="")
+    try:
+        yield
+    finally:
+        subprocess.run(["pg_ctl", "-D", data, "-m", "immediate", "stop"], stdout=subprocess.DEVNULL)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+# --- DB を使わない処理 ---
+def bench_in_memory(df, repeat):
+    from analytics import prepare, summarize
+
+    rows = len(df)
+    # 合成データは既定のプレーヤー (player_id = 1) のもの
+    shots = df[list(LOG_COLUMNS)].assign(round_id=pd.factorize(df["round_uid"])[0] + 1, player_id=1)
+    results = [_summary("prepare", rows, measure(lambda: prepare(shots.copy()), repeat), rows)]
+    prepared = prepare(shots.copy())
+    results.append(_summary("summarize", rows, measure(lambda: summarize(prepared), repeat), rows))
+    # 集計テーブルと同じキー・列を pandas で計算する (トリガでの加算との比較用)
+    keys = ["course_name", "club", "dist_range", "lie_type"]
+    gir = prepared["is_green_on"].astype(int)
+    prox = prepared["proximity"].astype(str)
+    flags = prepared[keys].assign(
+        shots=1,
+        gir=gir,
+        prox_u15=(prox == "UNDER_1.5").astype(int),
+        prox_u30=(prox == "UNDER_3.0").astype(int),
+        prox_u50=(prox == "UNDER_5.0").astype(int),
+        prox_o60=(prox == "OVER_6.0").astype(int),
+        putts_sum=prepared["putts"].fillna(0),
+        score_sum=prepared["hole_score"].fillna(0),
+        over_par_sum=(prepared["hole_score"] - prepared["par"]).fillna(0),
+        penalties=prepared["penalty"].astype(str).isin(["OB", "PENALTY"]).astype(int),
+    )
+    results.append(_summary(
+        "club_dist_stats_pandas", rows,
+        measure(lambda: flags.groupby(keys, observed=True).sum(), repeat), rows,
+    ))
+    return results
+
+
+# --- DB を使う処理 ---
+def reset_db():
+    from db import get_connection
+    from migrations import ensure_schema
+
+    error = ensure_schema(retry_interval=0)
+    if error:
+        sys.exit(f"DB に接続できません: {error}")
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"TRUNCATE {RESET_TABLES} RESTART IDENTITY")
+        conn.commit()
+
+
+def sample_round_uids(n, seed):
+    from db import get_connection
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT setseed(%s)", (seed / 1000,))
+            cur.execute("SELECT round_uid::text FROM rounds ORDER BY random() LIMIT %s", (n,))
+            uids = [r[0] for r in cur.fetchall()]
+        conn.rollback()
+    return uids
+
+
+def bench_load(df, rows):
+    from bulk import import_frame, normalize
+
+    t0 = time.perf_counter()
+    normalized, invalid = normalize(df[list(LOG_COLUMNS)])
+    t1 = time.perf_counter()
+    inserted, _, _ = import_frame(normalized)
+    t2 = time.perf_counter()
+    if len(invalid) or inserted != len(df):
+        sys.exit(f"合成データの取り込みに失敗しました (不正 {len(invalid)} 行 / 取り込み {inserted} 行)")
+    return [
+        _summary("bulk_normalize", rows, [t1 - t0], rows),
+        _summary("bulk_copy_import", rows, [t2 - t1], rows),
+    ]
+
+
+def bench_hole_insert(rows, repeat, workdir):
+    """登録ボタン → ジャーナル追記 → フラッシュ (1ホールずつ / ハーフ9ホールまとめて)"""
+    from journal import Journal
+
+    journal = Journal(os.path.join(workdir, f"journal_{rows}.db"))
+    row = {c: v for c, v in synth.generate(18, seed=rows)[list(LOG_COLUMNS)].iloc[0].items()}
+    row = {k: v.item() if hasattr(v, "item") else v for k, v in row.items()}
+
+    def new_round():
+        uid = str(uuid.uuid4())
+        return {"round_uid": uid, "round_date": row["round_date"], "course_name": row["course_name"],
+                "green_type": row["green_type"], "start_side": "OUT (1→18)", "status": "playing"}
+
+    single = []
+    for i in range(repeat):
+        info = new_round()
+        hole = dict(row, hole_no=i % 18 + 1)
+        t0 = time.perf_counter()
+        journal.append(hole, info, str(uuid.uuid4()))
+        journal.flush_once()
+        single.append(time.perf_counter() - t0)
+
+    half = []
+    for _ in range(max(1, repeat // 9)):
+        info = new_round()
+        t0 = time.perf_counter()
+        for h in range(1, 10):
+            journal.append(dict(row, hole_no=h), info, str(uuid.uuid4()), hold=True)
+        journal.release(info["round_uid"])
+        journal.flush_all()
+        half.append(time.perf_counter() - t0)
+    return [
+        _summary("hole_insert", rows, single, 1),
+        _summary("hole_insert_half_batch", rows, half, 9),
+    ]
+
+
+def bench_reads(rows, repeat, seed):
+    from db import get_connection
+    from rounds import list_rounds, round_history, delete_latest
+
+    uids = sample_round_uids(repeat, seed)
+    results = []
+    with get_connection() as conn:
+        history = []
+        for uid in uids:
+            t0 = time.perf_counter()
+            round_history(conn, uid)
+            history.append(time.perf_counter() - t0)
+        results.append(_summary("round_history", rows, history))
+        results.append(_summary("list_rounds", rows, measure(lambda: list_rounds(conn), repeat)))
+
+        # 削除は測ったら巻き戻す (次の試行・次のベンチのデータを変えない)
+        deletes = []
+        for uid in uids:
+            t0 = time.perf_counter()
+            delete_latest(conn, uid)
+            deletes.append(time.perf_counter() - t0)
+            conn.rollback()
+        results.append(_summary("delete_latest", rows, deletes))
+    return results
+
+
+def bench_analytics(rows, repeat):
+    from aggregates import load_club_dist_stats, club_dist_table, migration_sql
+    from analytics import iter_shots, summarize_chunks
+    from db import get_connection
+
+    results = []
+    with get_connection() as conn:
+        def full_history():
+            summarize_chunks(iter_shots(conn))
+            conn.rollback()
+
+        results.append(_summary("full_history_analytics", rows, measure(full_history, repeat), rows))
+        results.append(_summary(
+            "club_dist_table", rows,
+            measure(lambda: club_dist_table(load_club_dist_stats(conn)), repeat),
+        ))
+        # 集計テーブルを全件から作り直す (マイグレーションと同じ SQL)。測ったら巻き戻す
+        sql = migration_sql()
+
+        def rebuild():
+            with conn.cursor() as cur:
+                cur.execute(sql)
+            conn.rollback()
+
+        results.append(_summary("club_dist_stats_rebuild", rows, measure(rebuild, max(1, repeat // 10)), rows))
+    return results
+
+
+# --- 結果 ---
+def meta():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+    }
+
+
+def compare(results, baseline_path, threshold):
+    """baseline と比べて p50 が threshold 以上遅くなった項目を返す"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["name"], r["rows"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        base = baseline.get((r["name"], r["rows"]))
+        if base and base["p50_ms"] > 0 and r["p50_ms"] > base["p50_ms"] * (1 + threshold):
+            regressions.append((r, base))
+    return regressions
+
+
+def print_table(results):
+    print(f"{'name':<28}{'rows':>10}{'n':>6}{'p50 ms':>12}{'p95 ms':>12}{'items/s':>14}")
+    for r in results:
+        rate = f"{r['items_per_s']:,.0f}" if "items_per_s" in r else ""
+        print(f"{r['name']:<28}{r['rows']:>10,}{r['n']:>6}{r['p50_ms']:>12.2f}{r['p95_ms']:>12.2f}{rate:>14}")
+
+
+def run(args):
+    results = []
+    with tempfile.TemporaryDirectory(prefix="golf_bench_") as workdir:
+        # フラッシュが書く手元のファイル (ジャーナル・推移・写し・カタログ・遅いクエリ) も一時ディレクトリに向け、
+        # 普段使いのものに合成データを混ぜない (pagebench.py と同じ)
+        os.environ.update({
+            "JOURNAL_PATH": os.path.join(workdir, "journal.db"),
+            "TRENDS_PATH": os.path.join(workdir, "trends.json"),
+            "MIRROR_DIR": os.path.join(workdir, "mirror"),
+            "CATALOG_SNAPSHOT": os.path.join(workdir, "catalog.json"),
+            "SLOW_QUERY_LOG": os.path.join(workdir, "slow_queries.jsonl"),
+        })
+        for rows in args.rows:
+            t0 = time.perf_counter()
+            df = synth.generate(rows, seed=args.seed)
+            results.append(_summary("synth_generate", len(df), [time.perf_counter() - t0], len(df)))
+            results += bench_in_memory(df, args.repeat)
+            if args.no_db:
+                continue
+            reset_db()
+            results += bench_load(df, len(df))
+            results += bench_reads(len(df), args.repeat, args.seed)
+            results += bench_analytics(len(df), args.repeat)
+            results += bench_hole_insert(len(df), args.repeat, workdir)
+            print(f"{len(df):,} 行: 完了", file=sys.stderr)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="合成ラウンドでのベンチマーク")
+    parser.add_argument("--rows", type=int, nargs="+", default=list(DEFAULT_ROWS), help="ショット行数 (複数可)")
+    parser.add_argument("--repeat", type=int, default=30, help="1項目あたりの試行回数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="結果を書き出す JSON のパス")
+    parser.add_argument("--compare", help="比較する前回の結果 (JSON)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="遅くなったとみなす p50 の増加率")
+    db = parser.add_mutually_exclusive_group()
+    db.add_argument("--throwaway", action="store_true", help="使い捨ての PostgreSQL を立てて測る")
+    db.add_argument("--reset-db", action="store_true", help="DB_* の DB を空にして測る (中身はすべて消える)")
+    db.add_argument("--no-db", action="store_true", help="DB を使わない処理だけ測る")
+    args = parser.parse_args(argv)
+    if not (args.throwaway or args.reset_db or args.no_db):
+        parser.error("--throwaway / --reset-db / --no-db のどれかを指定してください")
+
+    if args.throwaway:
+        with throwaway_postgres():
+            results = run(args)
+    else:
+        results = run(args)
+
+    print_table(results)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta(), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"→ {args.out}")
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for r, base in regressions:
+            print(f"⚠️ {r['name']} ({r['rows']:,} 行): p50 {base['p50_ms']:.2f} → {r['p50_ms']:.2f} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
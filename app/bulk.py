@@ -0,0 +1,339 @@
+"""approach_logs の一括インポート / エクスポート (COPY 使用)
+
+    python bulk.py import scores.csv            # CSV / Parquet を取り込む
+    python bulk.py import scores.parquet --dry-run
+    python bulk.py export all.csv               # 全件を書き出す
+    python bulk.py export all.parquet
+
+取り込むファイルの列は LOG_COLUMNS と同じ名前。値は画面の表示値
+(例: "120~", "手前", "ラフ弱", "3m以内", "OB") でもコード値でもよい。
+par が空ならコースカタログ (コース・グリーン・ホール) のパー、miss_dir / lie_type / proximity / penalty が空なら NONE を使う。
+同じ日・コース・グリーンで複数のラウンドを回ったときは、任意の round_key 列 (例: "午前" / "午後") でラウンドを分ける。
+同じラウンドの同じホールがファイル内に2行以上あると不正な行になる。
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from analytics import SMALL_INT_COLUMNS
+from constants import (
+    CLUB_LIST, LOG_COLUMNS,
+    DIST_MAP, DIR_MAP, LIE_MAP, PROXIMITY_MAP, PENALTY_MAP,
+)
+from courses import CourseCatalog
+from db import get_connection
+
+# ==========================================
+# 📦 一括取り込み・書き出し
+# ==========================================
+# 1行ずつの INSERT ではなく、COPY で一時テーブルに流し込んでから
+# 1文の INSERT ... SELECT で approach_logs に移す。集計テーブルのトリガも1回で済む。
+
+CODE_MAPS = {
+    "dist_range": DIST_MAP,
+    "miss_dir": DIR_MAP,
+    "lie_type": LIE_MAP,
+    "proximity": PROXIMITY_MAP,
+    "penalty": PENALTY_MAP,
+}
+# 空欄なら NONE とみなす列
+NONE_DEFAULT = ("miss_dir", "lie_type", "proximity", "penalty")
+
+GREEN_ON_MAP = {
+    "TRUE": True, "T": True, "1": True, "ON": True, "パーオン成功": True,
+    "FALSE": False, "F": False, "0": False, "OFF": False, "失敗": False,
+}
+
+# 書き出す列
+EXPORT_COLUMNS = ("id", "round_id") + LOG_COLUMNS
+
+# 既存データの取り込み (マイグレーション v4) と同じく、(日付, コース, グリーン) を1ラウンドとする。
+# round_key があればそれも足す (concat_ws は NULL を飛ばすので、round_key が空なら v4 と同じ uid になる)
+ROUND_UID_SQL = "md5(concat_ws('|', {t}.round_date, {t}.course_name, {t}.green_type, {t}.round_key))::uuid"
+ROUND_KEY_COLUMNS = ("round_date", "course_name", "green_type", "round_key")
+# 取り込む行は既定のプレーヤーのもの (approach_logs.player_id の既定値)
+IMPORT_PLAYER_ID = 1
+
+
+class InvalidRowsError(ValueError):
+    """取り込みデータに不正な行がある"""
+
+
+def _rate(rows, seconds):
+    return f"{rows:,} 行 / {seconds:.2f}s ({rows / seconds:,.0f} 行/s)" if seconds > 0 else f"{rows:,} 行"
+
+
+def read_file(path):
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, dtype=str, keep_default_na=True)
+
+
+def normalize(raw, catalog=None):
+    """表示値・コード値の混在を正規化する。(正規化済み DataFrame, 不正行の DataFrame) を返す
+
+    すべて列単位の map / isin / to_numeric で処理する (行ループなし)。
+    catalog を省略すると組み込みのカタログ (掛川GH のみ) でパーを補う。
+    """
+    catalog = catalog or CourseCatalog()
+    out = pd.DataFrame(index=raw.index)
+    errors = {}
+
+    def col(name):
+        """前後の空白を除いた文字列列 (空欄は欠損)"""
+        if name not in raw:
+            return pd.Series(pd.NA, index=raw.index, dtype="string")
+        s = raw[name].astype("string").str.strip()
+        return s.mask(s == "")
+
+    def flag(mask, reason):
+        errors[reason] = mask.fillna(True).to_numpy(dtype=bool)
+
+    # 日付・コース
+    dates = pd.to_datetime(col("round_date"), errors="coerce")
+    flag(dates.isna(), "round_date")
+    out["round_date"] = dates.dt.date
+    out["course_name"] = col("course_name")
+    flag(out["course_name"].isna(), "course_name")
+
+    out["green_type"] = col("green_type").str.upper().fillna("A")
+    flag(~out["green_type"].isin(["A", "B"]), "green_type")
+
+    def integer(values, low, high, reason):
+        """low 以上 high 以下の整数だけを残す (範囲外・小数は不正。Int64 にする前に欠損にしておく)"""
+        ok = values.between(low, high) & (values % 1 == 0)
+        flag(~ok, reason)
+        return values.where(ok).astype("Int64")
+
+    # ホール番号と par (空ならカタログのパー。カタログに無いコースは不正扱い)
+    hole = pd.to_numeric(col("hole_no"), errors="coerce")
+    out["hole_no"] = integer(hole, 1, 18, "hole_no")
+    hole = out["hole_no"]
+    keys = pd.DataFrame({"course_name": out["course_name"], "green_type": out["green_type"], "hole_no": hole})
+    combos = keys.dropna().drop_duplicates()
+    combos["catalog_par"] = pd.to_numeric(pd.Series(
+        [catalog.par(c, g, int(h)) for c, g, h in combos.itertuples(index=False)],
+        index=combos.index, dtype=object,
+    ))
+    catalog_par = keys.merge(combos, how="left", on=list(keys.columns))["catalog_par"].set_axis(raw.index)
+    par = pd.to_numeric(col("par"), errors="coerce").fillna(catalog_par)
+    out["par"] = integer(par, 3, 6, "par")
+
+    # 表示値 / コード値 → コード値
+    for name, mapping in CODE_MAPS.items():
+        lookup = {**mapping, **{v: v for v in mapping.values()}}
+        s = col(name)
+        if name in NONE_DEFAULT:
+            s = s.fillna("NONE")
+        mapped = s.map(lookup)
+        flag(mapped.isna(), name)
+        out[name] = mapped
+
+    club = col("club").str.upper()
+    flag(~club.isin(CLUB_LIST), "club")
+    out["club"] = club
+
+    green_on = col("is_green_on").str.upper().map(GREEN_ON_MAP)
+    flag(green_on.isna(), "is_green_on")
+    out["is_green_on"] = green_on
+
+    # スコア ("9~" は 9 打として記録する画面と同じ扱い)
+    score = pd.to_numeric(col("hole_score").str.replace("~", "", regex=False), errors="coerce")
+    out["hole_score"] = integer(score, 1, 20, "hole_score")
+    for name in ("putts", "recovery_strokes"):
+        out[name] = integer(pd.to_numeric(col(name), errors="coerce").fillna(0), 0, 10, name)
+
+    # 同じラウンドの同じホールが2行以上あれば、どれを取り込むか決められないので全部を不正にする
+    out["round_key"] = col("round_key")
+    keys = out[list(ROUND_KEY_COLUMNS) + ["hole_no"]].astype("object")
+    dup = keys.notna().drop(columns="round_key").all(axis=1) & keys.duplicated(keep=False)
+    errors["duplicate_hole"] = dup.to_numpy(dtype=bool)
+
+    # 理由の文字列は不正な行の分だけ作る
+    bad = np.logical_or.reduce(list(errors.values()))
+    invalid = raw[bad].copy()
+    invalid["reason"] = [
+        " ".join(name for name, mask in errors.items() if mask[i]) for i in np.flatnonzero(bad)
+    ]
+    return out.loc[~bad, list(LOG_COLUMNS) + ["round_key"]], invalid
+
+
+def import_frame(df):
+    """正規化済みの DataFrame を COPY で取り込み、(取り込んだ行, 取り込み済みの行, 既存と食い違う行) の数を返す
+
+    既にある (ラウンド, プレーヤー, ホール) は上書きせずに飛ばす。飛ばした行のうち、中身が同じものは
+    再取り込み、違うものは食い違い (同じ日に回った別のラウンドに round_key が無いなど) として数える。
+    """
+    if "round_key" not in df:
+        df = df.assign(round_key=pd.NA)
+    buf = io.StringIO()
+    df[list(LOG_COLUMNS) + ["round_key"]].to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    cols = ", ".join(LOG_COLUMNS)
+    differs = " OR ".join(f"s.{c} IS DISTINCT FROM l.{c}" for c in LOG_COLUMNS)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                CREATE TEMP TABLE import_stage ON COMMIT DROP AS
+                SELECT {cols}, NULL::text AS round_key FROM approach_logs WITH NO DATA
+            """)
+            cur.copy_expert(f"COPY import_stage ({cols}, round_key) FROM STDIN WITH (FORMAT csv)", buf)
+            cur.execute(f"""
+                INSERT INTO rounds (round_uid, round_date, course_name, green_type, status)
+                SELECT DISTINCT {ROUND_UID_SQL.format(t='s')}, s.round_date, s.course_name, s.green_type, 'finished'
+                FROM import_stage s
+                ON CONFLICT (round_uid) DO NOTHING
+            """)
+            # 入れる前に、既にあるホールと比べておく
+            cur.execute(f"""
+                SELECT count(*) FILTER (WHERE NOT ({differs})),
+                       count(*) FILTER (WHERE {differs})
+                FROM import_stage s
+                JOIN rounds r ON r.round_uid = {ROUND_UID_SQL.format(t='s')}
+                JOIN approach_logs l ON l.round_id = r.id AND l.player_id = {IMPORT_PLAYER_ID} AND l.hole_no = s.hole_no
+            """)
+            existing, conflicts = cur.fetchone()
+            cur.execute(f"""
+                INSERT INTO approach_logs ({cols}, round_id)
+                SELECT {', '.join('s.' + c for c in LOG_COLUMNS)}, r.id
+                FROM import_stage s
+                JOIN rounds r ON r.round_uid = {ROUND_UID_SQL.format(t='s')}
+                ORDER BY s.round_date, r.id, s.hole_no
+                -- 取り込み済みのホール (同じファイルの再取り込みなど) は飛ばす
+                ON CONFLICT (round_id, player_id, hole_no) DO NOTHING
+            """)
+            inserted = cur.rowcount
+        conn.commit()
+    return inserted, existing, conflicts
+
+
+def export_csv(path, query):
+    with get_connection() as conn, open(path, "w", encoding="utf-8", newline="") as f:
+        with conn.cursor() as cur:
+            cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", f)
+            if cur.rowcount >= 0:
+                return cur.rowcount
+            cur.execute(f"SELECT count(*) FROM ({query}) q")
+            return cur.fetchone()[0]
+
+
+def _export_convert_options():
+    """書き出す列の型 (COPY の CSV は真偽値が t / f、NULL が引用符なしの空欄)
+
+    推論に任せると先頭のブロックで型が決まり、round_id が空の古い行のあとに値のある行が来ると変換エラーになる。
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    types = {c: pa.string() for c in EXPORT_COLUMNS}
+    types.update({c: pa.int16() for c in SMALL_INT_COLUMNS})
+    types.update({"id": pa.int32(), "round_id": pa.int32(), "round_date": pa.date32(), "is_green_on": pa.bool_()})
+    return pa_csv.ConvertOptions(
+        column_types=types, true_values=["t"], false_values=["f"],
+        strings_can_be_null=True, quoted_strings_can_be_null=False,
+    )
+
+
+def export_parquet(path, query, batch_rows=100_000):
+    """COPY で一時 CSV に流し、pyarrow で少しずつ Parquet に変換する (メモリはバッチ分だけ)"""
+    try:
+        import pyarrow.csv as pa_csv
+        import pyarrow.parquet as pq
+    except ImportError:
+        sys.exit("Parquet の読み書きには pyarrow が必要です (pip install pyarrow)")
+    fd, tmp = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        export_csv(tmp, query)
+        reader = pa_csv.open_csv(
+            tmp, read_options=pa_csv.ReadOptions(block_size=1 << 22), convert_options=_export_convert_options(),
+        )
+        rows = 0
+        with pq.ParquetWriter(path, reader.schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        return rows
+    finally:
+        os.remove(tmp)
+
+
+def cmd_import(args):
+    from migrations import ensure_schema
+
+    t0 = time.perf_counter()
+    raw = read_file(args.path)
+    # 新しい DB でもカタログ・取り込み先のテーブルがあるようにする
+    error = ensure_schema(retry_interval=0)
+    if error:
+        raise SystemExit(f"DB に接続できません: {error}")
+    catalog = CourseCatalog()
+    with get_connection() as conn:
+        catalog.load(conn)
+    t1 = time.perf_counter()
+    df, invalid = normalize(raw, catalog)
+    t2 = time.perf_counter()
+    print(f"読み込み: {_rate(len(raw), t1 - t0)}")
+    print(f"検証・変換: {_rate(len(raw), t2 - t1)}")
+    if len(invalid):
+        print(f"⚠️ 不正な行: {len(invalid):,} 行")
+        print(invalid.head(10).to_string())
+        if invalid["reason"].str.contains("duplicate_hole").any():
+            print("duplicate_hole: 同じラウンドの同じホールが複数行あります。"
+                  "同じ日・コースで別のラウンドを回ったときは round_key 列で分けてください")
+        if args.invalid_out:
+            invalid.to_csv(args.invalid_out, index=False)
+            print(f"不正な行を {args.invalid_out} に書き出しました")
+        if not args.skip_invalid:
+            raise InvalidRowsError("不正な行があるため取り込みを中止しました (--skip-invalid で正常な行だけ取り込み)")
+    if args.dry_run:
+        print(f"dry-run: {len(df):,} 行を取り込み可能")
+        return
+    inserted, existing, conflicts = import_frame(df)
+    t3 = time.perf_counter()
+    print(f"COPY 取り込み: {_rate(inserted, t3 - t2)}")
+    if existing:
+        print(f"取り込み済み (同じ内容) のため飛ばした行: {existing:,} 行")
+    if conflicts:
+        print(f"⚠️ 既にあるホールと内容が違うため飛ばした行: {conflicts:,} 行 "
+              "(同じ日・コースの別のラウンドなら round_key 列で分けて取り込み直してください)")
+    print(f"合計: {_rate(inserted, t3 - t0)}")
+
+
+def cmd_export(args):
+    query = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM approach_logs ORDER BY id"
+    t0 = time.perf_counter()
+    if args.path.endswith(".parquet"):
+        rows = export_parquet(args.path, query)
+    else:
+        rows = export_csv(args.path, query)
+    print(f"書き出し: {_rate(rows, time.perf_counter() - t0)} → {args.path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="approach_logs の一括インポート / エクスポート")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_imp = sub.add_parser("import", help="CSV / Parquet を取り込む")
+    p_imp.add_argument("path")
+    p_imp.add_argument("--dry-run", action="store_true", help="検証だけして取り込まない")
+    p_imp.add_argument("--skip-invalid", action="store_true", help="不正な行を飛ばして取り込む")
+    p_imp.add_argument("--invalid-out", help="不正な行を書き出す CSV のパス")
+    p_imp.set_defaults(func=cmd_import)
+    p_exp = sub.add_parser("export", help="CSV / Parquet に書き出す")
+    p_exp.add_argument("path")
+    p_exp.set_defaults(func=cmd_export)
+    args = parser.parse_args(argv)
+    try:
+        args.func(args)
+    except InvalidRowsError as e:
+        sys.exit(str(e))
+
+
+if __name__ == "__main__":
+    main()
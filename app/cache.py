@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+
+from config import get_int, get_float
+
+# ==========================================
+# 🗃 読み取りクエリのキャッシュ
+# ==========================================
+# キー = (クエリ名, パラメータ, スコープ)。スコープは round_uid (ラウンド単位の
+# 画面) か None (全体にまたがる画面)。書き込みのたびに該当ラウンドと全体の
+# 書き込みバージョンを上げ、保存時のバージョンと違うエントリは使わない。
+# 書き込みはすべてこのプロセス (フラッシャ / 削除) から行うので、
+# どのセッションの書き込みでも次の表示は必ず最新になる。
+
+ALL = None  # 全体スコープ
+
+
+class QueryCache:
+    def __init__(self, max_entries=256, ttl=600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (version, stored_at, value)
+        self._versions = {}
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0, "bumps": 0}
+
+    def version(self, scope):
+        with self._lock:
+            return self._version(scope)
+
+    def _version(self, scope):
+        return self._versions.get(scope, 0)
+
+    def bump(self, scope=ALL):
+        """書き込み (コミット後) に呼ぶ。ラウンドを指定すると全体も上がる (他ラウンドはそのまま)"""
+        with self._lock:
+            if scope is not ALL:
+                self._versions[scope] = self._versions.get(scope, 0) + 1
+            self._versions[ALL] = self._versions.get(ALL, 0) + 1
+            self._stats["bumps"] += 1
+
+    def get_or_load(self, name, params, loader, scope=ALL):
+        key = (name, params, scope)
+        now = time.monotonic()
+        with self._lock:
+            version = self._version(scope)
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == version and now - entry[1] < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry[2]
+                del self._entries[key]
+                self._stats["stale"] += 1
+            self._stats["misses"] += 1
+        # 読み込み中に書き込みがあれば version がずれるので、次回は読み直しになる
+        value = loader()
+        with self._lock:
+            self._entries[key] = (version, now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s.update(entries=len(self._entries), max_entries=self.max_entries, ttl=self.ttl)
+        return s
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """プロセス共通のキャッシュを返す (初回のみ生成)"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = QueryCache(
+                    max_entries=get_int("CACHE_MAX_ENTRIES", 256),
+                    ttl=get_float("CACHE_TTL", 600),
+                )
+    return _cache
@@ -0,0 +1,137 @@
+"""ショットの属性の列挙型 (クラブ・距離帯・ミスの方向・ライ・寄せ・ペナルティ・グリーン)
+
+    python categories.py measure    # 表のサイズと DataFrame のメモリを、TEXT / object 列の場合と比べる
+"""
+import argparse
+import json
+
+from constants import SHOT_CATEGORIES
+
+# ==========================================
+# 🏷 列挙型 (ENUM)
+# ==========================================
+# 属性は取りうる値が決まっているので、approach_logs では TEXT ではなく列挙型で持つ (1値 4 バイト固定)。
+# 型と値の並びは constants.py の CLUB_LIST / DIST_MAP などから作る (並び = 表示順)。
+# 読み書きは今までどおり文字列 ('7I' など) で行えるので、SQL・トリガ・取り込みはそのまま動く。
+# 定数に無い値を書くとエラーになる。値を増やすときは定数に足し、マイグレーションを追加して
+# ALTER TYPE shot_club ADD VALUE IF NOT EXISTS '...' を流すこと (既存の値の順番は変えない)。
+
+
+def enum_type(column):
+    return f"shot_{column}"
+
+
+def _literal(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _create_type_sql(column, known):
+    """列挙型を作る。既存の行にある定数に無い値 (古い版の値など) も末尾に足して落とさない"""
+    array = f"ARRAY[{', '.join(_literal(v) for v in known)}]::text[]"
+    return f"""
+        DO $$
+        DECLARE labels text;
+        BEGIN
+            IF to_regtype('{enum_type(column)}') IS NULL THEN
+                SELECT string_agg(quote_literal(v), ', ' ORDER BY ord, v) INTO labels FROM (
+                    SELECT v, ord FROM unnest({array}) WITH ORDINALITY AS k (v, ord)
+                    UNION ALL
+                    SELECT DISTINCT {column}, NULL::bigint FROM approach_logs
+                    WHERE {column} <> '' AND {column} <> ALL ({array})
+                ) s;
+                EXECUTE 'CREATE TYPE {enum_type(column)} AS ENUM (' || labels || ')';
+            END IF;
+        END
+        $$;
+    """
+
+
+def migration_sql():
+    """列挙型を作り、approach_logs の属性の列をそれに変える SQL (空文字は NULL にする)
+
+    列の型の変更は1つの ALTER TABLE にまとめ、表の書き換えを1回で済ませる。
+    """
+    parts = [_create_type_sql(column, known) for column, known in SHOT_CATEGORIES.items()]
+    alters = ",\n".join(
+        f"            ALTER COLUMN {c} TYPE {enum_type(c)} USING NULLIF({c}, '')::{enum_type(c)}"
+        for c in SHOT_CATEGORIES
+    )
+    parts.append(f"ALTER TABLE approach_logs\n{alters};")
+    return "\n".join(parts)
+
+
+# --- 測定 ---
+def table_sizes(conn):
+    """approach_logs の行を列挙型のまま / TEXT にして書き直した一時表のサイズ (表とクラブ × 距離の索引)"""
+    as_text = ", ".join(f"{c}::text AS {c}" if c in SHOT_CATEGORIES else c for c in _columns(conn))
+    sizes = {}
+    with conn.cursor() as cur:
+        for name, select in (("enum", "*"), ("text", as_text)):
+            cur.execute(f"CREATE TEMP TABLE size_{name} AS SELECT {select} FROM approach_logs")
+            cur.execute(f"CREATE INDEX ON size_{name} (club, dist_range)")
+            cur.execute(f"""
+                SELECT count(*), pg_relation_size('size_{name}'), pg_indexes_size('size_{name}')
+                FROM size_{name}
+            """)
+            rows, table, index = cur.fetchone()
+            sizes[name] = {"rows": rows, "table_bytes": table, "index_bytes": index}
+    conn.rollback()
+    return sizes
+
+
+def _columns(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = 'approach_logs' ORDER BY ordinal_position
+        """)
+        return [r[0] for r in cur.fetchall()]
+
+
+def frame_sizes(conn):
+    """全ショットを読んだ DataFrame のメモリ (読んだまま = object 列 / prepare 後 = カテゴリ・小さい整数)"""
+    from analytics import prepare
+    from queries import LOAD_SHOTS, fetch_frame
+
+    raw = fetch_frame(conn, LOAD_SHOTS)
+    conn.rollback()
+    typed = prepare(raw)
+    return {
+        "rows": len(raw),
+        "object_bytes": int(raw.memory_usage(deep=True).sum()),
+        "typed_bytes": int(typed.memory_usage(deep=True).sum()),
+        "dtypes": {c: str(t) for c, t in typed.dtypes.items()},
+    }
+
+
+def measure(conn):
+    sizes = table_sizes(conn)
+    frame = frame_sizes(conn)
+    ratio = lambda a, b: round(1 - a / b, 3) if b else None
+    return {
+        "table": sizes,
+        "table_saving": ratio(sizes["enum"]["table_bytes"], sizes["text"]["table_bytes"]),
+        "index_saving": ratio(sizes["enum"]["index_bytes"], sizes["text"]["index_bytes"]),
+        "frame": frame,
+        "frame_saving": ratio(frame["typed_bytes"], frame["object_bytes"]),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ショットの属性の列挙型")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("measure", help="表のサイズと DataFrame のメモリを測る (DB_* の PostgreSQL)")
+    parser.parse_args(argv)
+
+    from db import get_connection
+    from migrations import ensure_schema
+
+    error = ensure_schema(retry_interval=0)
+    if error:
+        raise SystemExit(f"DB に接続できません: {error}")
+    with get_connection() as conn:
+        print(json.dumps(measure(conn), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import os
+import streamlit as st
+
+
+def _secrets():
+    """secrets.toml が無い環境 (ローカル/CLI) では空として扱う"""
+    try:
+        return st.secrets.to_dict()
+    except Exception:
+        return {}
+
+
+def get_secret(key, default_value):
+    # 1. Secrets[env] → 2. Secrets直下 → 3. 環境変数 の順に探す
+    secrets = _secrets()
+    if key in secrets.get("env", {}):
+        return secrets["env"][key]
+    if key in secrets:
+        return secrets[key]
+    return os.environ.get(key, default_value)
+
+
+def get_int(key, default_value):
+    return int(get_secret(key, default_value))
+
+
+def get_float(key, default_value):
+    return float(get_secret(key, default_value))
+
+
+def get_bool(key, default_value=False):
+    value = get_secret(key, default_value)
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+def storage_backend():
+    """STORAGE_BACKEND (postgres / sqlite) を小文字で返す。storage.py を読み込まずに判定したい画面用"""
+    return str(get_secret("STORAGE_BACKEND", "postgres")).strip().lower()
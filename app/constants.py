@@ -0,0 +1,53 @@
+# ==========================================
+# ⚙️ 基本設定
+# ==========================================
+PAR_DATA = {
+    1: 4, 2: 3, 3: 4, 4: 4, 5: 4, 6: 5, 7: 3, 8: 5, 9: 4,
+    10: 5, 11: 4, 12: 3, 13: 4, 14: 4, 15: 4, 16: 3, 17: 4, 18: 5
+}
+CLUB_LIST = ["DR", "5W", "7W", "5U", "6U", "6I", "7I", "8I", "9I", "PW", "50", "56", "58", "PT"]
+DIST_LIST_DISP = ["~100", "100~", "120~", "140~", "160~", "180~"]
+
+# 変換マップ
+DIST_MAP = {"~100": "under_100", "100~": "100-120", "120~": "120-140", "140~": "140-160", "160~": "160-180", "180~": "over_180"}
+DIR_MAP = {"手前": "SHORT", "奥": "OVER", "右": "RIGHT", "左": "LEFT", "NONE": "NONE"}
+LIE_MAP = {"フェアウェイ": "FAIRWAY", "ラフ弱": "ROUGH_LIGHT", "ラフ強": "ROUGH_DEEP", "バンカー": "BUNKER", "NONE": "NONE"}
+
+# ★変更：距離感の定義をユーザー要望に合わせて更新
+PROXIMITY_MAP = {
+    "1.5m以内": "UNDER_1.5", 
+    "3m以内": "UNDER_3.0", 
+    "5m以内": "UNDER_5.0", 
+    "6m以上": "OVER_6.0", 
+    "NONE": "NONE"
+}
+PENALTY_MAP = {"なし": "NONE", "OB": "OB", "1ペナ(池など)": "PENALTY"}
+
+# 取りうる値が決まっている属性の列と、その値 (並び = 表示順)。
+# PostgreSQL では列挙型 (categories.py)、分析ではカテゴリ型 (analytics.prepare) になる
+SHOT_CATEGORIES = {
+    "club": CLUB_LIST,
+    "dist_range": list(DIST_MAP.values()),
+    "miss_dir": list(DIR_MAP.values()),
+    "lie_type": list(LIE_MAP.values()),
+    "proximity": list(PROXIMITY_MAP.values()),
+    "penalty": list(PENALTY_MAP.values()),
+    "green_type": ["A", "B"],
+}
+
+# ペナルティの打数換算: 1打罰 (池など) は1打、OB はストローク&ディスタンスで実質2打
+PENALTY_STROKES = {"NONE": 0, "OB": 2, "PENALTY": 1}
+
+# approach_logs に書き込む列 (id / round_id を除く)
+LOG_COLUMNS = (
+    "round_date", "course_name", "hole_no", "par", "dist_range", "club", "is_green_on",
+    "miss_dir", "lie_type", "recovery_strokes", "hole_score", "green_type", "putts",
+    "proximity", "penalty",
+)
+
+# 分析で読み込む列 (approach_logs の id / round_id / player_id を含む)
+SHOT_COLUMNS = (
+    "id", "round_id", "player_id", "round_date", "course_name", "hole_no", "par", "dist_range", "club",
+    "is_green_on", "miss_dir", "lie_type", "recovery_strokes", "hole_score", "green_type",
+    "putts", "proximity", "penalty",
+)
@@ -0,0 +1,307 @@
+"""コースカタログ (コース・ホール・パー・ティー別ヤーデージ)
+
+    python courses.py import courses.csv    # カタログを取り込む (同じコース名は置き換え)
+    python courses.py list
+
+CSV の列: course_name, green_type (A/B), hole_no, par, 以降は任意で yards_<ティー名>
+(例: yards_back, yards_regular, yards_ladies)
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import unicodedata
+
+from constants import PAR_DATA
+from config import get_secret, get_float
+
+# ==========================================
+# 🗺 コースカタログ
+# ==========================================
+# DB の courses / course_holes をプロセスで一度だけ読み、(コース, グリーン) → 18ホール分の
+# パーの索引にしておく。ホール画面の描画は索引を引くだけで DB には行かない。
+# 一定間隔ごとに更新の有無 (courses.updated_at) をバックグラウンドで確認して読み直す。
+# 読めなかったとき (圏外など) は前回保存した写し、それも無ければ組み込みの掛川GH を使う。
+
+DEFAULT_COURSE = "掛川GH"
+
+
+def normalize_name(name):
+    """検索・照合用にコース名を正規化する (全角半角・大文字小文字・空白の違いを無視)"""
+    return "".join(unicodedata.normalize("NFKC", name or "").casefold().split())
+
+
+def default_snapshot_path():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog_cache.json")
+
+
+def builtin_catalog():
+    holes = {
+        "A": {str(h): {"par": p, "yards": {}} for h, p in PAR_DATA.items()},
+        "B": {str(h): {"par": p, "yards": {}} for h, p in PAR_DATA.items()},
+    }
+    return {"version": None, "courses": {DEFAULT_COURSE: holes}}
+
+
+class CourseCatalog:
+    def __init__(self, snapshot_path=None, refresh_interval=300.0):
+        self.snapshot_path = snapshot_path
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._checked_at = 0.0
+        self._last_error = None
+        self._set(self._load_snapshot() or builtin_catalog())
+
+    def _set(self, data):
+        # 読み取り側はロックなしで参照するので、索引は丸ごと作ってから差し替える
+        index = {}
+        names = {}
+        for name, greens in data["courses"].items():
+            names[normalize_name(name)] = name
+            for green, holes in greens.items():
+                pars = [None] * 19
+                for hole_no, info in holes.items():
+                    pars[int(hole_no)] = info["par"]
+                index[(name, green)] = (tuple(pars), holes)
+        self._data = data
+        self._index = index
+        self._names = names
+        self._sorted_names = sorted(data["courses"])
+
+    # --- 参照 (DB には行かない) ---
+    def names(self):
+        return self._sorted_names
+
+    def resolve(self, name):
+        """表記ゆれを吸収してカタログ上のコース名を返す。無ければ None"""
+        return self._names.get(normalize_name(name))
+
+    def search(self, query, limit=20):
+        """表記ゆれを吸収した部分一致でコース名を探す (前方一致が先)。limit=None なら全件"""
+        q = normalize_name(query)
+        if not q:
+            return self._sorted_names[:limit]
+        hits = [orig for norm, orig in self._names.items() if q in norm]
+        # 前方一致を先に
+        hits.sort(key=lambda n: (not normalize_name(n).startswith(q), n))
+        return hits[:limit]
+
+    def par(self, course_name, green_type, hole_no):
+        """カタログにあればパー、無ければ None"""
+        name = self.resolve(course_name)
+        entry = self._index.get((name, green_type)) if name else None
+        if entry is None:
+            return None
+        return entry[0][hole_no] if 0 < hole_no < len(entry[0]) else None
+
+    def yards(self, course_name, green_type, hole_no):
+        name = self.resolve(course_name)
+        entry = self._index.get((name, green_type)) if name else None
+        if entry is None:
+            return {}
+        return entry[1].get(str(hole_no), {}).get("yards", {})
+
+    # --- 読み込み ---
+    def load(self, conn):
+        """DB からカタログ全体を読み直す"""
+        with conn.cursor() as cur:
+            cur.execute("SELECT max(updated_at)::text, count(*) FROM courses")
+            version = "|".join(str(v) for v in cur.fetchone())
+            cur.execute("""
+                SELECT c.name, h.green_type, h.hole_no, h.par, h.yardages
+                FROM course_holes h JOIN courses c ON c.id = h.course_id
+                ORDER BY c.name, h.green_type, h.hole_no
+            """)
+            courses = {}
+            for name, green, hole_no, par, yards in cur.fetchall():
+                courses.setdefault(name, {}).setdefault(green, {})[str(hole_no)] = {
+                    "par": par, "yards": yards or {},
+                }
+        conn.rollback()
+        data = {"version": version, "courses": courses or builtin_catalog()["courses"]}
+        with self._lock:
+            self._set(data)
+            self._checked_at = time.monotonic()
+            self._last_error = None
+        self._save_snapshot(data)
+        return data
+
+    def is_stale(self, conn):
+        with conn.cursor() as cur:
+            cur.execute("SELECT max(updated_at)::text, count(*) FROM courses")
+            version = "|".join(str(v) for v in cur.fetchone())
+        conn.rollback()
+        return version != self._data.get("version")
+
+    def refresh_in_background(self, get_connection):
+        """前回の確認から refresh_interval 経っていれば、裏で更新を確認して読み直す"""
+        if time.monotonic() - self._checked_at < self.refresh_interval:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+            self._checked_at = time.monotonic()
+
+        def run():
+            try:
+                with get_connection() as conn:
+                    if self._data.get("version") is None or self.is_stale(conn):
+                        self.load(conn)
+            except Exception as e:
+                self._last_error = str(e)
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="catalog-refresh", daemon=True).start()
+
+    def _load_snapshot(self):
+        if not self.snapshot_path:
+            return None
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_snapshot(self, data):
+        if not self.snapshot_path:
+            return
+        try:
+            tmp = self.snapshot_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.snapshot_path)
+        except OSError:
+            pass
+
+    def stats(self):
+        return {
+            "courses": len(self._sorted_names),
+            "version": self._data.get("version"),
+            "last_error": self._last_error,
+        }
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """プロセス共通のカタログを返す (初回のみ生成)"""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = CourseCatalog(
+                    snapshot_path=get_secret("CATALOG_SNAPSHOT", default_snapshot_path()) or None,
+                    refresh_interval=get_float("CATALOG_REFRESH_INTERVAL", 300),
+                )
+    return _catalog
+
+
+# --- スキーマ ---
+def migration_sql():
+    """courses / course_holes を作り、掛川GH と既存ログのコースを登録する SQL"""
+    seed = ",\n".join(
+        f"                ('{green}', {hole}, {par})"
+        for green in ("A", "B") for hole, par in PAR_DATA.items()
+    )
+    return f"""
+        CREATE TABLE IF NOT EXISTS courses (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE TABLE IF NOT EXISTS course_holes (
+            course_id INTEGER NOT NULL REFERENCES courses (id) ON DELETE CASCADE,
+            green_type TEXT NOT NULL CHECK (green_type IN ('A', 'B')),
+            hole_no SMALLINT NOT NULL CHECK (hole_no BETWEEN 1 AND 18),
+            par SMALLINT NOT NULL CHECK (par BETWEEN 3 AND 6),
+            yardages JSONB NOT NULL DEFAULT '{{}}',
+            PRIMARY KEY (course_id, green_type, hole_no)
+        );
+        INSERT INTO courses (name) VALUES ('{DEFAULT_COURSE}') ON CONFLICT (name) DO NOTHING;
+        INSERT INTO course_holes (course_id, green_type, hole_no, par)
+        SELECT c.id, v.green_type, v.hole_no, v.par
+        FROM courses c, (VALUES
+{seed}
+            ) AS v (green_type, hole_no, par)
+        WHERE c.name = '{DEFAULT_COURSE}'
+        ON CONFLICT DO NOTHING;
+        -- 記録済みのほかのコースは、ログで一番多いパーを初期値にする
+        INSERT INTO courses (name)
+        SELECT DISTINCT course_name FROM approach_logs WHERE coalesce(course_name, '') <> ''
+        ON CONFLICT (name) DO NOTHING;
+        INSERT INTO course_holes (course_id, green_type, hole_no, par)
+        SELECT c.id, l.green_type, l.hole_no, mode() WITHIN GROUP (ORDER BY l.par)
+        FROM approach_logs l JOIN courses c ON c.name = l.course_name
+        WHERE l.green_type IN ('A', 'B') AND l.hole_no BETWEEN 1 AND 18 AND l.par BETWEEN 3 AND 6
+        GROUP BY c.id, l.green_type, l.hole_no
+        ON CONFLICT DO NOTHING;
+    """
+
+
+# --- 取り込み (CLI) ---
+def import_csv(conn, path):
+    """CSV のコースを置き換えで取り込み、取り込んだコース数を返す"""
+    import pandas as pd
+
+    df = pd.read_csv(path)
+    required = {"course_name", "green_type", "hole_no", "par"}
+    missing = required - set(df.columns)
+    if missing:
+        raise ValueError(f"列が足りません: {', '.join(sorted(missing))}")
+    tee_cols = [c for c in df.columns if c.startswith("yards_")]
+    df["green_type"] = df["green_type"].astype(str).str.strip().str.upper()
+    bad = ~df["hole_no"].between(1, 18) | ~df["par"].between(3, 6) | ~df["green_type"].isin(["A", "B"])
+    if bad.any():
+        raise ValueError(f"不正な行があります:\n{df[bad].head(10).to_string()}")
+    yards = df[tee_cols].rename(columns=lambda c: c[len("yards_"):])
+    df["yardages"] = [
+        json.dumps({k: int(v) for k, v in row.items() if pd.notna(v)})
+        for row in yards.to_dict("records")
+    ] if tee_cols else "{}"
+    with conn.cursor() as cur:
+        for name, holes in df.groupby("course_name"):
+            cur.execute("""
+                INSERT INTO courses (name) VALUES (%s)
+                ON CONFLICT (name) DO UPDATE SET updated_at = now()
+                RETURNING id
+            """, (name,))
+            course_id = cur.fetchone()[0]
+            cur.execute("DELETE FROM course_holes WHERE course_id = %s", (course_id,))
+            cur.executemany(
+                "INSERT INTO course_holes (course_id, green_type, hole_no, par, yardages) VALUES (%s, %s, %s, %s, %s)",
+                [(course_id, g, int(h), int(p), y) for g, h, p, y in
+                 holes[["green_type", "hole_no", "par", "yardages"]].itertuples(index=False)],
+            )
+    conn.commit()
+    return df["course_name"].nunique()
+
+
+def main(argv=None):
+    from db import get_connection
+
+    parser = argparse.ArgumentParser(description="コースカタログの管理")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_imp = sub.add_parser("import", help="CSV からコースを取り込む")
+    p_imp.add_argument("path")
+    sub.add_parser("list", help="登録済みのコースを表示する")
+    args = parser.parse_args(argv)
+    with get_connection() as conn:
+        if args.command == "import":
+            n = import_csv(conn, args.path)
+            print(f"{n} コースを取り込みました")
+        else:
+            catalog = CourseCatalog()
+            catalog.load(conn)
+            for name in catalog.names():
+                pars = [catalog.par(name, "A", h) for h in range(1, 19)]
+                print(f"{name}: Par {sum(p for p in pars if p)}")
+
+
+if __name__ == "__main__":
+    main()
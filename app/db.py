@@ -0,0 +1,335 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+from config import get_secret, get_int, get_float
+from telemetry import get_telemetry
+
+# ==========================================
+# 🔌 コネクションプール
+# ==========================================
+# Streamlit はリラン毎に main.py を再実行するが、import したモジュールは
+# プロセス内で共有される。ここにプールを置けば全セッション・全リランで
+# 同じ接続を使い回せる。
+
+
+def load_connect_kwargs():
+    """接続設定を一度だけ読み込む"""
+    return dict(
+        host=get_secret("DB_HOST", "localhost"),
+        database=get_secret("DB_NAME", "neondb"),
+        user=get_secret("DB_USER", "postgres"),
+        password=get_secret("DB_PASS", "password"),
+        port=get_secret("DB_PORT", "5432"),
+        connect_timeout=get_int("DB_CONNECT_TIMEOUT", 10),
+        # アイドル中にNAT/Tailscale経路で切られないようにする
+        keepalives=1,
+        keepalives_idle=30,
+        keepalives_interval=10,
+        keepalives_count=3,
+    )
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """プールの空き待ちがタイムアウトした"""
+
+
+class CircuitOpen(psycopg2.OperationalError):
+    """接続の失敗が続いたので、しばらくは接続を試さずに失敗させる (送信はジャーナルに残る)"""
+
+
+def backoff_delay(attempt, base, cap):
+    """attempt 回目 (0 始まり) の再試行までの待ち時間。上限つき指数にフルジッタをかける
+
+    休止から起きたばかりの DB に複数の端末・スレッドが同じ間隔で押し寄せないようにずらす。
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """連続 threshold 回の接続失敗で開き、reset_timeout 秒は接続を試さない。
+    その後の1回 (半開) が成功すれば閉じ、失敗すればまた開く。
+    """
+
+    def __init__(self, threshold=3, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._last_error = None
+        self._stats = {"opens": 0, "rejects": 0}
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if self.retry_in() == 0 else "open"
+
+    def retry_in(self):
+        """次に接続を試せるまでの秒数 (閉じていれば 0)"""
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            # 開いている間と、半開で誰かが試している間は断る
+            if self.retry_in() > 0 or self._trial:
+                self._stats["rejects"] += 1
+                return False
+            self._trial = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+            self._last_error = None
+
+    def failure(self, error):
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(error)
+            if self._trial or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+                self._stats["opens"] += 1
+            self._trial = False
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "failures": self._failures,
+                    "retry_in": round(self.retry_in(), 1), "last_error": self._last_error, **self._stats}
+
+
+class ConnectionPool:
+    def __init__(self, connect_kwargs, minconn=1, maxconn=5, timeout=10.0, check_interval=30.0,
+                 retries=2, retry_base=0.5, retry_max=5.0, breaker=None):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"invalid pool size: min={minconn} max={maxconn}")
+        self.connect_kwargs = connect_kwargs
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.retries = retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.breaker = breaker or CircuitBreaker()
+        self._cond = threading.Condition()
+        self._idle = []          # [(conn, 最終返却時刻)]
+        self._in_use = set()
+        self._opened = 0
+        self._stats = {
+            "checkouts": 0, "connects": 0, "reconnects": 0, "discards": 0, "connect_retries": 0,
+            "timeouts": 0, "wait_total": 0.0, "wait_max": 0.0,
+        }
+
+    def _connect(self):
+        """接続する。失敗したら間隔を空けて retries 回まで試し直す (ブレーカーが開いていれば試さない)"""
+        if not self.breaker.allow():
+            raise CircuitOpen(f"DB に接続できない状態が続いています ({self.breaker.retry_in():.0f}s 後に再試行)")
+        for attempt in range(self.retries + 1):
+            try:
+                with get_telemetry().timed("connect", "connect"):
+                    conn = psycopg2.connect(**self.connect_kwargs)
+                break
+            except psycopg2.OperationalError as e:
+                if attempt == self.retries:
+                    self.breaker.failure(e)
+                    raise
+            except Exception as e:
+                # 設定の誤りなど、再試行しても変わらない失敗も記録する (半開の試行のまま断り続けないように)
+                self.breaker.failure(e)
+                raise
+            with self._cond:
+                self._stats["connect_retries"] += 1
+            time.sleep(backoff_delay(attempt, self.retry_base, self.retry_max))
+        self.breaker.success()
+        with self._cond:
+            self._stats["connects"] += 1
+        return conn
+
+    def fill(self):
+        """最小接続数まで事前に接続しておく"""
+        while True:
+            # 枠だけロックの中で取り、接続 (再試行の待ちを含む) はロックの外で行う (getconn と同じ)
+            with self._cond:
+                if self._opened >= self.minconn:
+                    return
+                self._opened += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._opened -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def _is_alive(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.check_interval:
+            return True
+        # しばらく使っていない接続はサーバ側で切られている可能性があるので確認
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._cond:
+            while not self._idle and self._opened >= self.maxconn:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"接続プールの空き待ちが {self.timeout}s を超えました")
+                self._cond.wait(remaining)
+            if self._idle:
+                conn, idle_since = self._idle.pop()
+            else:
+                conn, idle_since = None, None
+                self._opened += 1
+            waited = time.monotonic() - start
+            self._stats["checkouts"] += 1
+            self._stats["wait_total"] += waited
+            self._stats["wait_max"] = max(self._stats["wait_max"], waited)
+        get_telemetry().record("connect", "pool_wait", waited)
+
+        # 接続・疎通確認はロックの外で行う
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif not self._is_alive(conn, idle_since):
+                self._close_quietly(conn)
+                conn = self._connect()
+                with self._cond:
+                    self._stats["reconnects"] += 1
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._in_use.add(conn)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        with self._cond:
+            self._in_use.discard(conn)
+            if discard or conn.closed:
+                self._close_quietly(conn)
+                self._opened -= 1
+                self._stats["discards"] += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            for conn, _ in self._idle:
+                self._close_quietly(conn)
+            self._opened -= len(self._idle)
+            self._idle = []
+
+    def stats(self):
+        with self._cond:
+            s = dict(self._stats)
+            s.update(
+                min=self.minconn, max=self.maxconn,
+                opened=self._opened, in_use=len(self._in_use), idle=len(self._idle),
+            )
+        s["wait_avg"] = s["wait_total"] / s["checkouts"] if s["checkouts"] else 0.0
+        s["breaker"] = self.breaker.stats()
+        return s
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """プロセス共通のプールを返す (初回のみ生成)"""
+    global _pool
+    created = None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                created = _pool = ConnectionPool(
+                    load_connect_kwargs(),
+                    minconn=get_int("DB_POOL_MIN", 1),
+                    maxconn=get_int("DB_POOL_MAX", 5),
+                    timeout=get_float("DB_POOL_TIMEOUT", 10),
+                    check_interval=get_float("DB_POOL_CHECK_INTERVAL", 30),
+                    retries=get_int("DB_CONNECT_RETRIES", 2),
+                    retry_base=get_float("DB_RETRY_BASE", 0.5),
+                    retry_max=get_float("DB_RETRY_MAX", 5),
+                    breaker=CircuitBreaker(
+                        threshold=get_int("DB_BREAKER_FAILURES", 3),
+                        reset_timeout=get_float("DB_BREAKER_RESET", 30),
+                    ),
+                )
+    if created is not None:
+        # 事前の接続は _pool_lock の外で行う (DB が起きるまで他のスレッドの getconn を待たせない)
+        try:
+            created.fill()
+        except psycopg2.OperationalError:
+            # DBが起きていなくても画面は出す。接続は初回利用時に再試行する
+            pass
+    return _pool
+
+
+@contextmanager
+def get_connection():
+    """プールから接続を借りて、ブロックを抜けたら返却する"""
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        # 通信断などで壊れた接続はプールに戻さない
+        pool.putconn(conn, discard=True)
+        raise
+    except BaseException:
+        pool.putconn(conn)
+        raise
+    else:
+        pool.putconn(conn)
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def breaker_status():
+    """接続のブレーカーの状態。プールをまだ作っていなければ None (ここでは接続しない)"""
+    return None if _pool is None else _pool.breaker.stats()
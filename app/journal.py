@@ -0,0 +1,312 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from cache import get_cache
+from config import get_secret, get_int, get_float
+from constants import LOG_COLUMNS
+from db import backoff_delay
+from rounds import ROUND_FIELDS, DEFAULT_PLAYER
+
+# ==========================================
+# 📥 送信ジャーナル (オフライン対応)
+# ==========================================
+# 登録ボタンではまずローカルの SQLite に追記して即座に完了とし、
+# DB への書き込みはバックグラウンドのフラッシャがまとめて行う。
+# 電波が切れてもジャーナルに残るので、ホールが失われることはない。
+# 各行にはラウンド情報 (round_uid など) も載せ、フラッシュ時に round_id を解決する。
+# 各行は端末で生成した冪等キー (client_key) を持つ。同じキーの追記は無視し、DB 側も
+# (ラウンド, プレーヤー, ホール) 単位の upsert なので、再送・二度押しで行が増えない。
+# まとめて送信モードでは行を保留 (held) で追記し、ハーフ終了・ラウンド終了時に
+# release() で1トランザクションの複数行 upsert として送る。
+
+INSERT_COLUMNS = LOG_COLUMNS
+
+
+def default_path():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "journal.db")
+
+
+class Journal:
+    def __init__(self, path, batch_size=50, backoff_base=1.0, backoff_max=60.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._failures = 0
+        self._next_attempt = 0.0
+        self._last_error = None
+        self._last_flush = None
+        self._flushed = 0
+        self._schema_ready = False
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # WAL + synchronous=FULL: 追記はコミット時点でディスクに載る
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS pending (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                round_date TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(pending)")}
+        if "round_uid" not in columns:
+            self._db.execute("ALTER TABLE pending ADD COLUMN round_uid TEXT")
+        if "client_key" not in columns:
+            self._db.execute("ALTER TABLE pending ADD COLUMN client_key TEXT")
+            self._db.execute("ALTER TABLE pending ADD COLUMN player TEXT")
+        if "held" not in columns:
+            self._db.execute("ALTER TABLE pending ADD COLUMN held INTEGER NOT NULL DEFAULT 0")
+        self._db.execute("CREATE UNIQUE INDEX IF NOT EXISTS pending_client_key ON pending (client_key)")
+        # DB にコミット済みのホール (画面の送信状況の表示用。DB に問い合わせずに済む)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS flushed (
+                round_uid TEXT NOT NULL,
+                player TEXT NOT NULL,
+                hole_no INTEGER NOT NULL,
+                flushed_at REAL NOT NULL,
+                PRIMARY KEY (round_uid, player, hole_no)
+            )
+        """)
+
+    # --- 追記・参照 ---
+    def append(self, row, round_info, client_key, player=DEFAULT_PLAYER, hold=False):
+        """1ホール分を追記して seq を返す。同じ client_key が既にあれば None。ネットワークには触らない
+
+        hold=True なら release() されるまで送らない。
+        """
+        payload = json.dumps({
+            "row": {c: row[c] for c in INSERT_COLUMNS},
+            "round": {f: round_info[f] for f in ROUND_FIELDS},
+            "player": player,
+            "key": client_key,
+        }, ensure_ascii=False, default=str)
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT OR IGNORE INTO pending (round_date, round_uid, player, client_key, payload, created_at, held)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (str(row["round_date"]), round_info["round_uid"], player, client_key, payload, time.time(), int(hold)),
+            )
+            if not cur.rowcount:
+                return None
+            seq = cur.lastrowid
+        if hold:
+            return seq
+        # 待機中のフラッシャを起こす (バックオフ中でも新規追記なら一度試す)
+        self._next_attempt = 0.0
+        self._wake.set()
+        return seq
+
+    def pending_count(self, round_uid=None):
+        with self._lock:
+            if round_uid is None:
+                return self._db.execute("SELECT count(*) FROM pending").fetchone()[0]
+            return self._db.execute(
+                "SELECT count(*) FROM pending WHERE round_uid = ?", (round_uid,)
+            ).fetchone()[0]
+
+    def held_count(self, round_uid=None):
+        with self._lock:
+            if round_uid is None:
+                return self._db.execute("SELECT count(*) FROM pending WHERE held = 1").fetchone()[0]
+            return self._db.execute(
+                "SELECT count(*) FROM pending WHERE held = 1 AND round_uid = ?", (round_uid,)
+            ).fetchone()[0]
+
+    def release(self, round_uid, player=DEFAULT_PLAYER):
+        """保留中の行を送信待ちにしてフラッシャを起こす。解除した件数を返す"""
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE pending SET held = 0 WHERE held = 1 AND round_uid = ? AND coalesce(player, ?) = ?",
+                (round_uid, DEFAULT_PLAYER, player),
+            )
+            released = cur.rowcount
+        if released:
+            self._next_attempt = 0.0
+            self._wake.set()
+        return released
+
+    def hole_status(self, round_uid, player=DEFAULT_PLAYER):
+        """{hole_no: "held" | "pending" | "committed"} を返す (ローカルの記録だけで判定)"""
+        with self._lock:
+            status = {
+                hole: "committed" for (hole,) in self._db.execute(
+                    "SELECT hole_no FROM flushed WHERE round_uid = ? AND player = ?", (round_uid, player),
+                )
+            }
+            cur = self._db.execute(
+                "SELECT payload, held FROM pending WHERE round_uid = ? AND coalesce(player, ?) = ? ORDER BY seq",
+                (round_uid, DEFAULT_PLAYER, player),
+            )
+            for payload, held in cur.fetchall():
+                status[_unpack(payload)[0]["hole_no"]] = "held" if held else "pending"
+        return status
+
+    def forget(self, round_uid, player, hole_no):
+        """DB から消したホールを送信済みの記録からも外す"""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM flushed WHERE round_uid = ? AND player = ? AND hole_no = ?",
+                (round_uid, player, hole_no),
+            )
+
+    def pending_rows(self, round_uid, player=DEFAULT_PLAYER):
+        with self._lock:
+            cur = self._db.execute(
+                "SELECT seq, payload FROM pending WHERE round_uid = ? AND coalesce(player, ?) = ? ORDER BY seq DESC",
+                (round_uid, DEFAULT_PLAYER, player),
+            )
+            return [(seq, _unpack(payload)[0]) for seq, payload in cur.fetchall()]
+
+    def discard_latest(self, round_uid, player=DEFAULT_PLAYER):
+        """player の未送信の最新1件を取り消す。取り消せたら True"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT max(seq) FROM pending WHERE round_uid = ? AND coalesce(player, ?) = ?",
+                (round_uid, DEFAULT_PLAYER, player),
+            ).fetchone()
+            if row[0] is None:
+                return False
+            self._db.execute("DELETE FROM pending WHERE seq = ?", (row[0],))
+            return True
+
+    # --- フラッシュ ---
+    def _take_batch(self):
+        with self._lock:
+            cur = self._db.execute(
+                "SELECT seq, payload FROM pending WHERE held = 0 ORDER BY seq LIMIT ?", (self.batch_size,)
+            )
+            return cur.fetchall()
+
+    def flush_once(self):
+        """未送信分を1バッチだけ DB に書き込み、書き込んだ件数を返す"""
+        batch = self._take_batch()
+        if not batch:
+            return 0
+        unpacked = [_unpack(payload) for _, payload in batch]
+        latest = {}
+        for i, (row, r, player, key) in enumerate(unpacked):
+            # 同じ (ラウンド, プレーヤー, ホール) がバッチ内に複数あれば後のものだけ
+            # (1文の upsert で同じ行を2回更新できないため)
+            ident = (r["round_uid"], player, row["hole_no"]) if r else i
+            latest[ident] = (row, r, player, key)
+        # 保存先 (と分析用の pandas) はフラッシャが初めて書くときに読み込む。入力画面の起動には載せない
+        from storage import get_storage
+        from trends import get_trends
+
+        storage = get_storage()
+        if not self._schema_ready:
+            # スキーマの確認もここで (圏外なら次のフラッシュでもう一度)
+            self._schema_ready = storage.ensure_schema() is None
+        # ラウンド・プレーヤーとショットは同じトランザクションで書く
+        storage.upsert_holes(list(latest.values()))
+        # コミット後にキャッシュを無効化する (順序が逆だと古い結果が残りうる)
+        cache = get_cache()
+        for uid in {r["round_uid"] for _, r, _, _ in unpacked if r}:
+            cache.bump(uid)
+        if any(r is None for _, r, _, _ in unpacked):
+            cache.bump()
+        # 直近ラウンドの推移も書いたホールの分だけ足し引きする
+        get_trends().apply_holes(list(latest.values()))
+        # DB のコミットが済んでから消す (途中で落ちても取りこぼさない)
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany("DELETE FROM pending WHERE seq = ?", [(seq,) for seq, _ in batch])
+            self._db.executemany(
+                "INSERT OR REPLACE INTO flushed (round_uid, player, hole_no, flushed_at) VALUES (?, ?, ?, ?)",
+                [(r["round_uid"], player, row["hole_no"], now) for row, r, player, _ in unpacked if r],
+            )
+            self._db.execute("COMMIT")
+        self._flushed += len(batch)
+        self._last_flush = time.time()
+        return len(batch)
+
+    def flush_all(self):
+        total = 0
+        while True:
+            n = self.flush_once()
+            total += n
+            if n < self.batch_size:
+                return total
+
+    def _run(self):
+        while True:
+            wait = max(0.0, self._next_attempt - time.monotonic())
+            self._wake.wait(timeout=wait if self._failures else None)
+            self._wake.clear()
+            if time.monotonic() < self._next_attempt:
+                continue
+            try:
+                self.flush_all()
+                self._failures = 0
+                self._last_error = None
+            except Exception as e:
+                # DB の障害に限らず (保存先の設定の誤り・推移の更新の失敗など) スレッドは止めず、
+                # エラーを残して間をあけて送り直す (ジャーナルの行はコミットが済むまで消さない)
+                self._failures += 1
+                self._last_error = str(e)
+                # 接続の再試行と同じくジッタをかけ、複数の端末が同時に送り直さないようにする
+                delay = backoff_delay(self._failures - 1, self.backoff_base, self.backoff_max)
+                self._next_attempt = time.monotonic() + delay
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="journal-flusher", daemon=True)
+                self._thread.start()
+        # 前回プロセスの未送信分も拾う
+        self._wake.set()
+
+    def wake(self):
+        self._wake.set()
+
+    def stats(self):
+        return {
+            "pending": self.pending_count(),
+            "held": self.held_count(),
+            "flushed": self._flushed,
+            "failures": self._failures,
+            "retry_in": round(max(0.0, self._next_attempt - time.monotonic()), 1) if self._failures else 0.0,
+            "last_error": self._last_error,
+            "last_flush": self._last_flush,
+        }
+
+
+def _unpack(payload):
+    """(ショット行, ラウンド情報, プレーヤー, 冪等キー) を返す。
+
+    ラウンド導入前に積まれた行はラウンド情報なし、プレーヤー導入前の行は既定のプレーヤーでキーなし。
+    """
+    data = json.loads(payload)
+    if "row" in data:
+        return data["row"], data["round"], data.get("player", DEFAULT_PLAYER), data.get("key")
+    return data, None, DEFAULT_PLAYER, None
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    """プロセス共通のジャーナルを返す (初回のみ生成してフラッシャを起動)"""
+    global _journal
+    if _journal is None:
+        with _journal_lock:
+            if _journal is None:
+                journal = Journal(
+                    get_secret("JOURNAL_PATH", default_path()),
+                    batch_size=get_int("JOURNAL_BATCH_SIZE", 50),
+                    backoff_base=get_float("JOURNAL_BACKOFF_BASE", 1.0),
+                    backoff_max=get_float("JOURNAL_BACKOFF_MAX", 60.0),
+                )
+                journal.start()
+                _journal = journal
+    return _journal
@@ -0,0 +1,292 @@
+"""負荷試験 (main.py を画面なしで複数セッション同時に動かす)
+
+    python loadtest.py                              # 1 / 4 / 8 / 16 セッションで 18 ホールずつ
+    python loadtest.py --ramp 4 12 36 --group 4     # 4人1組で同じラウンドを記録する
+    python loadtest.py --think 0.5 --out load.json
+
+Streamlit の AppTest でセッションごとに main.py を実行し、サイドバーのプレーヤー・コース設定と
+score_form の登録を 18 ホール分操作する。DB は DB_* の設定先を使う (本番の DB には向けないこと)。
+ジャーナルは一時ファイルに置き、終了時に送り切れたかも確認する。
+
+AppTest はプロセス全体の状態 (Runtime) を使うので、1プロセスで同時に複数は動かせない。
+そのためセッションごとにプロセスを分け、全員の初回表示が済んでから一斉に操作を始める。
+プール・キャッシュはセッションごとになるため、DB の接続数はサーバ側 (pg_stat_activity) で数える。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+
+# ==========================================
+# 🚦 負荷試験
+# ==========================================
+# 段階ごとに N セッションを同時に走らせ、リランの所要時間・DB の接続数・エラーを集める。
+# 各セッションは自分のジャーナルを持ち、18 ホール登録後にフラッシャが送り切るまで待つ。
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+DEFAULT_RAMP = (1, 4, 8, 16)
+DIST_CHOICES = 6
+RESULT_CHOICES = ("パーオン成功", "失敗")
+
+
+def _percentiles(samples):
+    if not samples:
+        return {"n": 0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    ms = np.array(samples) * 1000
+    return {
+        "n": len(samples),
+        "p50_ms": round(float(np.percentile(ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(ms, 99)), 1),
+        "max_ms": round(float(ms.max()), 1),
+    }
+
+
+class ConnectionSampler:
+    """段階の間、一定間隔で DB 側の接続数 (全体 / 実行中) を記録する"""
+
+    SQL = """
+        SELECT count(*), count(*) FILTER (WHERE state <> 'idle')
+        FROM pg_stat_activity
+        WHERE datname = current_database() AND pid <> pg_backend_pid()
+    """
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.total = []
+        self.active = []
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        import psycopg2
+        from db import load_connect_kwargs
+
+        try:
+            conn = psycopg2.connect(**load_connect_kwargs())
+        except psycopg2.Error as e:
+            self.error = str(e).strip()
+            return
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                while not self._stop.is_set():
+                    cur.execute(self.SQL)
+                    total, active = cur.fetchone()
+                    self.total.append(total)
+                    self.active.append(active)
+                    self._stop.wait(self.interval)
+        except psycopg2.Error as e:
+            self.error = str(e).strip()
+        finally:
+            conn.close()
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name="conn-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self):
+        return {
+            "total_peak": max(self.total, default=None),
+            "active_peak": max(self.active, default=None),
+            "active_mean": round(float(np.mean(self.active)), 2) if self.active else None,
+            "error": self.error,
+        }
+
+
+class Session:
+    """1セッション (1人のプレーヤー) の操作"""
+
+    def __init__(self, player, round_uid, timeout, think, rng):
+        from streamlit.testing.v1 import AppTest
+
+        self.player = player
+        self.round_uid = round_uid
+        self.think = think
+        self.rng = rng
+        self.latencies = {"load": [], "widget": [], "submit": [], "sidebar": []}
+        self.errors = []
+        self.at = AppTest.from_file(MAIN, default_timeout=timeout)
+        # 同じ組は URL 共有と同じく ?round= で同じラウンドに入る
+        self.at.query_params["round"] = round_uid
+        self.at.query_params["player"] = player
+
+    def _run(self, kind, widget=None):
+        t0 = time.perf_counter()
+        try:
+            (widget or self.at).run()
+        except Exception as e:
+            self.errors.append(f"{kind}: {type(e).__name__}: {e}")
+            return
+        finally:
+            self.latencies[kind].append(time.perf_counter() - t0)
+        for exc in self.at.exception:
+            self.errors.append(f"{kind}: {exc.value}")
+
+    def _widget(self, elements, label):
+        return next(e for e in elements if e.label == label)
+
+    def _pause(self):
+        if self.think:
+            time.sleep(self.think * self.rng.uniform(0.5, 1.5))
+
+    def play(self):
+        """初回表示 (load) の後に呼ぶ"""
+        sidebar = self.at.sidebar
+        # サイドバーのコース設定を一度反映する (実際の1番ホール前の操作)
+        self._widget(sidebar.radio, "グリーン").set_value("A")
+        self._run("sidebar", self._widget(sidebar.button, "反映").click())
+        for _ in range(18):
+            if self.at.session_state.is_finished:
+                break
+            self._pause()
+            # 入力画面だけが描き直されるウィジェット操作 (距離・結果)
+            self._run("widget", self._widget(self.at.selectbox, "dist").select_index(self.rng.randrange(DIST_CHOICES)))
+            self._run("widget", self._widget(self.at.radio, "on_check").set_value(self.rng.choice(RESULT_CHOICES)))
+            submit = next((b for b in self.at.button if b.label.startswith("登録")), None)
+            if submit is None:
+                self.errors.append(f"submit: 登録ボタンがありません (hole_index={self.at.session_state.hole_index})")
+                return
+            self._run("submit", submit.click())
+        if not self.at.session_state.is_finished:
+            self.errors.append(f"finish: 18 ホール目まで進みませんでした (hole_index={self.at.session_state.hole_index})")
+
+
+def play_session(spec):
+    """ワーカープロセスで1セッションを動かし、計測結果を返す"""
+    os.environ["JOURNAL_PATH"] = spec["journal_path"]
+    os.environ.setdefault("SLOW_QUERY_LOG", spec["slow_log_path"])
+    sys.path.insert(0, os.path.dirname(MAIN))
+    from db import pool_stats
+    from journal import get_journal
+
+    session = Session(spec["player"], spec["round_uid"], spec["timeout"], spec["think"], random.Random(spec["seed"]))
+    session._run("load")
+    # 全員の初回表示 (import・スキーマ確認) が済んでから一斉に始める
+    spec["barrier"].wait()
+    t0 = time.perf_counter()
+    if not session.errors:
+        session.play()
+    elapsed = time.perf_counter() - t0
+
+    # 画面上は登録済みでも、DB に届いたかはジャーナルが空になったかで確認する
+    journal = get_journal()
+    drain_t0 = time.perf_counter()
+    while journal.pending_count() and time.perf_counter() - drain_t0 < spec["timeout"]:
+        journal.wake()
+        time.sleep(0.1)
+    stats = pool_stats()
+    return {
+        "latencies": session.latencies,
+        "errors": session.errors,
+        "elapsed": elapsed,
+        "drain": time.perf_counter() - drain_t0,
+        "pending_after": journal.pending_count(),
+        "journal_error": journal.stats().get("last_error"),
+        "pool_timeouts": stats["timeouts"],
+        "pool_wait_max": stats["wait_max"],
+    }
+
+
+def run_stage(n_sessions, group, timeout, think, seed, workdir):
+    rng = random.Random(seed)
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Manager() as manager:
+        barrier = manager.Barrier(n_sessions)
+        specs = []
+        for i in range(n_sessions):
+            if i % group == 0:
+                round_uid = str(uuid.uuid4())
+            specs.append({
+                "player": f"負荷{seed}-{i}", "round_uid": round_uid, "timeout": timeout, "think": think,
+                "seed": rng.random(), "barrier": barrier,
+                "journal_path": os.path.join(workdir, f"journal_{seed}_{i}.db"),
+                "slow_log_path": os.path.join(workdir, "slow_queries.jsonl"),
+            })
+        with ConnectionSampler() as sampler, ctx.Pool(n_sessions) as pool:
+            sessions = pool.map(play_session, specs)
+
+    elapsed = max(s["elapsed"] for s in sessions)
+    errors = [e for s in sessions for e in s["errors"]]
+    latencies = {kind: [x for s in sessions for x in s["latencies"][kind]] for kind in sessions[0]["latencies"]}
+    journal_errors = [s["journal_error"] for s in sessions if s["journal_error"]]
+    return {
+        "sessions": n_sessions,
+        "group": group,
+        "elapsed_s": round(elapsed, 2),
+        "holes_per_s": round(len(latencies["submit"]) / elapsed, 1) if elapsed else 0.0,
+        "latency": {kind: _percentiles(v) for kind, v in latencies.items()},
+        "connections": sampler.summary(),
+        "pool": {
+            "timeouts": sum(s["pool_timeouts"] for s in sessions),
+            "wait_max_ms": round(max(s["pool_wait_max"] for s in sessions) * 1000, 1),
+        },
+        "journal": {
+            "pending_after": sum(s["pending_after"] for s in sessions),
+            "drain_max_s": round(max(s["drain"] for s in sessions), 2),
+            "last_error": journal_errors[0] if journal_errors else None,
+        },
+        "errors": len(errors),
+        "error_samples": errors[:10],
+    }
+
+
+def print_stage(r):
+    lat = r["latency"]
+    conn = r["connections"]
+    print(
+        f"{r['sessions']:>4} セッション | 登録 p50 {lat['submit']['p50_ms']:>7.1f} p95 {lat['submit']['p95_ms']:>7.1f} "
+        f"p99 {lat['submit']['p99_ms']:>7.1f} ms | 操作 p95 {lat['widget']['p95_ms']:>7.1f} ms | "
+        f"DB 接続 {conn['total_peak'] if conn['total_peak'] is not None else '-'} "
+        f"(実行中 {conn['active_peak'] if conn['active_peak'] is not None else '-'}) | "
+        f"未送信 {r['journal']['pending_after']} | エラー {r['errors']}"
+    )
+    if conn["error"]:
+        print(f"       📡 DB に接続できません (ホールはジャーナルに残ります): {conn['error'][:120]}")
+    for e in r["error_samples"][:3]:
+        print(f"       ⚠️ {e[:160]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="main.py の同時セッション負荷試験")
+    parser.add_argument("--ramp", type=int, nargs="+", default=list(DEFAULT_RAMP), help="段階ごとの同時セッション数")
+    parser.add_argument("--group", type=int, default=1, help="同じラウンドを記録する人数 (1組の人数)")
+    parser.add_argument("--think", type=float, default=0.0, help="ホール間の待ち時間 (秒、±50% のゆらぎ)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="1リランのタイムアウト (秒)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="結果を書き出す JSON のパス")
+    args = parser.parse_args(argv)
+
+    # ジャーナル・スロークエリログは試験用の一時ファイルにする
+    stages = []
+    with tempfile.TemporaryDirectory(prefix="golf_load_") as workdir:
+        for i, n in enumerate(args.ramp):
+            result = run_stage(n, max(1, args.group), args.timeout, args.think, args.seed + i, workdir)
+            print_stage(result)
+            stages.append(result)
+    if args.out:
+        meta = {"timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"), "args": vars(args)}
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "stages": stages}, f, ensure_ascii=False, indent=2)
+        print(f"→ {args.out}")
+    if any(s["errors"] for s in stages):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,85 +1,46 @@
-import streamlit as st
-import psycopg2
-import pandas as pd
-import os
 import time
-from datetime import date
-
-# ==========================================
-# ⚙️ 基本設定
-# ==========================================
-PAR_DATA = {
-    1: 4, 2: 3, 3: 4, 4: 4, 5: 4, 6: 5, 7: 3, 8: 5, 9: 4,
-    10: 5, 11: 4, 12: 3, 13: 4, 14: 4, 15: 4, 16: 3, 17: 4, 18: 5
-}
-CLUB_LIST = ["DR", "5W", "7W", "5U", "6U", "6I", "7I", "8I", "9I", "PW", "50", "56", "58", "PT"]
-DIST_LIST_DISP = ["~100", "100~", "120~", "140~", "160~", "180~"]
-
-# 変換マップ
-DIST_MAP = {"~100": "under_100", "100~": "100-120", "120~": "120-140", "140~": "140-160", "160~": "160-180", "180~": "over_180"}
-DIR_MAP = {"手前": "SHORT", "奥": "OVER", "右": "RIGHT", "左": "LEFT", "NONE": "NONE"}
-LIE_MAP = {"フェアウェイ": "FAIRWAY", "ラフ弱": "ROUGH_LIGHT", "ラフ強": "ROUGH_DEEP", "バンカー": "BUNKER", "NONE": "NONE"}
+_script_started = time.perf_counter()
 
-# ★変更：距離感の定義をユーザー要望に合わせて更新
-PROXIMITY_MAP = {
-    "1.5m以内": "UNDER_1.5", 
-    "3m以内": "UNDER_3.0", 
-    "5m以内": "UNDER_5.0", 
-    "6m以上": "OVER_6.0", 
-    "NONE": "NONE"
-}
-PENALTY_MAP = {"なし": "NONE", "OB": "OB", "1ペナ(池など)": "PENALTY"}
+import streamlit as st
 
-def get_secret(key, default_value):
-    if "env" in st.secrets and key in st.secrets["env"]:
-        return st.secrets["env"][key]
-    if key in st.secrets:
-        return st.secrets[key]
-    return os.environ.get(key, default_value)
+from config import get_bool, get_int, get_float, storage_backend
+from courses import get_catalog
+from db import get_connection, breaker_status
+from journal import get_journal
+from session import (
+    INPUT_PAGE, HISTORY_PAGE, ROUNDS_PAGE, ANALYTICS_PAGE,
+    init_state, sync_params, start_new_round, on_buffer_mode_change, go_input, rerun,
+)
+from telemetry import get_telemetry
+from warmup import get_warmup, get_keep_warm
 
-def get_connection():
-    return psycopg2.connect(
-        host=get_secret("DB_HOST", "localhost"),
-        database=get_secret("DB_NAME", "neondb"),
-        user=get_secret("DB_USER", "postgres"),
-        password=get_secret("DB_PASS", "password"),
-        port=get_secret("DB_PORT", "5432")
-    )
+# ==========================================
+# ⛳ 入口 (共通の設定・サイドバー・ページの切り替え)
+# ==========================================
+# 各ページは views/ にあり、開いたページのスクリプトだけが実行される。
+# 入力画面はジャーナルとコースカタログだけで描き、履歴・一覧・分析のページは
+# 開いたときに初めて pandas・保存先・分析のモジュールを読み込んでクエリを流す。
 
 st.set_page_config(page_title="Golf Log v45", page_icon="⛳", layout="centered")
 
-# --- 🔄 セッション状態の初期化 ---
-if 'hole_index' not in st.session_state:
-    st.session_state.hole_index = int(st.query_params.get("hole", 0))
-if 'course_name' not in st.session_state:
-    st.session_state.course_name = st.query_params.get("course", "掛川GH")
-if 'start_side' not in st.session_state:
-    st.session_state.start_side = st.query_params.get("start", "OUT (1→18)")
-if 'green_type' not in st.session_state:
-    st.session_state.green_type = st.query_params.get("green", "A")
-if 'last_registered_hole' not in st.session_state:
-    st.session_state.last_registered_hole = -1
-if 'on_status_res' not in st.session_state:
-    st.session_state.on_status_res = "パーオン成功"
-if 'is_finished' not in st.session_state:
-    st.session_state.is_finished = False
-if 'show_history' not in st.session_state:
-    st.session_state.show_history = False
+# コースカタログはメモリ上の索引を引くだけ。更新の確認は一定間隔で裏で行う (サーバ越しのときだけ)
+catalog = get_catalog()
+if storage_backend() == "postgres":
+    # 休止中のサーバレス Postgres はプロセスの最初に裏で起こす (カタログ・ラウンド一覧の先読みも)
+    warmup = get_warmup()
+    warmup.start()
+    wait = get_float("WARMUP_WAIT_SECONDS", 0)
+    if wait and not warmup.done:
+        with st.spinner("DB を起こしています..."):
+            warmup.wait(wait)
+    # カタログは暖機で読み込むので、その後の更新確認だけここで行う
+    if warmup.done:
+        catalog.refresh_in_background(get_connection)
 
-def sync_params():
-    st.query_params["hole"] = str(st.session_state.hole_index)
-    st.query_params["course"] = st.session_state.course_name
-    st.query_params["start"] = st.session_state.start_side
-    st.query_params["green"] = st.session_state.green_type
+# --- 🔄 セッション状態の初期化 ---
+init_state()
 
-def next_hole():
-    if st.session_state.hole_index == 17:
-        st.session_state.is_finished = True
-    else:
-        st.session_state.hole_index += 1
-        st.session_state.on_status_res = "パーオン成功"
-    sync_params()
-    st.rerun()
+OTHER_COURSE = "✏️ その他 (手入力)"
 
 # --- 🎨 CSS ---
 st.markdown("""
@@ -97,29 +58,102 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+# --- 📡 未送信件数 (一定間隔でここだけ更新) ---
+@st.fragment(run_every=get_int("PENDING_REFRESH_SECONDS", 15))
+def pending_status():
+    journal = get_journal()
+    held = journal.held_count()
+    pending = journal.pending_count() - held
+    if held:
+        st.caption(f"🗂 保留中 {held} 件 (ハーフ・ラウンド終了時にまとめて送信)")
+    if pending:
+        st.caption(f"📡 未送信 {pending} 件 (電波回復後に自動送信)")
+    breaker = breaker_status()
+    if breaker and breaker["state"] != "closed":
+        st.caption(f"📴 DB に接続できません。端末に保存して {breaker['retry_in']:.0f} 秒後に再試行します")
+
+# --- 🔧 デバッグ (ボタン操作はここだけ再実行) ---
+@st.fragment
+def debug_panel():
+    # 表示するときだけ読み込む (入力画面の起動には載せない)
+    import pandas as pd
+    import strokes_gained
+    from cache import get_cache
+    from migrations import schema_status
+    from mirror import get_mirror
+    from storage import get_storage
+    from trends import get_trends
+
+    storage = get_storage()
+    storage.ensure_schema()
+    mirror = get_mirror() if storage.remote else None
+    with st.expander("🔧 ストレージ"):
+        st.json(storage.stats())
+    if storage.remote:
+        with st.expander("🗂 スキーマ"):
+            st.json(schema_status())
+    with st.expander("📥 送信ジャーナル"):
+        st.json(get_journal().stats())
+    if mirror is not None:
+        with st.expander("🪞 ローカル写し"):
+            st.json(mirror.stats())
+    if storage.remote:
+        with st.expander("🔥 暖機"):
+            st.json({"warmup": get_warmup().stats(), "keep_warm": get_keep_warm().stats()})
+    with st.expander("🗺 コースカタログ"):
+        st.json(catalog.stats())
+    with st.expander("🗃 クエリキャッシュ"):
+        st.json(get_cache().stats())
+    with st.expander("📉 ストローク・ゲインド"):
+        st.json(strokes_gained.get_round_cache().stats())
+    with st.expander("📈 推移"):
+        st.json(get_trends().stats())
+        if st.button("推移を作り直す"):
+            try:
+                get_trends().rebuild(storage)
+            except Exception as e:
+                st.error(f"推移の作り直しエラー: {e}")
+    with st.expander("⏱ クエリ計測"):
+        st.dataframe(pd.DataFrame(get_telemetry().snapshot()), hide_index=True, use_container_width=True)
+        if st.button("計測をリセット"):
+            get_telemetry().reset()
+            rerun("fragment")
+
 # --- サイドバー ---
 with st.sidebar:
     st.header("⚙️ 設定 v45")
+    # フォームの外に置き、入力したらすぐにコースの選択肢を絞り込む (表記ゆれ・部分一致、前方一致が先)
+    course_query = st.text_input("コースを検索", key="course_query", placeholder="例: 掛川")
     with st.form(key="sidebar_form"):
-        round_date = st.date_input("日付", date.today())
-        course_in = st.text_input("コース名", value=st.session_state.course_name)
+        date_in = st.date_input("日付", st.session_state.round_date)
+        # カタログに無いコースは「その他」から手入力
+        known = catalog.resolve(st.session_state.course_name)
+        hits = catalog.search(course_query, limit=None)
+        # 今のコースは絞り込んでも選択肢に残す
+        course_opts = ([known] if known and known not in hits else []) + hits + [OTHER_COURSE]
+        course_sel = st.selectbox("コース", course_opts, index=course_opts.index(known) if known else len(course_opts) - 1)
+        course_free = st.text_input("コース名 (その他のとき)", value="" if known else st.session_state.course_name)
         start_in = st.radio("スタート", ["OUT (1→18)", "IN (10→9)"], index=0 if "OUT" in st.session_state.start_side else 1)
         green_in = st.radio("グリーン", ["A", "B"], horizontal=True, index=0 if st.session_state.green_type == "A" else 1)
         if st.form_submit_button("反映"):
+            course_in = course_sel if course_sel != OTHER_COURSE else (course_free.strip() or st.session_state.course_name)
             st.session_state.course_name, st.session_state.start_side, st.session_state.green_type = course_in, start_in, green_in
-            st.session_state.hole_index = 0
-            st.session_state.is_finished = False
-            st.session_state.show_history = False
-            st.session_state.on_status_res = "パーオン成功"
+            st.session_state.round_date = date_in
+            # 設定を反映したら新しいラウンドとして記録する
+            start_new_round()
+            go_input()
+
+    # プレーヤーを変えてもラウンドはそのまま (同じ URL を開いた同伴者が自分の名前で記録する)
+    with st.form(key="player_form"):
+        player_in = st.text_input("プレーヤー", value=st.session_state.player)
+        if st.form_submit_button("プレーヤーを変更") and player_in.strip():
+            st.session_state.player = player_in.strip()
+            st.session_state.history_cursors = [None]
             sync_params(); st.rerun()
+    st.caption("このページの URL を同伴者に送ると、同じラウンドに各自で記録できます")
+    st.toggle("まとめて送信 (電波の弱いコース)", key="buffer_mode", on_change=on_buffer_mode_change,
+              help="各ホールは端末に保留し、ハーフ終了・ラウンド終了時に1回でまとめて送ります")
 
-    st.markdown("---")
-    if st.button("📝 履歴を表示"):
-        st.session_state.show_history = True
-        st.rerun()
-
-    current_order = list(range(1, 19)) if "OUT" in st.session_state.start_side else list(range(10, 19)) + list(range(1, 10))
-    
     st.markdown("---")
     c_prev, c_next = st.columns(2)
     with c_prev:
@@ -132,127 +166,21 @@ with st.sidebar:
             st.session_state.hole_index = min(17, st.session_state.hole_index + 1)
             sync_params(); st.rerun()
 
-# --- メインエリア ---
-
-if st.session_state.show_history:
-    st.subheader("📝 本日の履歴")
-    if st.button("◀ 入力に戻る"):
-        st.session_state.show_history = False
-        st.rerun()
-    try:
-        conn = get_connection()
-        df = pd.read_sql(f"""
-            SELECT hole_no as H, club, 
-            CASE WHEN is_green_on THEN 'ON' ELSE 'OFF' END as ON_OFF,
-            proximity as 寄せ, penalty as PEN,
-            hole_score as Score 
-            FROM approach_logs WHERE round_date = '{round_date}' ORDER BY id DESC
-        """, conn)
-        conn.close()
-        if not df.empty:
-            st.dataframe(df, hide_index=True, use_container_width=True)
-            if st.button("最新1打を削除"):
-                conn = get_connection(); cur = conn.cursor()
-                cur.execute(f"DELETE FROM approach_logs WHERE id = (SELECT max(id) FROM approach_logs WHERE round_date = '{round_date}')")
-                conn.commit(); conn.close()
-                st.session_state.hole_index = max(0, st.session_state.hole_index - 1)
-                st.session_state.last_registered_hole = -1
-                st.rerun()
-    except Exception as e:
-        st.error(f"履歴エラー: {e}")
-
-elif st.session_state.is_finished:
-    st.balloons()
-    st.success(f"🏆 ラウンド終了！")
-    if st.button("新しいラウンドを開始", type="primary"):
-        st.session_state.is_finished = False
-        st.session_state.hole_index = 0
-        st.session_state.last_registered_hole = -1
-        sync_params(); st.rerun()
-
-else:
-    hole_no = current_order[st.session_state.hole_index]
-    par = PAR_DATA.get(hole_no, 4)
-
-    st.markdown(f"""<div class='hole-header'>
-        <span>{hole_no}H</span><span style='color:#ffc107; font-size:1.4rem;'>Par {par}</span><span>{st.session_state.green_type} Green</span>
-    </div>""", unsafe_allow_html=True)
-
-    col1, col2 = st.columns(2)
-    with col1:
-        st.caption("残り距離")
-        dist_raw = st.selectbox("dist", DIST_LIST_DISP, index=2, label_visibility="collapsed")
-    with col2:
-        st.caption("クラブ")
-        club = st.selectbox("club", CLUB_LIST, index=6, label_visibility="collapsed")
-
-    # --- 結果入力エリア ---
-    st.caption("ショット結果")
-    on_status = st.radio("on_check", ["パーオン成功", "失敗"], horizontal=True, label_visibility="collapsed", index=0 if st.session_state.on_status_res == "パーオン成功" else 1)
-    st.session_state.on_status_res = on_status
-    
-    proximity_raw = "NONE"
-    miss_dir_raw, lie_raw = "NONE", "NONE"
-
-    # ONなら「距離感」を聞く
-    if on_status == "パーオン成功":
-        st.caption("ピンまでの距離 (寄せ)")
-        # ★ここも変更済み
-        proximity_raw = st.radio("prox", ["1.5m以内", "3m以内", "5m以内", "6m以上"], horizontal=True, label_visibility="collapsed", index=2)
-    
-    # OFFなら「方向」と「ライ」を聞く
-    else:
-        st.caption("外した方向")
-        miss_dir_raw = st.radio("dir", ["左", "手前", "奥", "右"], horizontal=True, label_visibility="collapsed")
-        st.caption("ライの状態")
-        lie_raw = st.radio("lie", ["フェアウェイ", "ラフ弱", "ラフ強", "バンカー"], horizontal=True, label_visibility="collapsed")
-
-    # --- ペナルティ入力 (共通) ---
-    st.caption("ペナルティ / OB")
-    penalty_raw = st.radio("pen", ["なし", "OB", "1ペナ(池など)"], horizontal=True, label_visibility="collapsed")
+    pending_status()
 
-    with st.form("score_form", clear_on_submit=True):
-        st.markdown("<hr>", unsafe_allow_html=True)
-        st.caption("パット数")
-        putts = st.radio("putts", [0, 1, 2, 3, 4, 5, 6], index=2, horizontal=True, label_visibility="collapsed")
-        st.caption(f"ホールスコア (Par {par})")
-        score_opts = [1, 2, 3, 4, 5, 6, 7, 8, "9~"]
-        score_disp = st.radio("score", score_opts, index=min(len(score_opts)-1, par-1), horizontal=True, label_visibility="collapsed")
-        st.caption("リカバリ数")
-        recovery = st.radio("recovery", [0, 1, 2, 3, 4, 5, 6], index=0, horizontal=True, label_visibility="collapsed")
+    # --- 🔧 デバッグ (DEBUG_PANEL=1 または ?debug=1 で開いたときだけ表示) ---
+    if get_bool("DEBUG_PANEL") or st.session_state.debug:
+        debug_panel()
 
-        st.markdown("<div class='btn-reg'>", unsafe_allow_html=True)
-        submitted = st.form_submit_button("登録 ➡ 次のホールへ")
-        st.markdown("</div>", unsafe_allow_html=True)
+# --- 📄 ページ ---
+page = st.navigation([
+    st.Page(INPUT_PAGE, title="入力", icon="⛳", default=True),
+    st.Page(HISTORY_PAGE, title="履歴", icon="📝"),
+    st.Page(ROUNDS_PAGE, title="ラウンド一覧", icon="🏌️"),
+    st.Page(ANALYTICS_PAGE, title="分析", icon="📊"),
+])
+page.run()
 
-        if submitted:
-            if st.session_state.last_registered_hole == hole_no:
-                st.warning(f"⚠️ {hole_no}Hは既に登録済みです。次のホールへ進みます。")
-                time.sleep(1)
-                next_hole() 
-            else:
-                try:
-                    final_score = 9 if score_disp == "9~" else int(score_disp)
-                    conn = get_connection(); cur = conn.cursor()
-                    
-                    cur.execute("""
-                        INSERT INTO approach_logs 
-                        (round_date, course_name, hole_no, par, dist_range, club, is_green_on, miss_dir, lie_type, recovery_strokes, hole_score, green_type, putts, proximity, penalty)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        round_date, st.session_state.course_name, hole_no, par, 
-                        DIST_MAP.get(dist_raw), club, 
-                        (on_status=="パーオン成功"), 
-                        DIR_MAP.get(miss_dir_raw), LIE_MAP.get(lie_raw), 
-                        recovery, final_score, st.session_state.green_type, putts,
-                        PROXIMITY_MAP.get(proximity_raw), PENALTY_MAP.get(penalty_raw)
-                    ))
-                    
-                    conn.commit(); cur.close(); conn.close()
-                    
-                    st.toast(f"✅ {hole_no}H 登録完了", icon="⛳")
-                    st.session_state.last_registered_hole = hole_no
-                    time.sleep(0.5)
-                    next_hole() 
-                except Exception as e:
-                    st.error(f"エラー: {e}")
\ No newline at end of file
+# 全体の描き直しにかかった時間 (フラグメントだけの描き直しは各フラグメントで記録)
+get_telemetry().record("rerun", "app", time.perf_counter() - _script_started)
+get_telemetry().record("rerun", f"page:{page.title}", time.perf_counter() - _script_started)
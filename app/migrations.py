@@ -0,0 +1,238 @@
+import threading
+import time
+
+import psycopg2
+
+import aggregates
+import categories
+import courses
+import summaries
+from rounds import DEFAULT_PLAYER
+from db import get_connection
+from telemetry import execute
+
+# ==========================================
+# 🗂 スキーママイグレーション
+# ==========================================
+# 適用済みのバージョンを schema_migrations に記録し、未適用のものだけを
+# 番号順に流す。何度起動しても同じ結果になる (冪等)。
+# 新しい変更は末尾に (バージョン, 名前, SQL) を追加すること。既存の番号は書き換えない。
+
+MIGRATIONS = [
+    (1, "create approach_logs", """
+        CREATE TABLE IF NOT EXISTS approach_logs (
+            id SERIAL PRIMARY KEY,
+            round_date DATE,
+            course_name TEXT,
+            hole_no INTEGER,
+            par INTEGER,
+            dist_range TEXT,
+            club TEXT,
+            is_green_on BOOLEAN,
+            miss_dir TEXT,
+            lie_type TEXT,
+            recovery_strokes INTEGER,
+            hole_score INTEGER,
+            green_type TEXT,
+            putts INTEGER
+        )
+    """),
+    (2, "add proximity and penalty", """
+        ALTER TABLE approach_logs ADD COLUMN IF NOT EXISTS proximity TEXT;
+        ALTER TABLE approach_logs ADD COLUMN IF NOT EXISTS penalty TEXT;
+    """),
+    (3, "indexes for history, course and club stats", """
+        -- 履歴表示 (WHERE round_date = ? ORDER BY id DESC) と最新1打の削除 (max(id))
+        CREATE INDEX IF NOT EXISTS approach_logs_round_date_id_idx ON approach_logs (round_date, id);
+        -- コース別の推移
+        CREATE INDEX IF NOT EXISTS approach_logs_course_date_idx ON approach_logs (course_name, round_date);
+        -- クラブ × 距離の集計
+        CREATE INDEX IF NOT EXISTS approach_logs_club_dist_idx ON approach_logs (club, dist_range);
+    """),
+    (4, "rounds table and approach_logs.round_id", """
+        CREATE TABLE IF NOT EXISTS rounds (
+            id SERIAL PRIMARY KEY,
+            round_uid UUID NOT NULL UNIQUE,
+            round_date DATE NOT NULL,
+            course_name TEXT,
+            green_type TEXT,
+            start_side TEXT,
+            status TEXT NOT NULL DEFAULT 'playing',
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        ALTER TABLE approach_logs ADD COLUMN IF NOT EXISTS round_id INTEGER REFERENCES rounds (id);
+        -- 既存データは (日付, コース, グリーン) ごとに1ラウンドとして取り込む
+        INSERT INTO rounds (round_uid, round_date, course_name, green_type, status)
+        SELECT md5(concat_ws('|', round_date, course_name, green_type))::uuid,
+               round_date, course_name, green_type, 'finished'
+        FROM approach_logs
+        WHERE round_id IS NULL AND round_date IS NOT NULL
+        GROUP BY round_date, course_name, green_type
+        ORDER BY min(id)
+        ON CONFLICT (round_uid) DO NOTHING;
+        UPDATE approach_logs l SET round_id = r.id
+        FROM rounds r
+        WHERE l.round_id IS NULL
+          AND r.round_uid = md5(concat_ws('|', l.round_date, l.course_name, l.green_type))::uuid;
+        -- ラウンド内の履歴・最新1打の削除
+        CREATE INDEX IF NOT EXISTS approach_logs_round_id_id_idx ON approach_logs (round_id, id);
+    """),
+    (5, "club_dist_stats summary table maintained by triggers", aggregates.migration_sql(aggregates.V5_STATS_KEYS)),
+    (6, "approach_logs_changes for the local mirror", """
+        -- 削除 (D) と更新 (U) された行の id を記録する。ローカルの写しはこれを差分で読む
+        CREATE TABLE IF NOT EXISTS approach_logs_changes (
+            seq BIGSERIAL PRIMARY KEY,
+            log_id INTEGER NOT NULL,
+            op CHAR(1) NOT NULL,
+            changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE OR REPLACE FUNCTION approach_logs_changes_del() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO approach_logs_changes (log_id, op) SELECT id, 'D' FROM old_rows;
+            RETURN NULL;
+        END
+        $$;
+        CREATE OR REPLACE FUNCTION approach_logs_changes_upd() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO approach_logs_changes (log_id, op) SELECT id, 'U' FROM new_rows;
+            RETURN NULL;
+        END
+        $$;
+        DROP TRIGGER IF EXISTS approach_logs_changes_del ON approach_logs;
+        CREATE TRIGGER approach_logs_changes_del AFTER DELETE ON approach_logs
+            REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION approach_logs_changes_del();
+        DROP TRIGGER IF EXISTS approach_logs_changes_upd ON approach_logs;
+        CREATE TRIGGER approach_logs_changes_upd AFTER UPDATE ON approach_logs
+            REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION approach_logs_changes_upd();
+    """),
+    (7, "course catalog (courses, course_holes)", courses.migration_sql()),
+    (8, "players, one row per (round, player, hole) and idempotency keys", f"""
+        CREATE TABLE IF NOT EXISTS players (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        INSERT INTO players (id, name) VALUES (1, '{DEFAULT_PLAYER}') ON CONFLICT DO NOTHING;
+        SELECT setval(pg_get_serial_sequence('players', 'id'), greatest(max(id), 1)) FROM players;
+        -- 既存の行 (と player を指定しない一括取り込み) は既定のプレーヤーのもの。
+        -- 定数の既定値なので表の書き換えもトリガも起きない
+        ALTER TABLE approach_logs ADD COLUMN IF NOT EXISTS player_id INTEGER NOT NULL DEFAULT 1 REFERENCES players (id);
+        ALTER TABLE approach_logs ADD COLUMN IF NOT EXISTS client_key UUID;
+        -- 同じ (ラウンド, プレーヤー, ホール) の行が複数あるのは、v4 で (日付, コース, グリーン) ごとに
+        -- 1ラウンドにまとめた同じ日の別のラウンド (1日 36 ホールなど)。行は消さずに、ホールごとに id 順で
+        -- 2 つ目以降を別のラウンドに分ける (n 番目の行どうしで1ラウンド。uid は元のラウンドと n から決める)
+        CREATE TEMP TABLE round_splits ON COMMIT DROP AS
+        SELECT id, round_id, player_id, dup_no FROM (
+            SELECT id, round_id, player_id,
+                   row_number() OVER (PARTITION BY round_id, player_id, hole_no ORDER BY id) - 1 AS dup_no
+            FROM approach_logs
+            WHERE round_id IS NOT NULL AND hole_no IS NOT NULL
+        ) s
+        WHERE dup_no > 0;
+        INSERT INTO rounds (round_uid, round_date, course_name, green_type, start_side, status)
+        SELECT md5(concat_ws('|', r.round_uid, s.player_id, s.dup_no))::uuid,
+               r.round_date, r.course_name, r.green_type, r.start_side, r.status
+        FROM (
+            SELECT round_id, player_id, dup_no, min(id) AS first_id
+            FROM round_splits GROUP BY round_id, player_id, dup_no
+        ) s
+        JOIN rounds r ON r.id = s.round_id
+        ORDER BY s.first_id
+        ON CONFLICT (round_uid) DO NOTHING;
+        UPDATE approach_logs l SET round_id = n.id
+        FROM round_splits s
+        JOIN rounds o ON o.id = s.round_id
+        JOIN rounds n ON n.round_uid = md5(concat_ws('|', o.round_uid, s.player_id, s.dup_no))::uuid
+        WHERE l.id = s.id;
+        CREATE UNIQUE INDEX IF NOT EXISTS approach_logs_round_player_hole_key
+            ON approach_logs (round_id, player_id, hole_no);
+        CREATE UNIQUE INDEX IF NOT EXISTS approach_logs_client_key ON approach_logs (client_key);
+        -- 集計テーブルをプレーヤー別のキーで作り直す
+        DROP TABLE IF EXISTS club_dist_stats;
+        {aggregates.migration_sql()}
+    """),
+    (9, "enum types for shot attributes", f"""
+        {categories.migration_sql()}
+        -- v8 のトリガ関数は coalesce(club, '') のように '' と比べていて列挙型では動かないので作り直す
+        {aggregates.trigger_sql()}
+    """),
+    (10, "round_summaries maintained by triggers", summaries.migration_sql()),
+]
+
+# 複数プロセスが同時に起動しても1つずつ流れるようにするためのアドバイザリロック番号
+_LOCK_KEY = 7_461_001
+
+
+def applied_versions(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+        cur.execute("SELECT version FROM schema_migrations")
+        versions = {row[0] for row in cur.fetchall()}
+    conn.commit()
+    return versions
+
+
+def migrate(conn):
+    """未適用のマイグレーションを順に適用し、適用したバージョンのリストを返す"""
+    applied = []
+    for version, name, sql in MIGRATIONS:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_KEY,))
+            # ロック待ちの間に別プロセスが適用したかもしれないので、ロック取得後に確認する
+            cur.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+            if cur.fetchone():
+                conn.commit()
+                continue
+        # 1バージョン = 1トランザクション。失敗したらそのバージョンごと巻き戻る
+        execute(conn, f"migration_{version}", sql)
+        execute(
+            conn, "record_migration",
+            "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name),
+        )
+        conn.commit()
+        applied.append(version)
+    return applied
+
+
+_state = {"done": False, "last_attempt": 0.0, "error": None, "applied": []}
+_state_lock = threading.Lock()
+
+
+def ensure_schema(retry_interval=60.0):
+    """プロセス起動後に一度だけマイグレーションを流す。
+
+    DB に繋がらない (圏外など) ときは画面を止めずにエラーを返し、
+    retry_interval 秒経つまでは再試行しない。
+    """
+    if _state["done"]:
+        return None
+    with _state_lock:
+        if _state["done"]:
+            return None
+        if time.monotonic() - _state["last_attempt"] < retry_interval and _state["last_attempt"]:
+            return _state["error"]
+        _state["last_attempt"] = time.monotonic()
+        try:
+            with get_connection() as conn:
+                applied_versions(conn)
+                _state["applied"] = migrate(conn)
+            _state["done"] = True
+            _state["error"] = None
+        except psycopg2.Error as e:
+            _state["error"] = str(e)
+        return _state["error"]
+
+
+def schema_status():
+    return {
+        "latest": MIGRATIONS[-1][0],
+        "applied_this_process": _state["applied"],
+        "done": _state["done"],
+        "error": _state["error"],
+    }
@@ -0,0 +1,301 @@
+import json
+import os
+import threading
+import time
+
+from analytics import CATEGORY_ORDER, SHOT_COLUMNS, LOAD_SHOTS_SQL
+from config import get_secret, get_int, get_bool
+from telemetry import get_telemetry
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc as ipc
+except ImportError:  # pyarrow が無ければミラーは使わずサーバから読む
+    pa = None
+
+# ==========================================
+# 🪞 approach_logs のローカル写し (列指向)
+# ==========================================
+# Arrow IPC ファイル (セグメント) として手元に置き、読むときは memory map する。
+# 同期は差分のみ:
+#   - 新しい行: 前回の最大 id より大きい行 (コミット順と id 順のずれに備えて少し重ねて読む)
+#   - 削除・更新: approach_logs_changes (トリガで記録) の seq が前回より大きいもの
+#     削除は tombstone として除外、更新は行を読み直して新しいセグメントに入れる (後勝ち)
+# セグメントが増えたら1つにまとめ直す (compaction)。
+# 同期できなくても (圏外) 手元の写しで分析画面は表示できる。
+
+SCHEMA = None if pa is None else pa.schema([
+    ("id", pa.int32()), ("round_id", pa.int32()), ("player_id", pa.int32()), ("round_date", pa.date32()),
+    ("course_name", pa.string()), ("hole_no", pa.int16()), ("par", pa.int16()),
+    ("dist_range", pa.string()), ("club", pa.string()), ("is_green_on", pa.bool_()),
+    ("miss_dir", pa.string()), ("lie_type", pa.string()), ("recovery_strokes", pa.int16()),
+    ("hole_score", pa.int16()), ("green_type", pa.string()), ("putts", pa.int16()),
+    ("proximity", pa.string()), ("penalty", pa.string()),
+])
+
+
+def default_dir():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "mirror")
+
+
+class Mirror:
+    def __init__(self, directory, max_segments=20, overlap=500, chunk_size=50_000):
+        self.directory = directory
+        self.max_segments = max_segments
+        self.overlap = overlap
+        self.chunk_size = chunk_size
+        self._lock = threading.RLock()
+        self._last_sync = None
+        self._last_error = None
+        os.makedirs(directory, exist_ok=True)
+        self.meta = self._load_meta()
+
+    # --- メタ情報 ---
+    @property
+    def _meta_path(self):
+        return os.path.join(self.directory, "meta.json")
+
+    def _load_meta(self):
+        try:
+            with open(self._meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+        if meta.get("columns") == SCHEMA.names:
+            return meta
+        # 列の違う古い写し (player_id の無い版など) は捨てて、最初から同期し直す
+        for name in meta.get("segments", []):
+            try:
+                os.remove(self._segment_path(name))
+            except OSError:
+                pass
+        return {"columns": SCHEMA.names, "max_id": 0, "change_seq": 0, "segments": [], "tombstones": [],
+                "has_updates": False, "generation": meta.get("generation", -1) + 1,
+                "next_segment": meta.get("next_segment", 1)}
+
+    def _save_meta(self):
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._meta_path)
+
+    @property
+    def generation(self):
+        """内容が変わるたびに増える番号 (キャッシュのキーに使う)"""
+        return self.meta["generation"]
+
+    # --- セグメント ---
+    def _segment_path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _new_segment_name(self):
+        name = f"segment_{self.meta['next_segment']:06d}.arrow"
+        self.meta["next_segment"] += 1
+        return name
+
+    def _write_segment(self, batches):
+        """RecordBatch を順に書き出し、書いた行数とファイル名を返す (0 行ならファイルを作らない)"""
+        name = self._new_segment_name()
+        path = self._segment_path(name)
+        rows = 0
+        writer = None
+        try:
+            for batch in batches:
+                if batch.num_rows == 0:
+                    continue
+                if writer is None:
+                    writer = ipc.new_file(path, SCHEMA)
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows, (name if rows else None)
+
+    def _read_segments(self):
+        tables = [
+            ipc.open_file(pa.memory_map(self._segment_path(name), "r")).read_all()
+            for name in self.meta["segments"]
+        ]
+        return pa.concat_tables(tables) if tables else SCHEMA.empty_table()
+
+    @staticmethod
+    def _to_batch(rows):
+        columns = list(zip(*rows))
+        return pa.record_batch(
+            [pa.array(col, type=field.type) for col, field in zip(columns, SCHEMA)], schema=SCHEMA,
+        )
+
+    def _fetch_batches(self, cur, sql, params):
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(self.chunk_size)
+            if not rows:
+                return
+            yield self._to_batch(rows)
+
+    # --- 同期 ---
+    def sync(self, conn):
+        """サーバとの差分を取り込み、(追加行, 削除行, 更新行) を返す"""
+        with self._lock, get_telemetry().timed("execute", "mirror_sync") as info:
+            low = max(0, self.meta["max_id"] - self.overlap)
+            known = self._known_ids_from(low)
+            with conn.cursor() as cur:
+                # 削除・更新の記録 (新しい行より先に読み、取りこぼしを防ぐ)
+                cur.execute(
+                    "SELECT seq, log_id, op FROM approach_logs_changes WHERE seq > %s ORDER BY seq",
+                    (self.meta["change_seq"],),
+                )
+                changes = cur.fetchall()
+            deleted = {log_id for _, log_id, op in changes if op == "D"}
+            updated = {log_id for _, log_id, op in changes if op == "U"} - deleted
+
+            with conn.cursor(name="mirror_sync") as cur:
+                cur.itersize = self.chunk_size
+                batches = self._fetch_batches(
+                    cur,
+                    f"SELECT * FROM ({LOAD_SHOTS_SQL}) s WHERE id > %s OR id = ANY(%s) ORDER BY id",
+                    (low, sorted(updated)),
+                )
+                filtered = (self._drop_known(b, known, updated) for b in batches)
+                added, segment = self._write_segment(filtered)
+            conn.rollback()
+
+            if segment:
+                self.meta["segments"].append(segment)
+                # 更新で読み直した行は古い id なので max_id は動かない
+                seg = ipc.open_file(pa.memory_map(self._segment_path(segment), "r")).read_all()
+                self.meta["max_id"] = max(self.meta["max_id"], pc.max(seg["id"]).as_py() or 0)
+            if updated:
+                self.meta["has_updates"] = True
+            if deleted:
+                self.meta["tombstones"] = sorted(set(self.meta["tombstones"]) | deleted)
+            if changes:
+                self.meta["change_seq"] = changes[-1][0]
+            changed = bool(segment or deleted)
+            if changed:
+                self.meta["generation"] += 1
+            self._save_meta()
+            if len(self.meta["segments"]) > self.max_segments:
+                self.compact()
+            self._last_sync = time.time()
+            info["rows"] = added
+            return added, len(deleted), len(updated)
+
+    def _known_ids_from(self, low):
+        """手元にある id のうち low より大きいもの (重ね読みした分を除くため)"""
+        if not self.meta["segments"] or low >= self.meta["max_id"]:
+            return pa.array([], type=pa.int32())
+        # id 列だけを memory map から読むので全セグメントを見ても軽い
+        ids = self._read_segments()["id"]
+        return ids.filter(pc.greater(ids, low)).combine_chunks()
+
+    @staticmethod
+    def _drop_known(batch, known, updated):
+        """重ね読みで既に持っている行は落とす (更新で読み直した行は残す)"""
+        if len(known) == 0:
+            return batch
+        keep = pc.or_(
+            pc.invert(pc.is_in(batch["id"], value_set=known)),
+            pc.is_in(batch["id"], value_set=pa.array(sorted(updated), type=pa.int32())),
+        )
+        return batch.filter(keep)
+
+    def sync_if_due(self, get_connection, interval=30.0):
+        """前回の同期から interval 秒以上経っていれば同期する。失敗してもエラーを記録するだけ"""
+        if self._last_sync and time.time() - self._last_sync < interval:
+            return None
+        try:
+            with get_connection() as conn:
+                self.sync(conn)
+            self._last_error = None
+        except Exception as e:  # 圏外でも手元の写しは読める
+            self._last_error = str(e)
+            self._last_sync = time.time()
+        return self._last_error
+
+    # --- 読み出し ---
+    def read_table(self):
+        """tombstone と更新 (後勝ち) を反映した Arrow テーブル (memory map 上のゼロコピー)"""
+        with self._lock:
+            table = self._read_segments()
+            tombstones = self.meta["tombstones"]
+            has_updates = self.meta["has_updates"]
+        if tombstones:
+            table = table.filter(pc.invert(pc.is_in(table["id"], value_set=pa.array(tombstones, type=pa.int32()))))
+        if has_updates:
+            # 同じ id は後のセグメントにあるものが新しい
+            idx = pa.array(range(len(table)), type=pa.int64())
+            last = (
+                pa.table({"id": table["id"], "idx": idx})
+                .group_by("id").aggregate([("idx", "max")])["idx_max"]
+            )
+            table = table.take(last.take(pc.sort_indices(last)))
+        return table
+
+    def read_frame(self):
+        """属性の列は辞書型にしてから渡し、1行ずつ Python の文字列を作らずにカテゴリ型で受け取る"""
+        table = self.read_table()
+        for col in CATEGORY_ORDER:
+            i = table.schema.get_field_index(col)
+            table = table.set_column(i, col, pc.dictionary_encode(table[col]))
+        return table.to_pandas(date_as_object=False)[list(SHOT_COLUMNS)]
+
+    def compact(self):
+        """セグメントを1つにまとめ、tombstone と重複を解消する"""
+        with self._lock:
+            table = self.read_table()
+            old = list(self.meta["segments"])
+            rows, segment = self._write_segment(table.combine_chunks().to_batches(self.chunk_size))
+            self.meta["segments"] = [segment] if segment else []
+            self.meta["tombstones"] = []
+            self.meta["has_updates"] = False
+            self.meta["generation"] += 1
+            self._save_meta()
+            for name in old:
+                try:
+                    os.remove(self._segment_path(name))
+                except OSError:
+                    pass
+            return rows
+
+    def stats(self):
+        with self._lock:
+            sizes = sum(
+                os.path.getsize(self._segment_path(n)) for n in self.meta["segments"]
+                if os.path.exists(self._segment_path(n))
+            )
+            return {
+                "segments": len(self.meta["segments"]),
+                "bytes": sizes,
+                "max_id": self.meta["max_id"],
+                "change_seq": self.meta["change_seq"],
+                "tombstones": len(self.meta["tombstones"]),
+                "generation": self.meta["generation"],
+                "last_sync": self._last_sync,
+                "last_error": self._last_error,
+            }
+
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def get_mirror():
+    """プロセス共通のミラーを返す。無効 (MIRROR_ENABLED=0 / pyarrow なし) なら None"""
+    global _mirror
+    if pa is None or not get_bool("MIRROR_ENABLED", True):
+        return None
+    if _mirror is None:
+        with _mirror_lock:
+            if _mirror is None:
+                _mirror = Mirror(
+                    get_secret("MIRROR_DIR", default_dir()),
+                    max_segments=get_int("MIRROR_MAX_SEGMENTS", 20),
+                    overlap=get_int("MIRROR_OVERLAP_IDS", 500),
+                    chunk_size=get_int("ANALYTICS_CHUNK_ROWS", 50_000),
+                )
+    return _mirror
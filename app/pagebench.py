@@ -0,0 +1,187 @@
+"""ページごとの起動時間とメモリ (コールドスタートから初回表示まで)
+
+    python pagebench.py                                 # 4ページを1回ずつ (合成 50 ラウンドの SQLite)
+    python pagebench.py --repeat 3 --sessions 5 --out pages.json
+    python pagebench.py --backend postgres --pages views/input_page.py
+
+ページごとに新しいプロセスを起動し、AppTest で main.py をそのページから開く。
+    cold_start_s  プロセスの起動 (インタプリタの起動を含む) から初回の描画が終わるまで
+    rerun_ms      同じセッションの2回目の描画 (モジュールは読み込み済み)
+    rss_mb        初回の描画後のプロセスの常駐メモリ
+    session_kb    同じプロセスでさらに --sessions 個のセッションで同じページを開いたときの、1セッションあたりの
+                  Python のメモリの増分 (tracemalloc。セッション状態・画面の要素・キャッシュ)
+    heavy         読み込まれた重いモジュール (入力画面では空であること)
+保存先は既定で一時ディレクトリの SQLite (DB がなくても測れる)。ジャーナル・写し・推移も一時ファイルにする。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+# ==========================================
+# 🚀 ページごとの起動時間・メモリ
+# ==========================================
+# 親プロセスは子プロセスを起動して結果を集めるだけ。子プロセスは測定の邪魔にならないよう、
+# このファイルの先頭では標準ライブラリしか読み込まない。
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+MAIN = os.path.join(APP_DIR, "main.py")
+PAGES = ("views/input_page.py", "views/history_page.py", "views/rounds_page.py", "views/analytics_page.py")
+HEAVY_MODULES = ("pandas", "numpy", "pyarrow", "analytics", "aggregates", "strokes_gained", "storage", "mirror")
+
+
+def _rss_mb():
+    """現在の常駐メモリ (Linux は /proc、ほかはピーク値で代用)"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _open_page(page, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(MAIN, default_timeout=timeout)
+    if page != PAGES[0]:
+        at.switch_page(page)
+    return at.run()
+
+
+def measure_page(spec):
+    """子プロセスで1ページを測る (spec["spawned_at"] は親が起動した時刻)"""
+    import tracemalloc
+
+    sys.path.insert(0, APP_DIR)
+    at = _open_page(spec["page"], spec["timeout"])
+    cold = time.time() - spec["spawned_at"]
+    errors = [str(e.value) for e in at.exception] + [str(e.value) for e in at.error]
+    rss = _rss_mb()
+    heavy = [m for m in HEAVY_MODULES if m in sys.modules]
+
+    t0 = time.perf_counter()
+    at.run()
+    rerun = time.perf_counter() - t0
+
+    # 追加のセッションは開いたまま持っておき、増えた分をセッション数で割る
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    sessions = [_open_page(spec["page"], spec["timeout"]) for _ in range(spec["sessions"])]
+    grown = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return {
+        "cold_start_s": cold,
+        "rerun_ms": rerun * 1000,
+        "rss_mb": rss,
+        "rss_after_sessions_mb": _rss_mb(),
+        "session_kb": grown / max(1, len(sessions)) / 1024,
+        "modules": len(sys.modules),
+        "heavy": heavy,
+        "errors": errors[:5],
+    }
+
+
+def seed_sqlite(path, n_rounds, seed):
+    """合成ラウンドを SQLite に入れる (履歴・分析のページが空の表で測られないように)"""
+    sys.path.insert(0, APP_DIR)
+    from constants import LOG_COLUMNS
+    from rounds import DEFAULT_PLAYER, ROUND_FIELDS
+    from storage import SQLiteStorage
+    from synth import generate
+
+    storage = SQLiteStorage(path)
+    storage.ensure_schema()
+    items = []
+    for row in generate(n_rounds * 18, seed=seed).to_dict("records"):
+        r = {f: row.get(f) for f in ROUND_FIELDS}
+        r["status"] = "finished"
+        items.append(({c: row[c] for c in LOG_COLUMNS}, r, DEFAULT_PLAYER, str(uuid.uuid4())))
+    storage.upsert_holes(items)
+    return len(items)
+
+
+def run_page(page, args, ctx):
+    runs = []
+    for _ in range(args.repeat):
+        with ctx.Pool(1) as pool:
+            spec = {"page": page, "sessions": args.sessions, "timeout": args.timeout, "spawned_at": time.time()}
+            runs.append(pool.apply(measure_page, (spec,)))
+    med = lambda key: round(statistics.median(r[key] for r in runs), 3)
+    return {
+        "page": page,
+        "cold_start_s": med("cold_start_s"),
+        "cold_start_max_s": round(max(r["cold_start_s"] for r in runs), 3),
+        "rerun_ms": round(med("rerun_ms"), 1),
+        "rss_mb": med("rss_mb"),
+        "session_kb": round(med("session_kb"), 1),
+        "modules": runs[-1]["modules"],
+        "heavy": runs[-1]["heavy"],
+        "errors": runs[-1]["errors"],
+    }
+
+
+def print_page(r):
+    print(
+        f"{os.path.basename(r['page']):<20} 初回表示 {r['cold_start_s']:>6.2f} s (最大 {r['cold_start_max_s']:.2f}) | "
+        f"再描画 {r['rerun_ms']:>7.1f} ms | RSS {r['rss_mb']:>6.1f} MB | 1セッション {r['session_kb']:>7.1f} KB | "
+        f"重いモジュール {', '.join(r['heavy']) or 'なし'}"
+    )
+    for e in r["errors"][:3]:
+        print(f"       ⚠️ {e[:160]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ページごとのコールドスタート時間とメモリ")
+    parser.add_argument("--pages", nargs="+", default=list(PAGES), help="測るページ (main.py からの相対パス)")
+    parser.add_argument("--repeat", type=int, default=1, help="ページごとの試行回数 (中央値を出す)")
+    parser.add_argument("--sessions", type=int, default=3, help="1セッションあたりのメモリを測るために追加で開くセッション数")
+    parser.add_argument("--rounds", type=int, default=50, help="SQLite に入れる合成ラウンド数")
+    parser.add_argument("--backend", choices=("sqlite", "postgres"), default="sqlite")
+    parser.add_argument("--timeout", type=float, default=60.0, help="1回の描画のタイムアウト (秒)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="結果を書き出す JSON のパス")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="golf_pages_") as workdir:
+        # 子プロセスは環境変数を引き継ぐ
+        os.environ.update({
+            "STORAGE_BACKEND": args.backend,
+            "JOURNAL_PATH": os.path.join(workdir, "journal.db"),
+            "TRENDS_PATH": os.path.join(workdir, "trends.json"),
+            "MIRROR_DIR": os.path.join(workdir, "mirror"),
+            "SLOW_QUERY_LOG": os.path.join(workdir, "slow_queries.jsonl"),
+        })
+        if args.backend == "sqlite":
+            os.environ["SQLITE_PATH"] = os.path.join(workdir, "golf.db")
+            holes = seed_sqlite(os.environ["SQLITE_PATH"], args.rounds, args.seed)
+            print(f"合成 {args.rounds} ラウンド ({holes} ホール) の SQLite で測ります")
+        ctx = multiprocessing.get_context("spawn")
+        for page in args.pages:
+            result = run_page(page, args, ctx)
+            print_page(result)
+            results.append(result)
+    if args.out:
+        meta = {"timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"), "args": vars(args),
+                "python": sys.version.split()[0]}
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "pages": results}, f, ensure_ascii=False, indent=2)
+        print(f"→ {args.out}")
+    if any(r["errors"] for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
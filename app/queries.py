@@ -0,0 +1,338 @@
+import re
+import threading
+import weakref
+from datetime import date
+from typing import NamedTuple, Optional
+
+import psycopg2
+import psycopg2.errors
+from psycopg2.extras import execute_batch
+
+from config import get_bool
+from constants import LOG_COLUMNS, SHOT_COLUMNS
+from summaries import SUMMARY_COLUMNS
+from telemetry import get_telemetry
+
+# ==========================================
+# 🗂 データアクセス (名前付きの準備済みステートメント)
+# ==========================================
+# よく使う文 (ホールの登録・ラウンド一覧・履歴・最新1打の削除・分析の読み込み) はここで1回だけ宣言する。
+# 接続ごとに最初の実行で PREPARE し、2回目からは EXECUTE で同じ文 (実行計画) を使い回す。
+# 値はすべてパラメータで渡し、SQL の文字列には埋め込まない。
+# 準備済みの文はサーバのセッション (= プールの接続) に属するので、どの接続で準備したかをここで覚えておく。
+# PgBouncer などのトランザクション単位のプーラ越しでは接続ごとの PREPARE が使えないので、
+# DB_PREPARE=0 でふつうの実行に切り替える (文の宣言と型付きの結果はそのまま)。
+# SQLite 側は sqlite3 モジュールが接続ごとにコンパイル済みの文をキャッシュするので、ここでは扱わない。
+
+_PARAM = re.compile(r"%\((\w+)\)s")
+
+
+class Statement:
+    """名前付きの文。SQL は %(name)s で書き、PREPARE 用には $1, $2 ... に置き換えておく
+
+    row に NamedTuple を渡すと、その型の行で返す。SQL の中で % は使わない (EXECUTE の組み立てと衝突する)。
+    """
+
+    def __init__(self, name, sql, row=None):
+        self.name = name
+        self.sql = sql
+        self.row = row
+        self.params = tuple(dict.fromkeys(_PARAM.findall(sql)))
+        body = _PARAM.sub(lambda m: f"${self.params.index(m.group(1)) + 1}", sql)
+        self.prepare_sql = f"PREPARE {name} AS {body}"
+        self.execute_sql = f"EXECUTE {name}" + (f" ({', '.join(['%s'] * len(self.params))})" if self.params else "")
+
+    def args(self, params):
+        return tuple(params[p] for p in self.params)
+
+
+# --- 結果の行 ---
+class RoundRow(NamedTuple):
+    id: int
+    round_uid: str
+    round_date: date
+    course_name: Optional[str]
+    green_type: Optional[str]
+    start_side: Optional[str]
+    status: str
+    holes: int
+    score: Optional[int]
+    over_par: Optional[int]
+    putts: Optional[int]
+    gir: Optional[int]
+    penalties: Optional[int]
+    front_score: Optional[int]
+    back_score: Optional[int]
+
+
+class HistoryRow(NamedTuple):
+    id: int
+    hole_no: int
+    club: Optional[str]
+    on_off: str
+    proximity: Optional[str]
+    penalty: Optional[str]
+    score: Optional[int]
+
+
+class TrendHoleRow(NamedTuple):
+    round_uid: str
+    status: str
+    player: str
+    hole_no: int
+    club: Optional[str]
+    hole_score: Optional[int]
+    par: Optional[int]
+    putts: Optional[int]
+    is_green_on: Optional[bool]
+    penalty: Optional[str]
+
+
+# --- ホールの登録 (フラッシャ) ---
+# 既存のラウンド・プレーヤーには触らない (DO UPDATE だと行ロックを取り、同じラウンドの他の端末を待たせる)。
+# 登録済みなら後半の SELECT が返す。同時に別の端末が登録した直後は、この文のスナップショットには
+# 見えないことがあるので、呼び出し側で *_ID の文で引き直す。
+INSERT_ROUND = Statement("insert_round", """
+    WITH ins AS (
+        INSERT INTO rounds (round_uid, round_date, course_name, green_type, start_side, status)
+        VALUES (%(round_uid)s, %(round_date)s, %(course_name)s, %(green_type)s, %(start_side)s, %(status)s)
+        ON CONFLICT (round_uid) DO NOTHING
+        RETURNING id
+    )
+    SELECT id FROM ins
+    UNION ALL
+    SELECT id FROM rounds WHERE round_uid = %(round_uid)s
+""")
+
+ROUND_ID = Statement("round_id", "SELECT id FROM rounds WHERE round_uid = %(round_uid)s")
+
+FINISH_ROUND = Statement(
+    "finish_round", "UPDATE rounds SET status = 'finished' WHERE round_uid = %(round_uid)s AND status <> 'finished'",
+)
+
+INSERT_PLAYER = Statement("insert_player", """
+    WITH ins AS (
+        INSERT INTO players (name) VALUES (%(name)s)
+        ON CONFLICT (name) DO NOTHING
+        RETURNING id
+    )
+    SELECT id FROM ins
+    UNION ALL
+    SELECT id FROM players WHERE name = %(name)s
+""")
+
+PLAYER_ID = Statement("player_id", "SELECT id FROM players WHERE name = %(name)s")
+
+UPSERT_HOLE = Statement("upsert_hole", f"""
+    INSERT INTO approach_logs ({', '.join(LOG_COLUMNS)}, round_id, player_id, client_key)
+    VALUES ({', '.join(f"%({c})s" for c in LOG_COLUMNS)}, %(round_id)s, %(player_id)s, %(client_key)s)
+    ON CONFLICT (round_id, player_id, hole_no) DO UPDATE SET
+        {', '.join(f"{c} = EXCLUDED.{c}" for c in LOG_COLUMNS)},
+        client_key = EXCLUDED.client_key
+    -- 同じキーの再送なら何もしない (更新トリガも変更記録も動かない)
+    WHERE approach_logs.client_key IS DISTINCT FROM EXCLUDED.client_key
+""")
+
+# --- 一覧・履歴・削除 ---
+# ホール数・スコアはラウンドのサマリ (summaries.py) の1行を読む
+LIST_ROUNDS = Statement("list_rounds", """
+    SELECT r.id, r.round_uid::text AS round_uid, r.round_date, r.course_name,
+           r.green_type, r.start_side, r.status, coalesce(s.holes, 0) AS holes, s.score,
+           s.over_par, s.putts, s.gir, s.penalties, s.front_score, s.back_score
+    FROM rounds r
+    LEFT JOIN round_summaries s
+      ON s.round_id = r.id AND s.player_id = (SELECT id FROM players WHERE name = %(player)s)
+    WHERE (%(before)s::int IS NULL OR r.id < %(before)s)
+    ORDER BY r.id DESC
+    LIMIT %(limit)s
+""", row=RoundRow)
+
+ROUND_HISTORY = Statement("round_history", """
+    SELECT l.id, l.hole_no, l.club,
+           CASE WHEN l.is_green_on THEN 'ON' ELSE 'OFF' END AS on_off,
+           l.proximity, l.penalty, l.hole_score AS score
+    FROM approach_logs l
+    WHERE l.round_id = (SELECT id FROM rounds WHERE round_uid = %(uid)s)
+      AND l.player_id = (SELECT id FROM players WHERE name = %(player)s)
+      AND (%(before)s::int IS NULL OR l.id < %(before)s)
+    ORDER BY l.id DESC
+    LIMIT %(limit)s
+""", row=HistoryRow)
+
+DELETE_LATEST = Statement("delete_latest", """
+    DELETE FROM approach_logs
+    WHERE id = (
+        SELECT max(id) FROM approach_logs
+        WHERE round_id = (SELECT id FROM rounds WHERE round_uid = %(uid)s)
+          AND player_id = (SELECT id FROM players WHERE name = %(player)s)
+    )
+    RETURNING hole_no
+""")
+
+REOPEN_ROUND = Statement(
+    "reopen_round", "UPDATE rounds SET status = 'playing' WHERE round_uid = %(uid)s AND status <> 'playing'",
+)
+
+RECENT_ROUND_HOLES = Statement("recent_round_holes", """
+    WITH ranked AS (
+        SELECT k.round_id, k.player_id, r.status,
+               row_number() OVER (PARTITION BY k.player_id, r.status = 'finished'
+                                  ORDER BY r.round_date DESC, r.id DESC) AS rn
+        FROM (SELECT DISTINCT round_id, player_id FROM approach_logs WHERE round_id IS NOT NULL) k
+        JOIN rounds r ON r.id = k.round_id
+    )
+    SELECT r.round_uid::text AS round_uid, r.status, p.name AS player,
+           l.hole_no, l.club, l.hole_score, l.par, l.putts, l.is_green_on, l.penalty
+    FROM ranked k
+    JOIN rounds r ON r.id = k.round_id
+    JOIN players p ON p.id = k.player_id
+    JOIN approach_logs l ON l.round_id = k.round_id AND l.player_id = k.player_id
+    WHERE k.rn <= CASE WHEN k.status = 'finished' THEN %(depth)s::int ELSE %(open_limit)s::int END
+    ORDER BY r.round_date, r.id, l.hole_no
+""", row=TrendHoleRow)
+
+# --- 分析の読み込み ---
+LOAD_SHOTS_SQL = f"SELECT {', '.join(SHOT_COLUMNS)} FROM approach_logs"
+
+LOAD_SHOTS = Statement("load_shots", LOAD_SHOTS_SQL)
+
+ROUND_SUMMARIES = Statement("round_summaries", f"""
+    SELECT r.id AS round_id, r.round_uid::text AS round_uid, r.round_date, r.course_name, r.status,
+           {', '.join(f"s.{c}" for c, _ in SUMMARY_COLUMNS)}
+    FROM round_summaries s JOIN rounds r ON r.id = s.round_id
+    WHERE s.player_id = (SELECT id FROM players WHERE name = %(player)s) AND s.holes > 0
+    ORDER BY r.round_date, r.id
+""")
+
+# ラウンド × プレーヤーの書き込みバージョン (ホールを書くたびにトリガが updated_at を進める) と日付・コース
+ROUND_VERSIONS = Statement("round_versions", """
+    SELECT s.round_id, s.player_id, s.updated_at::text || '/' || s.holes AS version, r.round_date, r.course_name
+    FROM round_summaries s JOIN rounds r ON r.id = s.round_id
+    WHERE s.holes > 0
+""")
+
+CLUB_DIST_STATS = Statement("club_dist_stats", """
+    SELECT p.name AS player, s.*
+    FROM club_dist_stats s JOIN players p ON p.id = s.player_id
+    WHERE s.shots > 0
+""")
+
+
+# --- 実行 ---
+# 接続 -> 準備済みの文の名前の集合。None は「サーバ側の状態が分からない」(次に使うときに DEALLOCATE ALL から)。
+# 接続は借りている1スレッドしか使わないので、ロックは辞書そのものの出し入れだけ守る。
+_prepared = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+_stats = {"prepares": 0, "executes": 0, "resets": 0}
+_enabled = None
+
+# 準備済みの文が無い (プーラに接続を入れ替えられた)・既にある・結果の型が変わった
+# (別のプロセスがマイグレーションで列の型を変えた) ときは、その接続の文を作り直す
+_STALE_ERRORS = (
+    psycopg2.errors.InvalidSqlStatementName,
+    psycopg2.errors.DuplicatePreparedStatement,
+    psycopg2.errors.FeatureNotSupported,
+)
+
+
+def prepare_enabled():
+    global _enabled
+    if _enabled is None:
+        _enabled = get_bool("DB_PREPARE", True)
+    return _enabled
+
+
+def _prepare(cur, stmt):
+    conn = cur.connection
+    with _lock:
+        names = _prepared.get(conn, set())
+    if names is None:
+        cur.execute("DEALLOCATE ALL")
+        names = set()
+        _stats["resets"] += 1
+    if stmt.name not in names:
+        cur.execute(stmt.prepare_sql)
+        names = names | {stmt.name}
+        _stats["prepares"] += 1
+    with _lock:
+        _prepared[conn] = names
+
+
+def _execute(cur, stmt, params):
+    if not prepare_enabled():
+        cur.execute(stmt.sql, params)
+        return
+    try:
+        _prepare(cur, stmt)
+        cur.execute(stmt.execute_sql, stmt.args(params))
+    except _STALE_ERRORS:
+        # このトランザクションは呼び出し側で失敗として扱い、次に使うときに準備し直す
+        with _lock:
+            _prepared[cur.connection] = None
+        raise
+    _stats["executes"] += 1
+
+
+def fetch_all(conn, stmt, params=None):
+    """stmt を実行して全行を返す (stmt.row があればその型の行)"""
+    with get_telemetry().timed("execute", stmt.name, stmt.sql) as info, conn.cursor() as cur:
+        _execute(cur, stmt, params or {})
+        rows = cur.fetchall()
+        info["rows"] = len(rows)
+    return [stmt.row._make(r) for r in rows] if stmt.row else rows
+
+
+def fetch_one(conn, stmt, params=None):
+    """stmt を実行して最初の行を返す (無ければ None)"""
+    with get_telemetry().timed("execute", stmt.name, stmt.sql) as info, conn.cursor() as cur:
+        _execute(cur, stmt, params or {})
+        row = cur.fetchone()
+        info["rows"] = cur.rowcount
+    if row is None:
+        return None
+    return stmt.row._make(row) if stmt.row else row
+
+
+def execute(conn, stmt, params=None):
+    """stmt を実行して影響行数を返す"""
+    with get_telemetry().timed("execute", stmt.name, stmt.sql) as info, conn.cursor() as cur:
+        _execute(cur, stmt, params or {})
+        info["rows"] = cur.rowcount
+        return cur.rowcount
+
+
+def execute_many(conn, stmt, params_list, page_size=100):
+    """params_list の各行で stmt を実行する (page_size 行ずつ1往復にまとめる)"""
+    params_list = list(params_list)
+    with get_telemetry().timed("execute", stmt.name, stmt.sql) as info, conn.cursor() as cur:
+        if not prepare_enabled():
+            execute_batch(cur, stmt.sql, params_list, page_size=page_size)
+        elif params_list:
+            try:
+                _prepare(cur, stmt)
+                execute_batch(cur, stmt.execute_sql, [stmt.args(p) for p in params_list], page_size=page_size)
+            except _STALE_ERRORS:
+                with _lock:
+                    _prepared[cur.connection] = None
+                raise
+            _stats["executes"] += len(params_list)
+        info["rows"] = len(params_list)
+    return len(params_list)
+
+
+def fetch_frame(conn, stmt, params=None):
+    """stmt を実行して DataFrame で返す (分析の読み込み用。pandas はここで読み込む)"""
+    import pandas as pd
+
+    with get_telemetry().timed("execute", stmt.name, stmt.sql) as info, conn.cursor() as cur:
+        _execute(cur, stmt, params or {})
+        columns = [d[0] for d in cur.description]
+        df = pd.DataFrame.from_records(cur.fetchall(), columns=columns)
+        info["rows"] = len(df)
+    return df
+
+
+def stats():
+    with _lock:
+        connections = sum(1 for names in _prepared.values() if names)
+    return {"prepared": prepare_enabled(), "connections": connections, **_stats}
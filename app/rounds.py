@@ -0,0 +1,85 @@
+import uuid
+
+from queries import (
+    INSERT_ROUND, ROUND_ID, FINISH_ROUND, INSERT_PLAYER, PLAYER_ID,
+    LIST_ROUNDS, ROUND_HISTORY, DELETE_LATEST, REOPEN_ROUND, RECENT_ROUND_HOLES,
+    fetch_all, fetch_one, execute,
+)
+
+# ==========================================
+# 🏌️ ラウンド
+# ==========================================
+# ラウンドは端末側で生成した round_uid で識別する。圏外で開始したラウンドでも
+# ジャーナルのフラッシュ時に rounds へ upsert して round_id を解決できる。
+# 一覧・履歴はキーセット (カーソル) ページングなので、1ページのコストは
+# 履歴全体の件数に依存しない。
+# 同じラウンドを複数のプレーヤー (端末) が同時に記録する。既存のラウンド・プレーヤーの
+# 行は読むだけで更新しない (終了時の状態変更のみ) ので、書き込み同士が行ロックで待たない。
+# SQL は queries.py の名前付きの文 (接続ごとに準備して使い回す)。
+
+ROUND_FIELDS = ("round_uid", "round_date", "course_name", "green_type", "start_side", "status")
+
+DEFAULT_PLAYER = "自分"
+
+# ラウンド一覧の1ページの件数 (暖機で先読みするキャッシュのキーにも使う)
+ROUNDS_PAGE_SIZE = 10
+
+
+def new_round_uid():
+    return str(uuid.uuid4())
+
+
+def upsert_rounds(conn, rounds):
+    """ラウンドを登録 (既存なら終了の状態だけ反映) し、{round_uid: round_id} を返す"""
+    merged = {}
+    for r in rounds:
+        prev = merged.get(r["round_uid"])
+        if prev is None or r["status"] == "finished":
+            merged[r["round_uid"]] = r
+    ids = {}
+    # 1回のフラッシュに含まれるラウンドは高々数件なので、1件ずつ準備済みの文で登録する
+    for uid, r in merged.items():
+        params = {f: r[f] for f in ROUND_FIELDS}
+        row = fetch_one(conn, INSERT_ROUND, params) or fetch_one(conn, ROUND_ID, params)
+        ids[uid] = row[0]
+        if r["status"] == "finished":
+            execute(conn, FINISH_ROUND, params)
+    return ids
+
+
+def upsert_players(conn, names):
+    """プレーヤーを登録 (既存ならそのまま) し、{name: player_id} を返す"""
+    ids = {}
+    for name in sorted(set(names)):
+        row = fetch_one(conn, INSERT_PLAYER, {"name": name}) or fetch_one(conn, PLAYER_ID, {"name": name})
+        ids[name] = row[0]
+    return ids
+
+
+def list_rounds(conn, player=DEFAULT_PLAYER, before_id=None, limit=20):
+    """新しい順にラウンドを1ページ分返す (ホール数・スコアは player の分)。次ページは最後の id を before_id に渡す"""
+    return fetch_all(conn, LIST_ROUNDS, {"player": player, "before": before_id, "limit": limit})
+
+
+def round_history(conn, round_uid, player=DEFAULT_PLAYER, before_id=None, limit=30):
+    """ラウンド内の player のショットを新しい順に1ページ分返す ((round_id, id) の索引を使う)"""
+    return fetch_all(conn, ROUND_HISTORY, {"uid": round_uid, "player": player, "before": before_id, "limit": limit})
+
+
+def delete_latest(conn, round_uid, player=DEFAULT_PLAYER):
+    """ラウンド内の player の最新1打を削除し、消したホール番号を返す (無ければ None)。
+
+    終了済みのラウンドはプレー中に戻す。
+    """
+    row = fetch_one(conn, DELETE_LATEST, {"uid": round_uid, "player": player})
+    if row:
+        execute(conn, REOPEN_ROUND, {"uid": round_uid})
+    return row[0] if row else None
+
+
+def recent_round_holes(conn, depth=20, open_limit=5):
+    """プレーヤーごとに直近 depth 件の終了ラウンドと open_limit 件のプレー中ラウンドのホールを古い順に返す
+
+    推移 (trends.py) の状態を作り直すときだけ使う。
+    """
+    return fetch_all(conn, RECENT_ROUND_HOLES, {"depth": depth, "open_limit": open_limit})
@@ -0,0 +1,136 @@
+from datetime import date
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from cache import get_cache
+from courses import DEFAULT_COURSE
+from journal import get_journal
+from rounds import DEFAULT_PLAYER, new_round_uid
+
+# ==========================================
+# 🔄 セッション状態と画面共通の操作
+# ==========================================
+# main.py (サイドバー) と各ページ (views/) から使う。入力画面の起動を軽くするため、
+# ここでは pandas・分析・保存先 (storage) を読み込まない。
+
+# ページ (main.py からの相対パス)
+INPUT_PAGE = "views/input_page.py"
+HISTORY_PAGE = "views/history_page.py"
+ROUNDS_PAGE = "views/rounds_page.py"
+ANALYTICS_PAGE = "views/analytics_page.py"
+
+
+def init_state():
+    if 'hole_index' not in st.session_state:
+        st.session_state.hole_index = int(st.query_params.get("hole", 0))
+    if 'course_name' not in st.session_state:
+        st.session_state.course_name = st.query_params.get("course", DEFAULT_COURSE)
+    if 'start_side' not in st.session_state:
+        st.session_state.start_side = st.query_params.get("start", "OUT (1→18)")
+    if 'green_type' not in st.session_state:
+        st.session_state.green_type = st.query_params.get("green", "A")
+    if 'player' not in st.session_state:
+        st.session_state.player = st.query_params.get("player", DEFAULT_PLAYER)
+    # まとめて送信モード (電波の弱いコース向け。ハーフ・ラウンド終了時に1回で送る)
+    if 'buffer_mode' not in st.session_state:
+        st.session_state.buffer_mode = st.query_params.get("buffer") == "1"
+    # 次の描画で出すトースト (登録直後に描き直すため、その場では出さない)
+    if 'flash' not in st.session_state:
+        st.session_state.flash = []
+    # ホールごとの冪等キー (登録が済むまで、再送・二度押しでも同じキーを使う)
+    if 'submit_keys' not in st.session_state:
+        st.session_state.submit_keys = {}
+    if 'on_status_res' not in st.session_state:
+        st.session_state.on_status_res = "パーオン成功"
+    if 'is_finished' not in st.session_state:
+        st.session_state.is_finished = False
+    if 'round_uid' not in st.session_state:
+        st.session_state.round_uid = st.query_params.get("round") or new_round_uid()
+    if 'round_date' not in st.session_state:
+        st.session_state.round_date = date.fromisoformat(st.query_params.get("date", date.today().isoformat()))
+    # キーセットページング用のカーソル (ページごとの before_id を積む)
+    if 'history_cursors' not in st.session_state:
+        st.session_state.history_cursors = [None]
+    if 'rounds_cursors' not in st.session_state:
+        st.session_state.rounds_cursors = [None]
+    # ?debug=1 はページを移ると URL から消えるので、開いたときの値を覚えておく
+    if 'debug' not in st.session_state:
+        st.session_state.debug = st.query_params.get("debug") == "1"
+
+
+def sync_params():
+    st.query_params["hole"] = str(st.session_state.hole_index)
+    st.query_params["course"] = st.session_state.course_name
+    st.query_params["start"] = st.session_state.start_side
+    st.query_params["green"] = st.session_state.green_type
+    st.query_params["round"] = st.session_state.round_uid
+    st.query_params["date"] = st.session_state.round_date.isoformat()
+    st.query_params["player"] = st.session_state.player
+    st.query_params["buffer"] = "1" if st.session_state.buffer_mode else "0"
+
+
+def cached_query(name, params, query, scope=None):
+    """読み取りクエリ (query(storage)) を書き込みバージョン付きキャッシュ経由で実行する"""
+    # 履歴・一覧・分析のページからだけ呼ばれる (storage は pandas ごとここで初めて読み込む)
+    from storage import get_storage
+
+    return get_cache().get_or_load(name, params, lambda: query(get_storage()), scope=scope)
+
+
+def start_new_round():
+    st.session_state.round_uid = new_round_uid()
+    st.session_state.hole_index = 0
+    st.session_state.is_finished = False
+    st.session_state.on_status_res = "パーオン成功"
+    st.session_state.history_cursors = [None]
+
+
+def current_round(status="playing"):
+    return {
+        "round_uid": st.session_state.round_uid, "round_date": st.session_state.round_date,
+        "course_name": st.session_state.course_name, "green_type": st.session_state.green_type,
+        "start_side": st.session_state.start_side, "status": status,
+    }
+
+
+def resume_round(r):
+    """一覧で選んだラウンド (queries.RoundRow) の続きから入力する"""
+    st.session_state.round_uid = r.round_uid
+    st.session_state.round_date = r.round_date
+    st.session_state.course_name = r.course_name or st.session_state.course_name
+    st.session_state.green_type = r.green_type or st.session_state.green_type
+    st.session_state.start_side = r.start_side or st.session_state.start_side
+    done = int(r.holes or 0) + get_journal().pending_count(r.round_uid)
+    st.session_state.is_finished = r.status == "finished"
+    st.session_state.hole_index = min(17, done)
+    st.session_state.on_status_res = "パーオン成功"
+    st.session_state.history_cursors = [None]
+
+
+def release_held():
+    """保留中のホールを送信に回す"""
+    released = get_journal().release(st.session_state.round_uid, st.session_state.player)
+    if released:
+        st.session_state.flash.append((f"📤 {released} ホール分をまとめて送信します", "📤"))
+    return released
+
+
+def on_buffer_mode_change():
+    # モードを切ったら保留分はそのまま送る
+    if not st.session_state.buffer_mode:
+        release_held()
+    sync_params()
+
+
+def go_input():
+    """入力画面へ移る (クエリパラメータは入力画面が描くときに付け直す)"""
+    st.switch_page(INPUT_PAGE)
+
+
+def rerun(scope="app"):
+    """scope="fragment" なら実行中のフラグメントだけを描き直す (全体の実行中に呼ばれたら全体)"""
+    ctx = get_script_run_ctx()
+    if scope == "fragment" and not (ctx and ctx.fragment_ids_this_run):
+        scope = "app"
+    st.rerun(scope=scope)
@@ -0,0 +1,443 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date
+
+import pandas as pd
+
+from aggregates import STATS_KEYS, STATS_COLUMNS, load_club_dist_stats
+from analytics import SHOT_COLUMNS, LOAD_SHOTS_SQL, prepare, iter_shots
+from config import get_secret, storage_backend
+from constants import LOG_COLUMNS
+from db import get_connection, pool_stats
+from queries import UPSERT_HOLE, ROUND_SUMMARIES, ROUND_VERSIONS, RoundRow, HistoryRow, TrendHoleRow, execute_many, fetch_frame
+from queries import stats as statement_stats
+from rounds import (
+    ROUND_FIELDS, DEFAULT_PLAYER, upsert_rounds, upsert_players,
+    list_rounds, round_history, delete_latest, recent_round_holes,
+)
+from summaries import SUMMARY_COLUMNS, sqlite_sql as summaries_sqlite_sql
+from telemetry import get_telemetry
+
+# ==========================================
+# 💾 ストレージ (PostgreSQL / SQLite)
+# ==========================================
+# 画面とフラッシャが使う読み書き (ホールの upsert・一覧・履歴・最新1打の削除・分析の読み込み) を
+# 1つの口にまとめ、STORAGE_BACKEND で実装を選ぶ。
+#   postgres (既定): これまでどおりコネクションプール経由で DB_* のサーバへ (文は queries.py で宣言・準備する)
+#   sqlite: 端末内のファイル (WAL)。ネットワークなしで動く1人用・試験用
+# どちらも返す型は同じにしてある (一覧・履歴・推移用のホールは queries.py の行の型、分析は同じ列名・型の DataFrame)。
+
+INSERT_COLUMNS = LOG_COLUMNS
+
+
+class Storage:
+    """ストレージの共通の口。items は [(ショット行, ラウンド情報 or None, プレーヤー, 冪等キー)]"""
+
+    name = None
+    # サーバ越しか (True ならローカル写し・カタログの更新確認を使う)
+    remote = False
+
+    def ensure_schema(self):
+        """スキーマを用意する。失敗したらエラー文字列、成功なら None"""
+        raise NotImplementedError
+
+    def upsert_holes(self, items):
+        """ホールを1トランザクションで upsert し、書いた件数を返す"""
+        raise NotImplementedError
+
+    def list_rounds(self, player=DEFAULT_PLAYER, before_id=None, limit=20):
+        raise NotImplementedError
+
+    def round_history(self, round_uid, player=DEFAULT_PLAYER, before_id=None, limit=30):
+        raise NotImplementedError
+
+    def delete_latest(self, round_uid, player=DEFAULT_PLAYER):
+        """player の最新1打を削除してコミットし、消したホール番号を返す (無ければ None)"""
+        raise NotImplementedError
+
+    def recent_round_holes(self, depth=20, open_limit=5):
+        """プレーヤーごとの直近のラウンドのホール (推移の作り直し用)"""
+        raise NotImplementedError
+
+    def iter_shots(self, chunk_size=50_000, round_ids=None):
+        """全ショット (round_ids を渡すとそのラウンドのショット) を chunk_size 行ずつ、prepare 済みの DataFrame で返す"""
+        raise NotImplementedError
+
+    def round_summaries(self, player=DEFAULT_PLAYER):
+        """player のラウンドのサマリ (1ラウンド1行、日付順) の DataFrame"""
+        raise NotImplementedError
+
+    def round_versions(self):
+        """ラウンド × プレーヤーの書き込みバージョンと日付・コースの DataFrame (ホールのあるものだけ)"""
+        raise NotImplementedError
+
+    def club_dist_stats(self):
+        raise NotImplementedError
+
+    def stats(self):
+        return {"backend": self.name}
+
+
+# --- PostgreSQL ---
+class PostgresStorage(Storage):
+    name = "postgres"
+    remote = True
+
+    def ensure_schema(self):
+        from migrations import ensure_schema
+
+        return ensure_schema()
+
+    def upsert_holes(self, items):
+        with get_connection() as conn:
+            with get_telemetry().timed("execute", "upsert_hole_batch") as info:
+                # ラウンド・プレーヤーとショットは同じトランザクションで書く
+                round_ids = upsert_rounds(conn, [r for _, r, _, _ in items if r])
+                player_ids = upsert_players(conn, [p for _, _, p, _ in items])
+                values = [
+                    {**{c: row[c] for c in INSERT_COLUMNS},
+                     "round_id": round_ids.get(r["round_uid"]) if r else None,
+                     "player_id": player_ids[player], "client_key": key}
+                    for row, r, player, key in items
+                ]
+                execute_many(conn, UPSERT_HOLE, values)
+                conn.commit()
+                info["rows"] = len(values)
+        return len(values)
+
+    def list_rounds(self, player=DEFAULT_PLAYER, before_id=None, limit=20):
+        with get_connection() as conn:
+            return list_rounds(conn, player, before_id=before_id, limit=limit)
+
+    def round_history(self, round_uid, player=DEFAULT_PLAYER, before_id=None, limit=30):
+        with get_connection() as conn:
+            return round_history(conn, round_uid, player, before_id=before_id, limit=limit)
+
+    def delete_latest(self, round_uid, player=DEFAULT_PLAYER):
+        with get_connection() as conn:
+            hole = delete_latest(conn, round_uid, player)
+            conn.commit()
+        return hole
+
+    def recent_round_holes(self, depth=20, open_limit=5):
+        with get_connection() as conn:
+            return recent_round_holes(conn, depth, open_limit)
+
+    def iter_shots(self, chunk_size=50_000, round_ids=None):
+        with get_connection() as conn:
+            yield from iter_shots(conn, chunk_size, round_ids)
+
+    def round_summaries(self, player=DEFAULT_PLAYER):
+        with get_connection() as conn:
+            return fetch_frame(conn, ROUND_SUMMARIES, {"player": player})
+
+    def round_versions(self):
+        with get_connection() as conn:
+            return fetch_frame(conn, ROUND_VERSIONS)
+
+    def club_dist_stats(self):
+        with get_connection() as conn:
+            return load_club_dist_stats(conn)
+
+    def stats(self):
+        return {"backend": self.name, "pool": pool_stats(), "statements": statement_stats()}
+
+
+# --- SQLite ---
+def default_sqlite_path():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "golf.db")
+
+
+SQLITE_SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS players (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+    INSERT OR IGNORE INTO players (id, name) VALUES (1, '{DEFAULT_PLAYER}');
+    CREATE TABLE IF NOT EXISTS rounds (
+        id INTEGER PRIMARY KEY,
+        round_uid TEXT NOT NULL UNIQUE,
+        round_date TEXT NOT NULL,
+        course_name TEXT,
+        green_type TEXT,
+        start_side TEXT,
+        status TEXT NOT NULL DEFAULT 'playing',
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS approach_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        round_date TEXT,
+        course_name TEXT,
+        hole_no INTEGER,
+        par INTEGER,
+        dist_range TEXT,
+        club TEXT,
+        is_green_on INTEGER,
+        miss_dir TEXT,
+        lie_type TEXT,
+        recovery_strokes INTEGER,
+        hole_score INTEGER,
+        green_type TEXT,
+        putts INTEGER,
+        proximity TEXT,
+        penalty TEXT,
+        round_id INTEGER REFERENCES rounds (id),
+        player_id INTEGER NOT NULL DEFAULT 1 REFERENCES players (id),
+        client_key TEXT UNIQUE
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS approach_logs_round_player_hole_key
+        ON approach_logs (round_id, player_id, hole_no);
+    CREATE INDEX IF NOT EXISTS approach_logs_round_id_id_idx ON approach_logs (round_id, id);
+    {summaries_sqlite_sql()}
+"""
+
+SQLITE_UPSERT_SQL = f"""
+    INSERT INTO approach_logs ({', '.join(INSERT_COLUMNS)}, round_id, player_id, client_key)
+    VALUES ({', '.join('?' * (len(INSERT_COLUMNS) + 3))})
+    ON CONFLICT (round_id, player_id, hole_no) DO UPDATE SET
+        {', '.join(f"{c} = excluded.{c}" for c in INSERT_COLUMNS)},
+        client_key = excluded.client_key
+    WHERE approach_logs.client_key IS NOT excluded.client_key
+"""
+
+# PostgreSQL 側 (rounds.py / aggregates.py) と同じ列名で返す
+SQLITE_LIST_ROUNDS_SQL = """
+    SELECT r.id, r.round_uid, r.round_date, r.course_name, r.green_type, r.start_side, r.status,
+           coalesce(s.holes, 0) AS holes, s.score,
+           s.over_par, s.putts, s.gir, s.penalties, s.front_score, s.back_score
+    FROM rounds r
+    LEFT JOIN round_summaries s
+      ON s.round_id = r.id AND s.player_id = (SELECT id FROM players WHERE name = :player)
+    WHERE (:before IS NULL OR r.id < :before)
+    ORDER BY r.id DESC
+    LIMIT :limit
+"""
+
+SQLITE_ROUND_HISTORY_SQL = """
+    SELECT l.id, l.hole_no, l.club,
+           CASE WHEN l.is_green_on THEN 'ON' ELSE 'OFF' END AS on_off,
+           l.proximity, l.penalty, l.hole_score AS score
+    FROM approach_logs l
+    WHERE l.round_id = (SELECT id FROM rounds WHERE round_uid = :uid)
+      AND l.player_id = (SELECT id FROM players WHERE name = :player)
+      AND (:before IS NULL OR l.id < :before)
+    ORDER BY l.id DESC
+    LIMIT :limit
+"""
+
+SQLITE_RECENT_ROUND_HOLES_SQL = """
+    WITH ranked AS (
+        SELECT k.round_id, k.player_id, r.status,
+               row_number() OVER (PARTITION BY k.player_id, r.status = 'finished'
+                                  ORDER BY r.round_date DESC, r.id DESC) AS rn
+        FROM (SELECT DISTINCT round_id, player_id FROM approach_logs WHERE round_id IS NOT NULL) k
+        JOIN rounds r ON r.id = k.round_id
+    )
+    SELECT r.round_uid, r.status, p.name AS player,
+           l.hole_no, l.club, l.hole_score, l.par, l.putts, l.is_green_on, l.penalty
+    FROM ranked k
+    JOIN rounds r ON r.id = k.round_id
+    JOIN players p ON p.id = k.player_id
+    JOIN approach_logs l ON l.round_id = k.round_id AND l.player_id = k.player_id
+    WHERE k.rn <= CASE WHEN k.status = 'finished' THEN :depth ELSE :open_limit END
+    ORDER BY r.round_date, r.id, l.hole_no
+"""
+
+SQLITE_ROUND_SUMMARIES_SQL = f"""
+    SELECT r.id AS round_id, r.round_uid, r.round_date, r.course_name, r.status,
+           {', '.join(f"s.{c}" for c, _ in SUMMARY_COLUMNS)}
+    FROM round_summaries s JOIN rounds r ON r.id = s.round_id
+    WHERE s.player_id = (SELECT id FROM players WHERE name = :player) AND s.holes > 0
+    ORDER BY r.round_date, r.id
+"""
+
+SQLITE_ROUND_VERSIONS_SQL = """
+    SELECT s.round_id, s.player_id, s.updated_at || '/' || s.holes AS version, r.round_date, r.course_name
+    FROM round_summaries s JOIN rounds r ON r.id = s.round_id
+    WHERE s.holes > 0
+"""
+
+# キーの並びは集計テーブル (STATS_KEYS) と同じ。GROUP BY は列番号で指す (1列目はプレーヤー名)
+SQLITE_CLUB_DIST_STATS_SQL = f"""
+    SELECT p.name AS player,
+           {', '.join(f"l.{k}" if k == "player_id" else f"coalesce(l.{k}, '') AS {k}" for k in STATS_KEYS)},
+           {', '.join(f"sum({expr}) AS {col}" for col, expr in STATS_COLUMNS)}
+    FROM approach_logs l JOIN players p ON p.id = l.player_id
+    GROUP BY {', '.join(str(i + 2) for i in range(len(STATS_KEYS)))}
+"""
+
+
+class SQLiteStorage(Storage):
+    name = "sqlite"
+    remote = False
+
+    def __init__(self, path):
+        self.path = path
+        # 1端末・1人用なので接続は1本をロックで順に使う (WAL なのでフラッシュ中も読み取りは待たない)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._schema_error = None
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _read(self, name, sql, params):
+        with get_telemetry().timed("execute", name, sql) as info, self._lock:
+            df = pd.read_sql(sql, self._db, params=params)
+            info["rows"] = len(df)
+        return df
+
+    def _rows(self, name, sql, params, row):
+        with get_telemetry().timed("execute", name, sql) as info, self._lock:
+            rows = [row._make(r) for r in self._db.execute(sql, params)]
+            info["rows"] = len(rows)
+        return rows
+
+    def ensure_schema(self):
+        try:
+            with self._lock:
+                self._db.executescript(SQLITE_SCHEMA)
+            self._schema_error = None
+        except sqlite3.Error as e:
+            self._schema_error = str(e)
+        return self._schema_error
+
+    def _upsert_rounds(self, db, rounds):
+        merged = {}
+        for r in rounds:
+            if r["round_uid"] not in merged or r["status"] == "finished":
+                merged[r["round_uid"]] = r
+        db.executemany(
+            f"INSERT OR IGNORE INTO rounds ({', '.join(ROUND_FIELDS)}) VALUES ({', '.join('?' * len(ROUND_FIELDS))})",
+            [tuple(str(r[f]) if f == "round_date" else r[f] for f in ROUND_FIELDS) for r in merged.values()],
+        )
+        db.executemany(
+            "UPDATE rounds SET status = 'finished' WHERE round_uid = ? AND status <> 'finished'",
+            [(uid,) for uid, r in merged.items() if r["status"] == "finished"],
+        )
+        return {uid: db.execute("SELECT id FROM rounds WHERE round_uid = ?", (uid,)).fetchone()[0] for uid in merged}
+
+    def _upsert_players(self, db, names):
+        names = sorted(set(names))
+        db.executemany("INSERT OR IGNORE INTO players (name) VALUES (?)", [(n,) for n in names])
+        return {n: db.execute("SELECT id FROM players WHERE name = ?", (n,)).fetchone()[0] for n in names}
+
+    def upsert_holes(self, items):
+        with get_telemetry().timed("execute", "upsert_hole_batch", SQLITE_UPSERT_SQL) as info:
+            with self._transaction() as db:
+                round_ids = self._upsert_rounds(db, [r for _, r, _, _ in items if r])
+                player_ids = self._upsert_players(db, [p for _, _, p, _ in items])
+                values = [
+                    tuple(str(row[c]) if c == "round_date" else row[c] for c in INSERT_COLUMNS)
+                    + (round_ids.get(r["round_uid"]) if r else None, player_ids[player], key)
+                    for row, r, player, key in items
+                ]
+                db.executemany(SQLITE_UPSERT_SQL, values)
+            info["rows"] = len(values)
+        return len(values)
+
+    def list_rounds(self, player=DEFAULT_PLAYER, before_id=None, limit=20):
+        rows = self._rows(
+            "list_rounds", SQLITE_LIST_ROUNDS_SQL, {"player": player, "before": before_id, "limit": limit}, RoundRow,
+        )
+        return [r._replace(round_date=date.fromisoformat(r.round_date)) for r in rows]
+
+    def round_history(self, round_uid, player=DEFAULT_PLAYER, before_id=None, limit=30):
+        return self._rows(
+            "round_history", SQLITE_ROUND_HISTORY_SQL,
+            {"uid": round_uid, "player": player, "before": before_id, "limit": limit}, HistoryRow,
+        )
+
+    def delete_latest(self, round_uid, player=DEFAULT_PLAYER):
+        with get_telemetry().timed("execute", "delete_latest") as info, self._transaction() as db:
+            row = db.execute("""
+                SELECT l.id, l.hole_no, l.round_id FROM approach_logs l
+                WHERE l.round_id = (SELECT id FROM rounds WHERE round_uid = ?)
+                  AND l.player_id = (SELECT id FROM players WHERE name = ?)
+                ORDER BY l.id DESC LIMIT 1
+            """, (round_uid, player)).fetchone()
+            info["rows"] = 0
+            if row is None:
+                return None
+            db.execute("DELETE FROM approach_logs WHERE id = ?", (row[0],))
+            # 終了済みのラウンドはプレー中に戻す
+            db.execute("UPDATE rounds SET status = 'playing' WHERE id = ? AND status <> 'playing'", (row[2],))
+            info["rows"] = 1
+        return row[1]
+
+    def recent_round_holes(self, depth=20, open_limit=5):
+        return self._rows(
+            "recent_round_holes", SQLITE_RECENT_ROUND_HOLES_SQL, {"depth": depth, "open_limit": open_limit},
+            TrendHoleRow,
+        )
+
+    def iter_shots(self, chunk_size=50_000, round_ids=None):
+        # 読み取り中に書き込みを止めないよう、チャンクごとに id で区切って読む
+        sql = f"{LOAD_SHOTS_SQL} WHERE id > :last_id ORDER BY id LIMIT :limit"
+        params = {"limit": chunk_size}
+        if round_ids is not None:
+            sql = (f"{LOAD_SHOTS_SQL} WHERE id > :last_id"
+                   " AND round_id IN (SELECT value FROM json_each(:ids)) ORDER BY id LIMIT :limit")
+            params["ids"] = json.dumps([int(i) for i in round_ids])
+        last_id = 0
+        while True:
+            with get_telemetry().timed("execute", "iter_shots", sql) as info, self._lock:
+                rows = self._db.execute(sql, {**params, "last_id": last_id}).fetchall()
+                info["rows"] = len(rows)
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield prepare(pd.DataFrame.from_records(rows, columns=SHOT_COLUMNS))
+
+    def round_summaries(self, player=DEFAULT_PLAYER):
+        return self._read("round_summaries", SQLITE_ROUND_SUMMARIES_SQL, {"player": player})
+
+    def round_versions(self):
+        return self._read("round_versions", SQLITE_ROUND_VERSIONS_SQL, None)
+
+    def club_dist_stats(self):
+        df = self._read("club_dist_stats", SQLITE_CLUB_DIST_STATS_SQL, None)
+        return df[df["shots"] > 0]
+
+    def stats(self):
+        with self._lock:
+            shots = self._db.execute("SELECT count(*) FROM approach_logs").fetchone()[0]
+            rounds = self._db.execute("SELECT count(*) FROM rounds").fetchone()[0]
+        return {"backend": self.name, "path": self.path, "shots": shots, "rounds": rounds,
+                "schema_error": self._schema_error}
+
+
+BACKENDS = {
+    "postgres": lambda: PostgresStorage(),
+    "sqlite": lambda: SQLiteStorage(get_secret("SQLITE_PATH", default_sqlite_path())),
+}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """プロセス共通のストレージを返す (初回のみ生成)。STORAGE_BACKEND = postgres / sqlite"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                backend = storage_backend()
+                if backend not in BACKENDS:
+                    raise ValueError(f"STORAGE_BACKEND が不正です: {backend} (postgres / sqlite)")
+                _storage = BACKENDS[backend]()
+    return _storage
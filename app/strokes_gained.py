@@ -0,0 +1,347 @@
+"""ストローク・ゲインド (基準打数との差で、どのショットで何打失ったかを見る)
+
+    python strokes_gained.py derive sg_baseline.json    # 自分の履歴から基準打数を作る
+    SG_BASELINE=sg_baseline.json                        # 作った基準を使う (既定は組み込みの基準)
+
+1行 = 1ホールのアプローチ (2打目) なので、1ホールを次の3つに分ける。
+    アプローチ: 残り距離の基準 - 1 - ペナルティ打数 - 打った後の基準 (パーオンなら寄せの距離のパット、外せばライのアプローチ)
+    グリーン周り: 外したライの基準 - (リカバリ数 + パット数)   ※パーオンしなかったホールのみ
+    パット: 寄せの距離の基準 - パット数                           ※パーオンしたホールのみ
+3つの合計 = 残り距離の基準 - (その後に打った打数) になる。
+"""
+import argparse
+import hashlib
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+
+from config import get_secret
+from constants import CLUB_LIST, DIST_MAP, LIE_MAP, PROXIMITY_MAP, PENALTY_MAP, PENALTY_STROKES
+
+# ==========================================
+# 📉 ストローク・ゲインド
+# ==========================================
+# 基準打数は区分 (距離帯・ライ・寄せの距離・ペナルティ) ごとの小さな float 配列で持ち、
+# カテゴリ列のコードで一度に引き当てる (全ショットを1回のベクトル演算で計算する)。
+# 結果はラウンド × プレーヤーごとに (クラブ, 距離帯) 単位の部分集計としてキャッシュし、
+# 書き込みバージョン (round_summaries.updated_at) の変わったラウンドだけを計算し直す。
+# シーズン全体はその部分集計を足すだけ。
+
+DISTS = list(DIST_MAP.values())
+LIES = list(LIE_MAP.values())
+PROXIMITIES = list(PROXIMITY_MAP.values())
+PENALTIES = list(PENALTY_MAP.values())
+
+# 組み込みの基準 (ホールアウトまでの平均打数。ツアー統計をアマチュアの区分に合わせて丸めたもの)
+DEFAULT_BASELINE = {
+    # 残り距離 (アプローチを打つ前)
+    "approach": {"under_100": 2.75, "100-120": 2.83, "120-140": 2.88, "140-160": 2.95,
+                 "160-180": 3.02, "over_180": 3.15},
+    # パーオンしなかったときのライ (グリーン周りから)
+    "around": {"FAIRWAY": 2.45, "ROUGH_LIGHT": 2.55, "ROUGH_DEEP": 2.75, "BUNKER": 2.65, "NONE": 2.60},
+    # パーオンしたときのピンまでの距離 (パット)
+    "putt": {"UNDER_1.5": 1.10, "UNDER_3.0": 1.50, "UNDER_5.0": 1.78, "OVER_6.0": 1.98, "NONE": 1.85},
+}
+
+# 部分集計の列 (すべて足し合わせられる)
+PARTIAL_COLUMNS = ("holes", "sg_approach", "sg_around", "around_n", "sg_putting", "putting_n", "sg_total")
+PARTIAL_KEYS = ["round_id", "player_id", "club", "dist_range"]
+ROUND_KEYS = ["round_id", "player_id"]
+
+
+class Baseline:
+    """区分ごとの基準打数 (float32 配列)。未知の区分は NaN"""
+
+    def __init__(self, approach, around, putt, source="default"):
+        self.approach = np.array([approach.get(k, np.nan) for k in DISTS], dtype=np.float32)
+        self.around = np.array([around.get(k, np.nan) for k in LIES], dtype=np.float32)
+        self.putt = np.array([putt.get(k, np.nan) for k in PROXIMITIES], dtype=np.float32)
+        self.penalty = np.array([PENALTY_STROKES[k] for k in PENALTIES], dtype=np.float32)
+        self.source = source
+        digest = hashlib.sha1(b"".join(a.tobytes() for a in (self.approach, self.around, self.putt)))
+        self.version = digest.hexdigest()[:12]
+
+    def to_dict(self):
+        return {
+            "approach": dict(zip(DISTS, self.approach.astype(np.float64).round(3).tolist())),
+            "around": dict(zip(LIES, self.around.astype(np.float64).round(3).tolist())),
+            "putt": dict(zip(PROXIMITIES, self.putt.astype(np.float64).round(3).tolist())),
+        }
+
+    @classmethod
+    def default(cls):
+        return cls(**DEFAULT_BASELINE)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        # ファイルに無い区分は組み込みの基準で補う
+        merged = {k: {**DEFAULT_BASELINE[k], **data.get(k, {})} for k in DEFAULT_BASELINE}
+        return cls(**merged, source=path)
+
+    @classmethod
+    def from_history(cls, df, min_samples=30):
+        """prepare 済みの全履歴から基準を作る (サンプルが min_samples 未満の区分は組み込みの基準)"""
+        putts = df["putts"].astype("float64")
+        after = df["recovery_strokes"].astype("float64").fillna(0) + putts
+        pen = _lookup(df["penalty"], PENALTIES, np.array([PENALTY_STROKES[k] for k in PENALTIES]))
+        gir = df["is_green_on"].to_numpy()
+
+        def means(values, keys, mask):
+            grouped = pd.Series(values[mask]).groupby(keys[mask].astype("object").to_numpy()).agg(["mean", "size"])
+            return {k: round(float(m), 3) for k, (m, n) in grouped.iterrows() if n >= min_samples}
+
+        return cls(
+            approach={**DEFAULT_BASELINE["approach"],
+                      **means((1 + pen + after).to_numpy(), df["dist_range"], putts.notna().to_numpy())},
+            around={**DEFAULT_BASELINE["around"], **means(after.to_numpy(), df["lie_type"], ~gir & putts.notna().to_numpy())},
+            putt={**DEFAULT_BASELINE["putt"], **means(putts.to_numpy(), df["proximity"], gir & putts.notna().to_numpy())},
+            source="history",
+        )
+
+
+def _lookup(series, keys, values):
+    """カテゴリ列を keys の位置の values に引き当てる (辞書参照はカテゴリ数ぶんだけ)"""
+    series = series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype("category")
+    pos = {k: i for i, k in enumerate(keys)}
+    table = np.append(
+        np.array([values[pos[c]] if c in pos else np.nan for c in series.cat.categories], dtype=np.float64),
+        np.nan,
+    )
+    # 欠損のコード -1 は末尾の NaN を指す
+    return table[series.cat.codes.to_numpy()]
+
+
+def shot_strokes_gained(df, baseline):
+    """prepare 済みのショットに sg_approach / sg_around / sg_putting / sg_total を付けて返す"""
+    gir = df["is_green_on"].to_numpy()
+    putts = df["putts"].astype("float64").to_numpy()
+    recovery = df["recovery_strokes"].astype("float64").fillna(0).to_numpy()
+    start = _lookup(df["dist_range"], DISTS, baseline.approach)
+    around = _lookup(df["lie_type"], LIES, baseline.around)
+    putt = _lookup(df["proximity"], PROXIMITIES, baseline.putt)
+    pen = np.nan_to_num(_lookup(df["penalty"], PENALTIES, baseline.penalty))
+
+    after = np.where(gir, putt, around)
+    out = df.copy()
+    out["sg_approach"] = start - 1 - pen - after
+    out["sg_around"] = np.where(gir, np.nan, around - (recovery + putts))
+    out["sg_putting"] = np.where(gir, putt - putts, np.nan)
+    out["sg_total"] = start - (1 + pen + recovery + putts)
+    return out
+
+
+def round_partials(df, baseline):
+    """(ラウンド, プレーヤー, クラブ, 距離帯) ごとの足し合わせられる部分集計"""
+    sg = shot_strokes_gained(df, baseline)
+    frame = pd.DataFrame({
+        "round_id": sg["round_id"],
+        "player_id": sg["player_id"],
+        "club": sg["club"],
+        "dist_range": sg["dist_range"],
+        "holes": 1,
+        "sg_approach": sg["sg_approach"],
+        "sg_around": sg["sg_around"],
+        "around_n": sg["sg_around"].notna().astype("int64"),
+        "sg_putting": sg["sg_putting"],
+        "putting_n": sg["sg_putting"].notna().astype("int64"),
+        "sg_total": sg["sg_total"],
+    })
+    # 計算できないホール (パット未入力など) は合計に入れない
+    frame = frame[sg["sg_total"].notna()]
+    return frame.groupby(PARTIAL_KEYS, observed=True, dropna=False).sum(min_count=1).reset_index()
+
+
+def _fold(acc, part):
+    """部分集計を足し込む (チャンクごとにカテゴリの集合が違いうるので、キーは素の値に戻してから合算する)"""
+    if acc is None or not len(acc):
+        return part
+    if not len(part):
+        return acc
+    out = pd.concat([acc, part], ignore_index=True)
+    out = out.astype({k: "object" for k in PARTIAL_KEYS if isinstance(out[k].dtype, pd.CategoricalDtype)})
+    return out.groupby(PARTIAL_KEYS, observed=True, dropna=False, sort=False).sum(min_count=1).reset_index()
+
+
+def _round_keys(df):
+    return pd.MultiIndex.from_arrays([df[k].to_numpy(dtype="int64") for k in ROUND_KEYS], names=ROUND_KEYS)
+
+
+class RoundCache:
+    """ラウンド × プレーヤーごとの部分集計のキャッシュ
+
+    鍵は書き込みバージョン (round_summaries の updated_at とホール数。ホールの登録・更新・削除と同じ
+    トランザクションでトリガが進める)。ショットの行を読み比べずに、変わったラウンドが分かる。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baseline_version = None
+        self._versions = {}
+        self._partials = pd.DataFrame(columns=PARTIAL_KEYS + list(PARTIAL_COLUMNS))
+        self._stats = {"updates": 0, "rounds_computed": 0, "rounds_reused": 0}
+
+    def update(self, versions, load_chunks, baseline):
+        """versions ({(round_id, player_id): バージョン}) から、キャッシュを最新にして部分集計を返す
+
+        load_chunks(round_ids) はそのラウンドのショットのチャンクを返す関数。バージョンの変わった (新しい)
+        ラウンドのショットだけを読み、1チャンクずつ部分集計に畳み込んでキャッシュに足す。
+        versions に無くなったラウンドは落とす。変わったラウンドが無ければショットは読まない。
+        versions はショットより先に読んでおくこと (間に書き込みがあっても、次回はバージョンが違うので計算し直しになる)。
+        """
+        with self._lock:
+            if baseline.version != self._baseline_version:
+                # 基準が変われば全ラウンドが変わる
+                self._versions = {}
+                self._partials = self._partials.iloc[0:0]
+                self._baseline_version = baseline.version
+            changed = {k for k, v in versions.items() if self._versions.get(k) != v}
+            fresh = None
+            if changed:
+                wanted = pd.MultiIndex.from_tuples(sorted(changed), names=ROUND_KEYS)
+                # 同じラウンドの他のプレーヤーの行も来るので、キーで絞る
+                for chunk in load_chunks(sorted({round_id for round_id, _ in changed})):
+                    chunk = chunk[chunk["round_id"].notna()]
+                    rows = chunk[_round_keys(chunk).isin(wanted)]
+                    if len(rows):
+                        fresh = _fold(fresh, round_partials(rows, baseline))
+            # 同じバージョンのラウンドだけを使い回す (変わったラウンドは計算し直し、消えたラウンドは落とす)
+            same = [k for k in versions if k not in changed]
+            keep = self._partials[_round_keys(self._partials).isin(same)] if same else self._partials.iloc[0:0]
+            parts = [p for p in (keep, fresh) if p is not None and len(p)]
+            self._partials = pd.concat(parts, ignore_index=True) if parts else self._partials.iloc[0:0]
+            self._versions = dict(versions)
+            self._stats["updates"] += 1
+            self._stats["rounds_computed"] += len(changed)
+            self._stats["rounds_reused"] += len(same)
+            return self._partials
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, rounds=len(self._versions), baseline=self._baseline_version)
+
+
+# --- まとめ ---
+def _finish(out):
+    holes = out["holes"]
+    return pd.DataFrame({
+        "holes": holes,
+        "sg_total": out["sg_total"].round(2),
+        "approach_per_hole": (out["sg_approach"] / holes).round(3),
+        "around_per_hole": (out["sg_around"] / out["around_n"].where(out["around_n"] > 0)).round(3),
+        "putting_per_hole": (out["sg_putting"] / out["putting_n"].where(out["putting_n"] > 0)).round(3),
+        "total_per_hole": (out["sg_total"] / holes).round(3),
+    }).reset_index()
+
+
+def by_club_dist(partials):
+    """クラブ × 距離帯ごとのストローク・ゲインド (シーズン全体、クラブ・距離帯の表示順)"""
+    sums = list(PARTIAL_COLUMNS)
+    # 畳み込んだ部分集計はキーが素の値になっているので、並びは表示順の辞書で揃える (aggregates.club_dist_table と同じ)
+    keys = partials[["club", "dist_range"]].astype("object")
+    out = partials[sums].groupby([keys["club"], keys["dist_range"]], sort=False).sum()
+    out = _finish(out[out["holes"] > 0])
+    order = {
+        "club": {c: i for i, c in enumerate(CLUB_LIST)},
+        "dist_range": {d: i for i, d in enumerate(DISTS)},
+    }
+    return out.sort_values(
+        ["club", "dist_range"], key=lambda s: s.map(order[s.name]).fillna(len(order[s.name])),
+    ).reset_index(drop=True)
+
+
+def by_round(partials):
+    """ラウンド × プレーヤーごとの内訳 (新しい順)"""
+    sums = list(PARTIAL_COLUMNS)
+    out = partials.groupby(["round_id", "player_id"], sort=False)[sums].sum()
+    return _finish(out.sort_index(ascending=False))
+
+
+def _tables(partials, info, baseline, player_id):
+    """部分集計から分析画面用の表を作る。info はラウンドの日付・コース (round_id の索引)"""
+    if player_id is not None:
+        partials = partials[partials["player_id"].eq(player_id).fillna(False).astype(bool)]
+    rounds = by_round(partials)
+    dates = pd.to_datetime(rounds["round_id"].map(info["round_date"]) if len(rounds) else pd.Series(dtype="datetime64[ns]"))
+    rounds.insert(1, "round_date", dates.dt.date)
+    rounds.insert(2, "course_name", rounds["round_id"].map(info["course_name"]).astype("object"))
+    return {"club_dist": by_club_dist(partials), "rounds": rounds, "baseline": baseline.source}
+
+
+def summarize(df, baseline=None, player_id=None):
+    """手元にある全ショット (prepare 済み) を1回のベクトル演算で集計した分析画面用の表
+
+    ローカル写しの DataFrame 用 (写しの世代ごとに画面側でキャッシュする)。player_id を渡すとそのプレーヤーだけ。
+    """
+    baseline = baseline or get_baseline()
+    df = df[df["round_id"].notna()]
+    info = df.drop_duplicates("round_id").set_index("round_id")
+    return _tables(round_partials(df, baseline), info, baseline, player_id)
+
+
+def summarize_chunks(load_chunks, versions, baseline=None, player_id=None):
+    """round_versions の表と、ラウンドを指定してショットを読む関数 (storage.iter_shots) から summarize と同じ表を作る
+
+    ラウンドごとの部分集計はキャッシュを使い回し、書き込みバージョンの変わったラウンドのショットだけを読んで
+    チャンクごとに畳み込む。キャッシュは全プレーヤー分を持ち、player_id を渡すとそのプレーヤーの部分集計だけを足す。
+    """
+    baseline = baseline or get_baseline()
+    keys = zip(versions["round_id"].astype("int64"), versions["player_id"].astype("int64"))
+    partials = get_round_cache().update(dict(zip(keys, versions["version"])), load_chunks, baseline)
+    info = versions.drop_duplicates("round_id").set_index("round_id")
+    return _tables(partials, info, baseline, player_id)
+
+
+_baseline = None
+_cache = None
+_state_lock = threading.Lock()
+
+
+def get_baseline():
+    """SG_BASELINE (JSON のパス) があればそれ、無ければ組み込みの基準"""
+    global _baseline
+    if _baseline is None:
+        with _state_lock:
+            if _baseline is None:
+                path = get_secret("SG_BASELINE", "")
+                _baseline = Baseline.from_file(path) if path else Baseline.default()
+    return _baseline
+
+
+def get_round_cache():
+    """プロセス共通のラウンド別キャッシュを返す (初回のみ生成)"""
+    global _cache
+    if _cache is None:
+        with _state_lock:
+            if _cache is None:
+                _cache = RoundCache()
+    return _cache
+
+
+def main(argv=None):
+    from storage import get_storage
+
+    parser = argparse.ArgumentParser(description="ストローク・ゲインドの基準打数")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_der = sub.add_parser("derive", help="履歴から基準打数を作って JSON に書き出す")
+    p_der.add_argument("path")
+    p_der.add_argument("--min-samples", type=int, default=30, help="これ未満の区分は組み込みの基準を使う")
+    sub.add_parser("show", help="使用中の基準打数を表示する")
+    args = parser.parse_args(argv)
+    if args.command == "show":
+        print(json.dumps(get_baseline().to_dict(), ensure_ascii=False, indent=2))
+        return
+    chunks = list(get_storage().iter_shots())
+    if not chunks:
+        raise SystemExit("履歴がありません")
+    baseline = Baseline.from_history(pd.concat(chunks, ignore_index=True), args.min_samples)
+    with open(args.path, "w", encoding="utf-8") as f:
+        json.dump(baseline.to_dict(), f, ensure_ascii=False, indent=2)
+    print(f"{sum(len(c) for c in chunks):,} ホールから基準を作りました → {args.path}")
+
+
+if __name__ == "__main__":
+    main()
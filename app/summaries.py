@@ -0,0 +1,172 @@
+from constants import PENALTY_STROKES
+
+# ==========================================
+# 🧾 ラウンドのサマリ (1ラウンド × プレーヤーで1行)
+# ==========================================
+# approach_logs への INSERT / DELETE / UPDATE と同じトランザクションの中でトリガが round_summaries を
+# 加算・減算する (集計テーブル club_dist_stats と同じ差分方式)。18 ホール目の登録と同じトランザクションで
+# ラウンドの合計が揃い、あとからホールを登録し直したり削除したりしても合計はずれない。
+# 同じラウンドを別の端末が同時に登録しても、差分の足し込みなので互いの分を上書きしない。
+# ラウンド一覧とシーズンの推移はこのテーブル (1ラウンド1行) だけを読めばよい。
+# ホールがすべて消えたラウンドは holes = 0 の行として残る (読む側で除く)。
+# updated_at は書き込みのたびに進むので、ラウンドの書き込みバージョンとしても使う (ストローク・ゲインドのキャッシュ)。
+
+SUMMARY_KEYS = ("round_id", "player_id")
+
+# (列名, 1ホールあたりの加算値)  sign は +1 (追加) / -1 (削除)
+_PENALTY_CASE = " ".join(f"WHEN '{k}' THEN {v}" for k, v in PENALTY_STROKES.items() if v)
+SUMMARY_COLUMNS = (
+    ("holes", "1"),
+    ("score", "coalesce(hole_score, 0)"),
+    ("over_par", "coalesce(hole_score - par, 0)"),
+    ("putts", "coalesce(putts, 0)"),
+    ("gir", "CASE WHEN is_green_on THEN 1 ELSE 0 END"),
+    ("penalties", f"CASE WHEN penalty IN ({', '.join(repr(k) for k, v in PENALTY_STROKES.items() if v)}) THEN 1 ELSE 0 END"),
+    ("penalty_strokes", f"CASE penalty {_PENALTY_CASE} ELSE 0 END"),
+    ("recovery_strokes", "coalesce(recovery_strokes, 0)"),
+    ("front_score", "CASE WHEN hole_no <= 9 THEN coalesce(hole_score, 0) ELSE 0 END"),
+    ("back_score", "CASE WHEN hole_no >= 10 THEN coalesce(hole_score, 0) ELSE 0 END"),
+    ("front_over_par", "CASE WHEN hole_no <= 9 THEN coalesce(hole_score - par, 0) ELSE 0 END"),
+    ("back_over_par", "CASE WHEN hole_no >= 10 THEN coalesce(hole_score - par, 0) ELSE 0 END"),
+)
+# 加算値の計算に使う approach_logs の列
+SOURCE_COLUMNS = (
+    "round_id", "player_id", "hole_no", "par", "hole_score", "putts", "is_green_on", "penalty", "recovery_strokes",
+)
+
+_TRIGGER_SOURCES = {
+    "ins": ("INSERT", "REFERENCING NEW TABLE AS new_rows", "SELECT 1 AS sign, * FROM new_rows"),
+    "del": ("DELETE", "REFERENCING OLD TABLE AS old_rows", "SELECT -1 AS sign, * FROM old_rows"),
+    "upd": ("UPDATE", "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows",
+            "SELECT 1 AS sign, * FROM new_rows UNION ALL SELECT -1 AS sign, * FROM old_rows"),
+}
+
+
+def _apply_sql(source, now="CURRENT_TIMESTAMP"):
+    """source の各行を sign 付きでラウンド × プレーヤーごとに集計し、round_summaries に足し込む SQL
+
+    PostgreSQL と SQLite の両方で動く書き方にしてある。行ロックはキー順に取る (デッドロックしない)。
+    """
+    keys = ", ".join(SUMMARY_KEYS)
+    cols = ", ".join(c for c, _ in SUMMARY_COLUMNS)
+    sums = ", ".join(f"sum(sign * ({expr}))" for _, expr in SUMMARY_COLUMNS)
+    updates = ", ".join(f"{c} = round_summaries.{c} + excluded.{c}" for c, _ in SUMMARY_COLUMNS)
+    return f"""
+        INSERT INTO round_summaries ({keys}, {cols})
+        SELECT {keys}, {sums}
+        FROM ({source}) d
+        WHERE round_id IS NOT NULL
+        GROUP BY {keys}
+        ORDER BY {keys}
+        ON CONFLICT ({keys}) DO UPDATE SET {updates}, updated_at = {now}
+    """
+
+
+def _table_sql(timestamp, now="CURRENT_TIMESTAMP"):
+    cols = ",\n".join(f"            {c} INTEGER NOT NULL DEFAULT 0" for c, _ in SUMMARY_COLUMNS)
+    return f"""
+        CREATE TABLE IF NOT EXISTS round_summaries (
+            round_id INTEGER NOT NULL REFERENCES rounds (id),
+            player_id INTEGER NOT NULL REFERENCES players (id),
+{cols},
+            updated_at {timestamp} NOT NULL DEFAULT {now},
+            PRIMARY KEY ({', '.join(SUMMARY_KEYS)})
+        );
+    """
+
+
+def migration_sql():
+    """サマリのテーブル・トリガ関数・トリガを作り、既存のホールから集計する SQL (PostgreSQL)"""
+    parts = [
+        # 作り直しの間に書き込みが割り込まないようにする
+        "LOCK TABLE approach_logs IN SHARE ROW EXCLUSIVE MODE;",
+        _table_sql("TIMESTAMPTZ"),
+    ]
+    for op, (event, referencing, source) in _TRIGGER_SOURCES.items():
+        parts.append(f"""
+        CREATE OR REPLACE FUNCTION round_summaries_{op}() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            {_apply_sql(source)};
+            RETURN NULL;
+        END
+        $$;
+        DROP TRIGGER IF EXISTS approach_logs_summary_{op} ON approach_logs;
+        CREATE TRIGGER approach_logs_summary_{op} AFTER {event} ON approach_logs
+            {referencing} FOR EACH STATEMENT EXECUTE FUNCTION round_summaries_{op}();
+        """)
+    parts.append("TRUNCATE round_summaries;")
+    parts.append(_apply_sql("SELECT 1 AS sign, * FROM approach_logs") + ";")
+    return "\n".join(parts)
+
+
+def _sqlite_row(sign, ref):
+    return f"SELECT {sign} AS sign, " + ", ".join(f"{ref}.{c} AS {c}" for c in SOURCE_COLUMNS)
+
+
+# SQLite の CURRENT_TIMESTAMP は秒までなので、同じ秒の書き込みでもバージョンが変わるようミリ秒まで持つ
+SQLITE_NOW = "(strftime('%Y-%m-%d %H:%M:%f', 'now'))"
+
+
+def sqlite_sql():
+    """SQLite 用 (行単位のトリガ)。テーブルを作ったときだけ既存のホールから集計する"""
+    triggers = {
+        "ins": ("INSERT", [_sqlite_row(1, "NEW")]),
+        "del": ("DELETE", [_sqlite_row(-1, "OLD")]),
+        "upd": ("UPDATE", [_sqlite_row(-1, "OLD"), _sqlite_row(1, "NEW")]),
+    }
+    parts = [_table_sql("TEXT", SQLITE_NOW)]
+    for op, (event, sources) in triggers.items():
+        body = "".join(f"{_apply_sql(source, SQLITE_NOW)};\n" for source in sources)
+        parts.append(f"""
+        CREATE TRIGGER IF NOT EXISTS approach_logs_summary_{op} AFTER {event} ON approach_logs
+        BEGIN
+        {body}
+        END;
+        """)
+    parts.append(_apply_sql(
+        "SELECT 1 AS sign, * FROM approach_logs WHERE NOT EXISTS (SELECT 1 FROM round_summaries)", SQLITE_NOW,
+    ) + ";")
+    return "\n".join(parts)
+
+
+# --- 読み出し ---
+def _full_rounds(summaries):
+    """18 ホールを回ったラウンドだけを、日付の索引で返す"""
+    import pandas as pd
+
+    full = summaries[summaries["holes"] == 18]
+    return full.set_index(pd.DatetimeIndex(pd.to_datetime(full["round_date"]), name="round_date"))
+
+
+def season_rounds(summaries, season=None):
+    """(シーズン, そのシーズンの 18 ホールのラウンド)。season を省くと最新のシーズン"""
+    full = _full_rounds(summaries)
+    if season is None:
+        season = int(full.index.year.max()) if len(full) else None
+    return season, full[full.index.year == season]
+
+
+def season_table(summaries):
+    """round_summaries の行 (1ラウンド1行) をシーズン (年) ごとの1ラウンドあたりの平均にする
+
+    比べられるよう 18 ホールを回ったラウンドだけを使う。
+    """
+    import pandas as pd
+
+    full = _full_rounds(summaries)
+    if full.empty:
+        return pd.DataFrame()
+    season = full.index.year.rename("season")
+    out = full.groupby(season).agg(
+        rounds=("holes", "size"),
+        score=("score", "mean"),
+        best=("score", "min"),
+        over_par=("over_par", "mean"),
+        putts=("putts", "mean"),
+        gir=("gir", "mean"),
+        penalty_strokes=("penalty_strokes", "mean"),
+        recovery_strokes=("recovery_strokes", "mean"),
+        front_score=("front_score", "mean"),
+        back_score=("back_score", "mean"),
+    )
+    return out.round(1).sort_index(ascending=False).reset_index()
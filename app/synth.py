@@ -0,0 +1,159 @@
+"""ベンチマーク・負荷試験用の合成ラウンド
+
+    python synth.py 100000 rounds.csv      # 10万行を CSV に書き出す (bulk.py import で取り込める)
+
+実際の CLUB_LIST / DIST_MAP / PAR_DATA とコード値だけを使い、距離とクラブ・パーオン率・寄せ・パット・
+スコアが互いに矛盾しないように作る。同じ seed なら同じデータになる。
+"""
+import argparse
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from constants import (
+    PAR_DATA, CLUB_LIST, DIST_LIST_DISP, LOG_COLUMNS,
+    DIST_MAP, DIR_MAP, LIE_MAP, PROXIMITY_MAP, PENALTY_MAP, PENALTY_STROKES,
+)
+from courses import DEFAULT_COURSE
+
+# ==========================================
+# 🎲 合成ラウンド
+# ==========================================
+# 1ラウンド = 18行 (1ホール1行)。(日付, コース, グリーン) は重複しない
+# (bulk.py と同じく、この組で1ラウンドとみなされるため)。
+
+# 掛川GH のほかに、パーの並びをずらした架空のコース
+COURSES = [DEFAULT_COURSE] + [f"合成CC{i}" for i in range(1, 5)]
+ROUNDS_PER_DAY = len(COURSES) * 2   # コース × A/B グリーン
+
+DISTS = [DIST_MAP[d] for d in DIST_LIST_DISP]
+# 距離帯ごとに使うクラブ (CLUB_LIST の表記)
+CLUBS_BY_DIST = [
+    ["PW", "50", "56", "58"],
+    ["9I", "PW", "50"],
+    ["7I", "8I", "9I"],
+    ["6I", "7I", "6U"],
+    ["5U", "6U", "6I"],
+    ["5W", "7W", "5U"],
+]
+# 距離帯ごとのパーオン率
+GIR_BY_DIST = np.array([0.62, 0.52, 0.43, 0.35, 0.27, 0.18])
+# パーごとの残り距離の分布 (DISTS の順)
+DIST_P_BY_PAR = {
+    3: [0.00, 0.10, 0.30, 0.35, 0.20, 0.05],
+    4: [0.10, 0.20, 0.25, 0.20, 0.15, 0.10],
+    5: [0.55, 0.25, 0.12, 0.05, 0.02, 0.01],
+}
+PROXIMITY = ["UNDER_1.5", "UNDER_3.0", "UNDER_5.0", "OVER_6.0"]
+PROXIMITY_P = [0.12, 0.30, 0.33, 0.25]
+# 寄せの距離ごとのパット数 (1, 2, 3) の確率
+PUTTS_P = {
+    "UNDER_1.5": [0.75, 0.24, 0.01],
+    "UNDER_3.0": [0.40, 0.57, 0.03],
+    "UNDER_5.0": [0.18, 0.76, 0.06],
+    "OVER_6.0": [0.06, 0.82, 0.12],
+}
+MISS_DIRS = ["SHORT", "OVER", "LEFT", "RIGHT"]
+MISS_DIR_P = [0.40, 0.15, 0.22, 0.23]
+LIES = ["FAIRWAY", "ROUGH_LIGHT", "ROUGH_DEEP", "BUNKER"]
+LIE_P = [0.25, 0.35, 0.18, 0.22]
+PENALTIES = ["NONE", "OB", "PENALTY"]
+PENALTY_P = [0.93, 0.03, 0.04]
+
+# 想定外のコード値が混ざらないことを確認しておく
+assert set(c for cs in CLUBS_BY_DIST for c in cs) <= set(CLUB_LIST)
+assert set(MISS_DIRS) <= set(DIR_MAP.values()) and set(LIES) <= set(LIE_MAP.values())
+assert set(PROXIMITY) <= set(PROXIMITY_MAP.values()) and set(PENALTIES) <= set(PENALTY_MAP.values())
+
+
+def course_pars(course_index):
+    """コースごとのパー (1〜18番)。架空コースは PAR_DATA をずらしたもの (合計は同じ)"""
+    pars = np.array([PAR_DATA[h] for h in range(1, 19)])
+    return np.roll(pars, course_index * 5)
+
+
+def generate(n_rows, seed=0, start="2010-01-01"):
+    """n_rows 行 (18 の倍数に切り上げ) の合成ショットを返す。
+
+    列は LOG_COLUMNS に round_uid / start_side を足したもの (値はすべてコード値)。
+    """
+    rng = np.random.default_rng(seed)
+    n_rounds = max(1, -(-n_rows // 18))
+    n = n_rounds * 18
+    rnd = np.repeat(np.arange(n_rounds), 18)
+    hole = np.tile(np.arange(1, 19), n_rounds)
+
+    # ラウンド: 1日に (コース × グリーン) の組み合わせを1つずつ
+    combo = np.arange(n_rounds) % ROUNDS_PER_DAY
+    course_idx = combo // 2
+    green = np.where(combo % 2 == 0, "A", "B")
+    day = pd.Timestamp(start) + pd.to_timedelta(np.arange(n_rounds) // ROUNDS_PER_DAY, "D")
+    pars_table = np.stack([course_pars(i) for i in range(len(COURSES))])
+    par = pars_table[course_idx[rnd], hole - 1]
+
+    # 残り距離とクラブ
+    dist_idx = np.empty(n, dtype=np.int64)
+    for p, probs in DIST_P_BY_PAR.items():
+        mask = par == p
+        dist_idx[mask] = rng.choice(len(DISTS), size=mask.sum(), p=probs)
+    club = np.empty(n, dtype=object)
+    for i, clubs in enumerate(CLUBS_BY_DIST):
+        mask = dist_idx == i
+        club[mask] = rng.choice(clubs, size=mask.sum())
+
+    # パーオンしたら寄せとパット、外したら方向・ライ・リカバリ
+    gir = rng.random(n) < GIR_BY_DIST[dist_idx]
+    proximity = np.where(gir, rng.choice(PROXIMITY, size=n, p=PROXIMITY_P), "NONE")
+    putts = np.empty(n, dtype=np.int64)
+    for prox, probs in PUTTS_P.items():
+        mask = proximity == prox
+        putts[mask] = rng.choice([1, 2, 3], size=mask.sum(), p=probs)
+    miss = ~gir
+    putts[miss] = rng.choice([1, 2, 3], size=miss.sum(), p=[0.45, 0.50, 0.05])
+    miss_dir = np.where(miss, rng.choice(MISS_DIRS, size=n, p=MISS_DIR_P), "NONE")
+    lie = np.where(miss, rng.choice(LIES, size=n, p=LIE_P), "NONE")
+    recovery = np.where(miss, rng.choice([1, 2], size=n, p=[0.85, 0.15]), 0)
+    penalty = rng.choice(PENALTIES, size=n, p=PENALTY_P)
+    penalty_strokes = pd.Series(penalty).map(PENALTY_STROKES).to_numpy()
+
+    # スコア = グリーンに乗るまで (パーオンなら par-2) + リカバリ + パット + ペナルティ
+    score = np.where(gir, par - 2, par - 2 + recovery) + putts + penalty_strokes
+    score = np.clip(score, 1, 9)
+
+    uids = [str(uuid.UUID(bytes=rng.bytes(16), version=4)) for _ in range(n_rounds)]
+    df = pd.DataFrame({
+        "round_date": day[rnd].date,
+        "course_name": np.array(COURSES, dtype=object)[course_idx[rnd]],
+        "hole_no": hole,
+        "par": par,
+        "dist_range": np.array(DISTS, dtype=object)[dist_idx],
+        "club": club,
+        "is_green_on": gir,
+        "miss_dir": miss_dir,
+        "lie_type": lie,
+        "recovery_strokes": recovery,
+        "hole_score": score,
+        "green_type": green[rnd],
+        "putts": putts,
+        "proximity": proximity,
+        "penalty": penalty,
+        "round_uid": np.array(uids, dtype=object)[rnd],
+        "start_side": "OUT (1→18)",
+    })
+    return df[list(LOG_COLUMNS) + ["round_uid", "start_side"]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="合成ラウンドを CSV に書き出す")
+    parser.add_argument("rows", type=int)
+    parser.add_argument("path")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    df = generate(args.rows, seed=args.seed)
+    df[list(LOG_COLUMNS)].to_csv(args.path, index=False)
+    print(f"{len(df):,} 行 ({len(df) // 18:,} ラウンド) → {args.path}")
+
+
+if __name__ == "__main__":
+    main()
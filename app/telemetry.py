@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from config import get_secret, get_int, get_float
+
+# ==========================================
+# ⏱ DB 計測 / スロークエリログ
+# ==========================================
+# 接続・実行の所要時間と返却行数を文 (ステートメント名) ごとに記録する。
+# 直近 N 件だけを保持するのでメモリは一定。閾値を超えた文は JSONL に追記する。
+
+
+def default_slow_log_path():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "slow_queries.jsonl")
+
+
+class RollingHistogram:
+    """直近 window 件の所要時間 (秒) からパーセンタイルを出す"""
+
+    def __init__(self, window=500):
+        self._samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.rows = 0
+
+    def add(self, seconds, rows=None):
+        self._samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        if rows is not None and rows > 0:
+            self.rows += rows
+
+    def percentile(self, p):
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+        return ordered[idx]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "rows": self.rows,
+            "avg_ms": round(self.total / self.count * 1000, 1) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50) * 1000, 1),
+            "p95_ms": round(self.percentile(95) * 1000, 1),
+            "p99_ms": round(self.percentile(99) * 1000, 1),
+            "max_ms": round(max(self._samples) * 1000, 1) if self._samples else 0.0,
+        }
+
+
+class Telemetry:
+    def __init__(self, window=500, slow_ms=500.0, slow_log_path=None):
+        self.window = window
+        self.slow_ms = slow_ms
+        self.slow_log_path = slow_log_path
+        self._lock = threading.Lock()
+        self._hists = {}
+
+    def record(self, kind, name, seconds, rows=None, sql=None):
+        key = (kind, name)
+        with self._lock:
+            hist = self._hists.get(key)
+            if hist is None:
+                hist = self._hists[key] = RollingHistogram(self.window)
+            hist.add(seconds, rows)
+        if self.slow_log_path and seconds * 1000 >= self.slow_ms:
+            self._log_slow(kind, name, seconds, rows, sql)
+
+    def _log_slow(self, kind, name, seconds, rows, sql):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "kind": kind, "name": name,
+            "ms": round(seconds * 1000, 1), "rows": rows,
+            "sql": " ".join(sql.split()) if sql else None,
+        }
+        try:
+            with self._lock, open(self.slow_log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError:
+            # ログが書けなくても本処理は止めない
+            pass
+
+    @contextmanager
+    def timed(self, kind, name, sql=None):
+        """ブロックの所要時間を記録する。返却行数は yield した dict の rows に入れる"""
+        info = {"rows": None}
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            self.record(kind, name, time.perf_counter() - start, info["rows"], sql)
+
+    def snapshot(self):
+        with self._lock:
+            items = sorted(self._hists.items())
+            return [dict(kind=k, name=n, **h.summary()) for (k, n), h in items]
+
+    def reset(self):
+        with self._lock:
+            self._hists = {}
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry():
+    """プロセス共通の計測器を返す (初回のみ生成)"""
+    global _telemetry
+    if _telemetry is None:
+        with _telemetry_lock:
+            if _telemetry is None:
+                _telemetry = Telemetry(
+                    window=get_int("TELEMETRY_WINDOW", 500),
+                    slow_ms=get_float("SLOW_QUERY_MS", 500),
+                    slow_log_path=get_secret("SLOW_QUERY_LOG", default_slow_log_path()) or None,
+                )
+    return _telemetry
+
+
+# --- 計測付きの実行ヘルパ ---
+def execute(conn, name, sql, params=None):
+    """cursor.execute を計測して影響行数を返す"""
+    with get_telemetry().timed("execute", name, sql) as info:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            info["rows"] = cur.rowcount
+            return cur.rowcount
@@ -0,0 +1,334 @@
+"""直近ラウンドの推移 (5 / 10 / 20 ラウンドの移動平均)
+
+    python trends.py rebuild    # DB から状態を作り直す
+    python trends.py show       # 状態の中身 (プレーヤーごとの窓の合計) を表示する
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+from config import get_secret, get_int, storage_backend
+from constants import CLUB_LIST, PENALTY_STROKES
+
+# ==========================================
+# 📈 直近ラウンドの推移
+# ==========================================
+# 窓 (直近 N ラウンド) ごとに、指標の合計 (ホール数・スコア・パット・パーオン・ペナルティ打数) を
+# 全体とクラブ別に持ち続け、全履歴を読み直さずに更新する。
+#   ラウンド終了: 新しいラウンドを各窓に足し、窓からはみ出した1ラウンドを引く
+#   ホールの登録し直し・削除: そのラウンドを含む窓だけ、古い値を引いて新しい値を足す
+# どちらも履歴の長さに関係なく (高々 18 ホール × 窓の数の) 足し引きで済む。
+# 状態は JSON に保存し、再起動しても作り直さない。無い (初回・保存先や窓の変更) ときだけ
+# DB の直近ラウンドから作り直す。書き込みはこのプロセスのフラッシャ・削除から届く。
+
+METRICS = ("holes", "score", "over_par", "putts", "gir", "penalty_strokes")
+TOTAL = "*"  # 全クラブの合計のキー
+STATE_VERSION = 1
+
+
+def default_path():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "trends.json")
+
+
+def hole_vector(row):
+    """1ホール分の指標 (METRICS の順)"""
+    score, par = row.get("hole_score"), row.get("par")
+    has_score = score is not None and not pd.isna(score)
+    has_par = par is not None and not pd.isna(par)
+    putts = row.get("putts")
+    return [
+        1,
+        int(score) if has_score else 0,
+        int(score) - int(par) if has_score and has_par else 0,
+        int(putts) if putts is not None and not pd.isna(putts) else 0,
+        int(bool(row.get("is_green_on"))),
+        PENALTY_STROKES.get(row.get("penalty"), 0),
+    ]
+
+
+class PlayerTrend:
+    """1人分の状態: プレー中のラウンドのホールと、直近の終了ラウンドと、窓ごとの合計"""
+
+    def __init__(self, windows, open_limit=5):
+        self.windows = tuple(windows)
+        self.depth = max(self.windows)
+        self.open_limit = open_limit
+        self.open = {}      # round_uid -> {ホール番号: [クラブ, 指標]}
+        self.recent = []    # [[round_uid, {ホール番号: [クラブ, 指標]}]] 古い順、最大 depth 件
+        self.sums = {w: {} for w in self.windows}   # 窓 -> {クラブ or TOTAL: 指標の合計}
+
+    def _add(self, window, holes, sign):
+        sums = self.sums[window]
+        for club, vec in holes:
+            for key in (TOTAL, club):
+                acc = sums.setdefault(key, [0] * len(METRICS))
+                for i, v in enumerate(vec):
+                    acc[i] += sign * v
+                if key != TOTAL and acc[0] == 0:
+                    del sums[key]
+
+    def _find(self, round_uid):
+        # recent は高々 depth 件
+        for pos, (uid, _) in enumerate(self.recent):
+            if uid == round_uid:
+                return pos
+        return None
+
+    def _windows_at(self, pos):
+        """recent[pos] を含む窓"""
+        age = len(self.recent) - 1 - pos
+        return [w for w in self.windows if age < w]
+
+    def set_hole(self, round_uid, hole_no, club, vec):
+        key = str(hole_no)
+        club = club or "-"
+        pos = self._find(round_uid)
+        if pos is None:
+            holes = self.open.setdefault(round_uid, {})
+            holes[key] = [club, vec]
+            # 終わらないまま放置されたラウンドは古いものから捨てる
+            while len(self.open) > self.open_limit:
+                del self.open[next(iter(self.open))]
+            return
+        holes = self.recent[pos][1]
+        old = holes.get(key)
+        for w in self._windows_at(pos):
+            if old is not None:
+                self._add(w, [old], -1)
+            self._add(w, [[club, vec]], 1)
+        holes[key] = [club, vec]
+
+    def delete_hole(self, round_uid, hole_no):
+        key = str(hole_no)
+        pos = self._find(round_uid)
+        if pos is None:
+            self.open.get(round_uid, {}).pop(key, None)
+            return
+        old = self.recent[pos][1].pop(key, None)
+        if old is not None:
+            for w in self._windows_at(pos):
+                self._add(w, [old], -1)
+
+    def finish(self, round_uid):
+        """ラウンドを窓に入れる。終了し直し (削除後の再登録) なら何もしない"""
+        if self._find(round_uid) is not None or round_uid not in self.open:
+            return False
+        holes = self.open.pop(round_uid)
+        self.recent.append([round_uid, holes])
+        n = len(self.recent)
+        for w in self.windows:
+            self._add(w, holes.values(), 1)
+            if n > w:
+                self._add(w, self.recent[n - 1 - w][1].values(), -1)
+        if n > self.depth:
+            del self.recent[0]
+        return True
+
+    def to_dict(self):
+        return {"open": self.open, "recent": self.recent,
+                "sums": {str(w): s for w, s in self.sums.items()}}
+
+    @classmethod
+    def from_dict(cls, data, windows, open_limit=5):
+        p = cls(windows, open_limit)
+        p.open = data["open"]
+        p.recent = data["recent"]
+        p.sums = {int(w): s for w, s in data["sums"].items()}
+        return p
+
+
+class TrendState:
+    def __init__(self, path, windows=(5, 10, 20), source=None, open_limit=5):
+        self.path = path
+        self.windows = tuple(sorted(windows))
+        self.source = source
+        self.open_limit = open_limit
+        self._lock = threading.Lock()
+        self.players = {}
+        self.ready = False
+        self._stats = {"updates": 0, "rebuilds": 0, "last_rebuild_sec": None, "last_error": None}
+        self._load()
+
+    # --- 保存・読み込み ---
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        # 窓や保存先 (ストレージ) が変わっていたら作り直す
+        if (data.get("version") != STATE_VERSION or tuple(data.get("windows", ())) != self.windows
+                or data.get("source") != self.source):
+            return
+        self.players = {
+            name: PlayerTrend.from_dict(p, self.windows, self.open_limit) for name, p in data["players"].items()
+        }
+        self.ready = True
+
+    def _save(self):
+        data = {
+            "version": STATE_VERSION, "windows": list(self.windows), "source": self.source,
+            "saved_at": time.time(),
+            "players": {name: p.to_dict() for name, p in self.players.items()},
+        }
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def _player(self, name):
+        if name not in self.players:
+            self.players[name] = PlayerTrend(self.windows, self.open_limit)
+        return self.players[name]
+
+    # --- 更新 ---
+    def apply_holes(self, items):
+        """DB にコミットしたホール [(ショット行, ラウンド情報, プレーヤー, 冪等キー)] を反映する
+
+        作り直す前 (ready でない) は何もしない (作り直すときに DB から読むので)。
+        """
+        with self._lock:
+            if not self.ready:
+                return
+            finished = []
+            for row, r, player, _ in items:
+                if not r:
+                    continue
+                self._player(player).set_hole(r["round_uid"], row["hole_no"], row["club"], hole_vector(row))
+                if r["status"] == "finished":
+                    finished.append((player, r["round_uid"]))
+            # ホールを入れ終えてから終了させる (最終ホールとそれ以前のホールが同じバッチで届く)
+            for player, uid in finished:
+                self._player(player).finish(uid)
+            self._stats["updates"] += 1
+            self._save()
+
+    def delete_hole(self, round_uid, player, hole_no):
+        with self._lock:
+            if not self.ready or player not in self.players:
+                return
+            self.players[player].delete_hole(round_uid, hole_no)
+            self._stats["updates"] += 1
+            self._save()
+
+    def rebuild(self, storage):
+        """DB の直近ラウンドから作り直す (各プレーヤー最大 窓の最大 + open_limit ラウンド分だけ読む)"""
+        started = time.perf_counter()
+        players = {}
+        # 行はラウンドの古い順 (同じラウンドの行は続いて来る)。ラウンドが変わったら前のラウンドを終える
+        finished, current = {}, None
+        for row in storage.recent_round_holes(max(self.windows), self.open_limit):
+            if row.round_uid != current:
+                for p in finished.values():
+                    p.finish(current)
+                finished, current = {}, row.round_uid
+            p = players.setdefault(row.player, PlayerTrend(self.windows, self.open_limit))
+            p.set_hole(row.round_uid, row.hole_no, row.club, hole_vector(row._asdict()))
+            if row.status == "finished":
+                finished[row.player] = p
+        for p in finished.values():
+            p.finish(current)
+        with self._lock:
+            self.players = players
+            self.ready = True
+            self._save()
+            self._stats["rebuilds"] += 1
+            self._stats["last_rebuild_sec"] = round(time.perf_counter() - started, 3)
+
+    def ensure(self, storage):
+        """状態が無ければ作り直す。失敗 (圏外など) してもエラーを記録するだけ"""
+        if self.ready:
+            return None
+        try:
+            self.rebuild(storage)
+            self._stats["last_error"] = None
+        except Exception as e:
+            self._stats["last_error"] = str(e)
+        return self._stats["last_error"]
+
+    # --- 読み出し ---
+    def summary(self, player):
+        """{"windows": 窓ごとの1ラウンドあたりの平均, "clubs": クラブ × 窓のパーオン率・平均オーバーパー}"""
+        with self._lock:
+            p = self.players.get(player)
+            if p is None or not p.recent:
+                return {"windows": pd.DataFrame(), "clubs": pd.DataFrame()}
+            n_rounds = len(p.recent)
+            sums = {w: {k: list(v) for k, v in s.items()} for w, s in p.sums.items()}
+        rows = []
+        for w in self.windows:
+            s = dict(zip(METRICS, sums[w].get(TOTAL, [0] * len(METRICS))))
+            holes = s["holes"]
+            # 途中までのラウンド (削除後など) も混ざるので 18 ホール換算で並べる
+            per_round = (lambda v: round(v / holes * 18, 1)) if holes else (lambda v: None)
+            rows.append({
+                "窓": f"直近{w}", "ラウンド": min(w, n_rounds), "ホール": holes,
+                "スコア": per_round(s["score"]), "オーバーパー": per_round(s["over_par"]),
+                "パット": per_round(s["putts"]), "パーオン率(%)": round(s["gir"] / holes * 100, 1) if holes else None,
+                "ペナルティ打数": per_round(s["penalty_strokes"]),
+            })
+        clubs = {}
+        for w in self.windows:
+            for club, vec in sums[w].items():
+                if club == TOTAL:
+                    continue
+                s = dict(zip(METRICS, vec))
+                row = clubs.setdefault(club, {"club": club})
+                row[f"パーオン率 直近{w}"] = round(s["gir"] / s["holes"] * 100, 1)
+                row[f"オーバーパー 直近{w}"] = round(s["over_par"] / s["holes"], 2)
+        order = {c: i for i, c in enumerate(CLUB_LIST)}
+        club_rows = sorted(clubs.values(), key=lambda r: (order.get(r["club"], len(order)), r["club"]))
+        return {"windows": pd.DataFrame(rows), "clubs": pd.DataFrame(club_rows)}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ready": self.ready, "path": self.path, "windows": list(self.windows), "source": self.source,
+                "players": {name: {"rounds": len(p.recent), "open": len(p.open)} for name, p in self.players.items()},
+                **self._stats,
+            }
+
+
+_trends = None
+_trends_lock = threading.Lock()
+
+
+def get_trends():
+    """プロセス共通の推移の状態を返す (初回のみ保存済みの状態を読み込む)"""
+    global _trends
+    if _trends is None:
+        with _trends_lock:
+            if _trends is None:
+                windows = [int(w) for w in str(get_secret("TREND_WINDOWS", "5,10,20")).split(",") if w.strip()]
+                # 作り直しの要否の判定用に、どのストレージの状態かを記録する
+                _trends = TrendState(
+                    get_secret("TRENDS_PATH", default_path()), windows, source=storage_backend(),
+                    open_limit=get_int("TRENDS_OPEN_ROUNDS", 5),
+                )
+    return _trends
+
+
+def main(argv=None):
+    from storage import get_storage
+
+    parser = argparse.ArgumentParser(description="直近ラウンドの推移")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild", help="DB から状態を作り直す")
+    sub.add_parser("show", help="状態を表示する")
+    args = parser.parse_args(argv)
+    trends = get_trends()
+    if args.command == "rebuild":
+        trends.rebuild(get_storage())
+    stats = trends.stats()
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    for player in stats["players"]:
+        print(f"\n# {player}")
+        print(trends.summary(player)["windows"].to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
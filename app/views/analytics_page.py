@@ -0,0 +1,157 @@
+import streamlit as st
+
+from aggregates import club_dist_table, gir_pivot
+from analytics import prepare, summarize, summarize_chunks
+from cache import get_cache
+from config import get_int
+from db import get_connection
+from mirror import get_mirror
+from session import cached_query, go_input
+from storage import get_storage
+import strokes_gained
+from summaries import season_rounds, season_table
+from trends import get_trends
+
+# ==========================================
+# 📊 分析
+# ==========================================
+# 開いたときだけ分析用のモジュール (pandas・pyarrow・集計) を読み込み、クエリを流す。
+
+storage = get_storage()
+storage.ensure_schema()
+# 分析用のローカル写しはサーバ越しのときだけ (SQLite なら元から手元にある)
+mirror = get_mirror() if storage.remote else None
+
+def load_summary(player_id):
+    if mirror is not None:
+        # 手元の写しを差分同期してから memory map で読む (圏外なら前回の写しのまま)
+        error = mirror.sync_if_due(get_connection, interval=get_int("MIRROR_SYNC_INTERVAL", 30))
+        if error:
+            st.caption(f"📡 オフライン: 手元の写しで表示しています ({error[:60]})")
+        return get_cache().get_or_load(
+            "summary_mirror", (mirror.generation, player_id),
+            lambda: summarize(prepare(mirror.read_frame()), player_id),
+        )
+    with st.spinner("分析データを読み込み中..."):
+        # 全履歴はサーバ側カーソルでチャンクごとに読み、部分集計に畳み込む
+        chunk = get_int("ANALYTICS_CHUNK_ROWS", 50_000)
+        return cached_query("summary", (player_id,), lambda s: summarize_chunks(s.iter_shots(chunk), player_id))
+
+def load_strokes_gained(player_id):
+    """ストローク・ゲインド。サーバからはラウンドごとの部分集計を使い回し、変わったラウンドだけ計算する"""
+    version = strokes_gained.get_baseline().version
+    if mirror is not None:
+        # 写しの同期は load_summary で済んでいる
+        return get_cache().get_or_load(
+            "strokes_gained_mirror", (mirror.generation, version, player_id),
+            lambda: strokes_gained.summarize(prepare(mirror.read_frame()), player_id=player_id),
+        )
+    chunk = get_int("ANALYTICS_CHUNK_ROWS", 50_000)
+    # バージョンを先に読み、ショットはバージョンの変わったラウンドの分だけを読む
+    return cached_query(
+        "strokes_gained", (version, player_id),
+        lambda s: strokes_gained.summarize_chunks(
+            lambda ids: s.iter_shots(chunk, round_ids=ids), s.round_versions(), player_id=player_id,
+        ),
+    )
+
+def load_stats_table():
+    return cached_query("club_dist_stats", (), lambda s: s.club_dist_stats())
+
+def load_round_summaries(player):
+    """ラウンドのサマリ (1ラウンド1行)。ホールの行は読まない"""
+    return cached_query("round_summaries", (player,), lambda s: s.round_summaries(player))
+
+st.subheader("📊 分析")
+c_back, c_reload = st.columns(2)
+with c_back:
+    if st.button("◀ 入力に戻る"):
+        go_input()
+with c_reload:
+    if st.button("🔄 再読み込み"):
+        get_cache().clear()
+        st.rerun()
+# 直近ラウンドの推移 (保存済みの窓の合計を読むだけ。初回のみ DB から作り直す)
+trends = get_trends()
+error = trends.ensure(storage)
+if error:
+    st.error(f"推移エラー: {error}")
+trend = trends.summary(st.session_state.player)
+if not trend["windows"].empty:
+    st.caption(f"直近ラウンドの推移 ({st.session_state.player}、1ラウンドあたり・18ホール換算)")
+    st.dataframe(trend["windows"], hide_index=True, use_container_width=True)
+    if not trend["clubs"].empty:
+        st.caption("クラブ別の推移 (パーオン率 % / 1ホールあたりのオーバーパー)")
+        st.dataframe(trend["clubs"], hide_index=True, use_container_width=True)
+# シーズンの推移 (ラウンドのサマリを読むだけ)
+try:
+    summaries = load_round_summaries(st.session_state.player)
+except Exception as e:
+    summaries = None
+    st.error(f"サマリのエラー: {e}")
+if summaries is not None:
+    seasons = season_table(summaries)
+    if not seasons.empty:
+        st.caption(f"シーズン別 ({st.session_state.player}、18 ホールのラウンドの1ラウンドあたり)")
+        st.dataframe(seasons, hide_index=True, use_container_width=True)
+        season, rounds = season_rounds(summaries)
+        st.caption(f"{season} シーズンのスコア (OUT / IN)")
+        st.line_chart(rounds[["score", "front_score", "back_score"]])
+try:
+    club_stats = load_stats_table()
+except Exception as e:
+    club_stats = None
+    st.error(f"集計エラー: {e}")
+# プレーヤーの選択は集計テーブル・分析・ストローク・ゲインドで共通 (集計テーブルの名前と id で引き当てる)
+player_ids = {}
+if club_stats is not None and not club_stats.empty:
+    player_ids = {name: int(pid) for name, pid in zip(club_stats["player"], club_stats["player_id"])}
+players = sorted(player_ids)
+player_opts = players + ["全員"]
+player_sel = st.selectbox(
+    "プレーヤー", player_opts,
+    index=player_opts.index(st.session_state.player) if st.session_state.player in players else len(players),
+)
+player_id = player_ids.get(player_sel)
+player_names = {pid: name for name, pid in player_ids.items()}
+
+def with_player_names(df):
+    """player_id の列をプレーヤー名にする"""
+    return df.assign(player_id=df["player_id"].map(player_names)).rename(columns={"player_id": "player"})
+
+if club_stats is not None and not club_stats.empty:
+    courses = ["全コース"] + sorted(club_stats["course_name"].unique())
+    course_sel = st.selectbox("コース", courses)
+    table = club_dist_table(
+        club_stats, None if course_sel == "全コース" else course_sel,
+        None if player_sel == "全員" else player_sel,
+    )
+    st.caption("クラブ × 残り距離のパーオン率 (%)")
+    st.dataframe(gir_pivot(table), use_container_width=True)
+    st.caption("クラブ × 残り距離の詳細")
+    st.dataframe(table, hide_index=True, use_container_width=True)
+try:
+    stats = load_summary(player_id)
+except Exception as e:
+    stats = None
+    st.error(f"分析エラー: {e}")
+if stats is not None:
+    st.caption("パーオン時の寄せ (%)")
+    st.dataframe(stats["proximity"], hide_index=True, use_container_width=True)
+    st.caption("パット数 (パーオン / 非パーオン)")
+    st.dataframe(stats["putts"], hide_index=True, use_container_width=True)
+    st.caption("リカバリ率 (ライ × 外した方向)")
+    st.dataframe(stats["scrambling"], hide_index=True, use_container_width=True)
+    st.caption("ラウンド別ペナルティ")
+    st.dataframe(with_player_names(stats["penalty"]), hide_index=True, use_container_width=True)
+try:
+    sg = load_strokes_gained(player_id)
+except Exception as e:
+    sg = None
+    st.error(f"ストローク・ゲインドのエラー: {e}")
+if sg is not None and not sg["club_dist"].empty:
+    st.caption(f"ストローク・ゲインド: クラブ × 残り距離 (1ホールあたり、基準: {sg['baseline']})")
+    st.dataframe(sg["club_dist"], hide_index=True, use_container_width=True)
+    st.caption("ストローク・ゲインド: ラウンド別 (直近 20)")
+    sg_rounds = with_player_names(sg["rounds"].head(20)).drop(columns=["round_id"])
+    st.dataframe(sg_rounds, hide_index=True, use_container_width=True)
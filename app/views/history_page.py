@@ -0,0 +1,71 @@
+import streamlit as st
+
+from cache import get_cache
+from journal import get_journal
+from session import cached_query, go_input
+from storage import get_storage
+from trends import get_trends
+
+# ==========================================
+# 📝 ラウンド履歴
+# ==========================================
+
+HISTORY_PAGE_SIZE = 30
+
+storage = get_storage()
+storage.ensure_schema()
+round_date = st.session_state.round_date
+st.subheader(f"📝 ラウンド履歴 ({round_date} {st.session_state.course_name} / {st.session_state.player})")
+if st.button("◀ 入力に戻る"):
+    go_input()
+journal = get_journal()
+round_uid = st.session_state.round_uid
+player = st.session_state.player
+pending_rows = journal.pending_rows(round_uid, player)
+if pending_rows:
+    held = journal.held_count(round_uid)
+    st.caption(
+        f"📡 未送信 {len(pending_rows)} 件" + (f" (うち保留中 {held} 件)" if held else "")
+        + " (送信後に表に反映されます)"
+    )
+cursors = st.session_state.history_cursors
+try:
+    rows = cached_query(
+        "round_history", (player, cursors[-1], HISTORY_PAGE_SIZE),
+        lambda s: s.round_history(round_uid, player, before_id=cursors[-1], limit=HISTORY_PAGE_SIZE),
+        scope=round_uid,
+    )
+except Exception as e:
+    rows = None
+    st.error(f"履歴エラー: {e}")
+if rows:
+    st.dataframe(
+        [{"h": r.hole_no, "club": r.club, "on_off": r.on_off, "寄せ": r.proximity, "pen": r.penalty, "score": r.score}
+         for r in rows],
+        hide_index=True, use_container_width=True,
+    )
+    c_newer, c_older = st.columns(2)
+    with c_newer:
+        if len(cursors) > 1 and st.button("◀ 新しい"):
+            cursors.pop()
+            st.rerun()
+    with c_older:
+        if len(rows) == HISTORY_PAGE_SIZE and st.button("古い ▶"):
+            cursors.append(rows[-1].id)
+            st.rerun()
+if pending_rows or rows:
+    if st.button("最新1打を削除"):
+        try:
+            # 未送信分があればそちらが最新
+            if not journal.discard_latest(round_uid, player):
+                hole = storage.delete_latest(round_uid, player)
+                get_cache().bump(round_uid)
+                if hole is not None:
+                    journal.forget(round_uid, player, hole)
+                    get_trends().delete_hole(round_uid, player, hole)
+            st.session_state.hole_index = max(0, st.session_state.hole_index - 1)
+            st.session_state.is_finished = False
+            st.session_state.history_cursors = [None]
+            st.rerun()
+        except Exception as e:
+            st.error(f"履歴エラー: {e}")
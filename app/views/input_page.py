@@ -0,0 +1,189 @@
+import time
+import uuid
+
+import streamlit as st
+
+from courses import get_catalog
+from constants import (
+    CLUB_LIST, DIST_LIST_DISP,
+    DIST_MAP, DIR_MAP, LIE_MAP, PROXIMITY_MAP, PENALTY_MAP,
+)
+from journal import get_journal
+from session import ROUNDS_PAGE, current_round, release_held, rerun, start_new_round, sync_params
+from telemetry import get_telemetry
+from warmup import get_keep_warm
+
+# ==========================================
+# ⛳ 入力画面 (既定のページ)
+# ==========================================
+# コース上で開くページなので、ジャーナル (ローカルの SQLite) とコースカタログだけで描く。
+# pandas・分析・保存先 (storage) はこのページからは読み込まない (DB への送信はフラッシャが裏で行う)。
+
+catalog = get_catalog()
+
+def submit_key(hole_no):
+    """このホールの登録に使う冪等キー (登録が済むと次のキーに変わる)"""
+    return st.session_state.submit_keys.setdefault(
+        (st.session_state.round_uid, hole_no), str(uuid.uuid4())
+    )
+
+def show_flash():
+    while st.session_state.flash:
+        msg, icon = st.session_state.flash.pop(0)
+        st.toast(msg, icon=icon)
+
+def play_order():
+    if "OUT" in st.session_state.start_side:
+        return list(range(1, 19))
+    return list(range(10, 19)) + list(range(1, 10))
+
+def next_hole():
+    if st.session_state.hole_index == 17:
+        # 終了画面は全体を描き直す
+        st.session_state.is_finished = True
+        scope = "app"
+    else:
+        st.session_state.hole_index += 1
+        st.session_state.on_status_res = "パーオン成功"
+        scope = "fragment"
+    sync_params()
+    rerun(scope)
+
+# --- ⛳ ホール入力 ---
+# ラジオ・セレクトボックスの操作や登録ではこのフラグメントだけが再実行される
+# (セッション初期化・CSS・サイドバーは描き直さない)
+@st.fragment
+def hole_input():
+    started = time.perf_counter()
+    show_flash()
+    order = play_order()
+    hole_no = order[st.session_state.hole_index]
+    par = catalog.par(st.session_state.course_name, st.session_state.green_type, hole_no)
+    yards = catalog.yards(st.session_state.course_name, st.session_state.green_type, hole_no)
+
+    st.markdown(f"""<div class='hole-header'>
+        <span>{hole_no}H</span><span style='color:#ffc107; font-size:1.4rem;'>Par {par or "?"}</span><span>{st.session_state.green_type} Green</span>
+    </div>""", unsafe_allow_html=True)
+    if yards:
+        st.caption(" / ".join(f"{tee} {y}y" for tee, y in yards.items()))
+    if par is None:
+        # カタログに無いコースはパーを手で選ぶ
+        st.caption("パー (カタログ未登録のコース)")
+        par = st.radio("par", [3, 4, 5], index=1, horizontal=True, label_visibility="collapsed", key=f"par_{hole_no}")
+
+    # 送信状況 (🟨 端末に保留 / 📡 送信待ち / ✅ 送信済み)。ローカルのジャーナルだけを見る
+    journal = get_journal()
+    status = journal.hole_status(st.session_state.round_uid, st.session_state.player)
+    if st.session_state.buffer_mode or "held" in status.values():
+        marks = {"held": "🟨", "pending": "📡", "committed": "✅"}
+        for half in (order[:9], order[9:]):
+            st.caption(" ".join(f"{h}{marks.get(status.get(h), '⬜')}" for h in half))
+        if "held" in status.values() and st.button("📤 保留分を今すぐ送信"):
+            release_held()
+            rerun("fragment")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.caption("残り距離")
+        dist_raw = st.selectbox("dist", DIST_LIST_DISP, index=2, label_visibility="collapsed")
+    with col2:
+        st.caption("クラブ")
+        club = st.selectbox("club", CLUB_LIST, index=6, label_visibility="collapsed")
+
+    # --- 結果入力エリア ---
+    st.caption("ショット結果")
+    on_status = st.radio("on_check", ["パーオン成功", "失敗"], horizontal=True, label_visibility="collapsed", index=0 if st.session_state.on_status_res == "パーオン成功" else 1)
+    st.session_state.on_status_res = on_status
+    
+    proximity_raw = "NONE"
+    miss_dir_raw, lie_raw = "NONE", "NONE"
+
+    # ONなら「距離感」を聞く
+    if on_status == "パーオン成功":
+        st.caption("ピンまでの距離 (寄せ)")
+        # ★ここも変更済み
+        proximity_raw = st.radio("prox", ["1.5m以内", "3m以内", "5m以内", "6m以上"], horizontal=True, label_visibility="collapsed", index=2)
+    
+    # OFFなら「方向」と「ライ」を聞く
+    else:
+        st.caption("外した方向")
+        miss_dir_raw = st.radio("dir", ["左", "手前", "奥", "右"], horizontal=True, label_visibility="collapsed")
+        st.caption("ライの状態")
+        lie_raw = st.radio("lie", ["フェアウェイ", "ラフ弱", "ラフ強", "バンカー"], horizontal=True, label_visibility="collapsed")
+
+    # --- ペナルティ入力 (共通) ---
+    st.caption("ペナルティ / OB")
+    penalty_raw = st.radio("pen", ["なし", "OB", "1ペナ(池など)"], horizontal=True, label_visibility="collapsed")
+
+    # フォームのキーは登録ごとに変わるので、登録後に届いた二度押しは前のフォーム宛てとして無視される
+    client_key = submit_key(hole_no)
+    with st.form(f"score_form_{client_key}", clear_on_submit=True):
+        st.markdown("<hr>", unsafe_allow_html=True)
+        st.caption("パット数")
+        putts = st.radio("putts", [0, 1, 2, 3, 4, 5, 6], index=2, horizontal=True, label_visibility="collapsed")
+        st.caption(f"ホールスコア (Par {par})")
+        score_opts = [1, 2, 3, 4, 5, 6, 7, 8, "9~"]
+        score_disp = st.radio("score", score_opts, index=min(len(score_opts)-1, par-1), horizontal=True, label_visibility="collapsed")
+        st.caption("リカバリ数")
+        recovery = st.radio("recovery", [0, 1, 2, 3, 4, 5, 6], index=0, horizontal=True, label_visibility="collapsed")
+
+        st.markdown("<div class='btn-reg'>", unsafe_allow_html=True)
+        submitted = st.form_submit_button("登録 ➡ 次のホールへ")
+        st.markdown("</div>", unsafe_allow_html=True)
+
+        if submitted:
+            final_score = 9 if score_disp == "9~" else int(score_disp)
+            try:
+                # ローカルのジャーナルに追記した時点で完了 (DB送信はバックグラウンド)
+                # 登録済みのホールをもう一度登録すると上書きになる
+                finishing = st.session_state.hole_index == 17
+                buffered = st.session_state.buffer_mode
+                seq = journal.append({
+                    "round_date": st.session_state.round_date, "course_name": st.session_state.course_name,
+                    "hole_no": hole_no, "par": par,
+                    "dist_range": DIST_MAP.get(dist_raw), "club": club,
+                    "is_green_on": (on_status=="パーオン成功"),
+                    "miss_dir": DIR_MAP.get(miss_dir_raw), "lie_type": LIE_MAP.get(lie_raw),
+                    "recovery_strokes": recovery, "hole_score": final_score,
+                    "green_type": st.session_state.green_type, "putts": putts,
+                    "proximity": PROXIMITY_MAP.get(proximity_raw), "penalty": PENALTY_MAP.get(penalty_raw),
+                }, current_round("finished" if finishing else "playing"), client_key, st.session_state.player,
+                    hold=buffered)
+                st.session_state.submit_keys.pop((st.session_state.round_uid, hole_no), None)
+                if seq is None:
+                    st.session_state.flash.append((f"{hole_no}H は登録済みです", "ℹ️"))
+                elif buffered:
+                    st.session_state.flash.append((f"🟨 {hole_no}H を端末に保留しました", "⛳"))
+                else:
+                    pending = journal.pending_count()
+                    st.session_state.flash.append((f"✅ {hole_no}H 登録完了" + (f" (未送信 {pending} 件)" if pending else ""), "⛳"))
+                # ハーフ終了 (9ホール目) とラウンド終了で保留分を1トランザクションで送る
+                if buffered and (st.session_state.hole_index == 8 or finishing):
+                    release_held()
+                # ラウンド中は DB を休止させない (KEEP_WARM_SECONDS を指定したときだけ)。終わったら止める
+                if finishing:
+                    get_keep_warm().idle()
+                else:
+                    get_keep_warm().touch()
+                next_hole()
+            except Exception as e:
+                st.error(f"エラー: {e}")
+
+    get_telemetry().record("rerun", "hole_input", time.perf_counter() - started)
+
+# 共有用の URL (クエリパラメータ) はページを移ると消えるので、入力画面を描くたびに付け直す
+sync_params()
+if st.session_state.is_finished:
+    st.balloons()
+    show_flash()
+    st.success(f"🏆 ラウンド終了！")
+    if st.button("新しいラウンドを開始", type="primary"):
+        start_new_round()
+        sync_params(); st.rerun()
+    # 合計・OUT / IN・パットなどは 18 ホール目と一緒に書かれたラウンドのサマリを一覧で見る
+    # (送信待ちのホールがあれば、送られてから反映される)
+    if st.button("📋 ラウンドの集計を見る"):
+        st.session_state.rounds_cursors = [None]
+        st.switch_page(ROUNDS_PAGE)
+else:
+    hole_input()
@@ -0,0 +1,51 @@
+import streamlit as st
+
+from rounds import ROUNDS_PAGE_SIZE
+from session import cached_query, go_input, resume_round
+from storage import get_storage
+
+# ==========================================
+# 🏌️ ラウンド一覧
+# ==========================================
+
+get_storage().ensure_schema()
+st.subheader("🏌️ ラウンド一覧")
+if st.button("◀ 入力に戻る"):
+    go_input()
+cursors = st.session_state.rounds_cursors
+try:
+    rounds = cached_query(
+        "list_rounds", (st.session_state.player, cursors[-1], ROUNDS_PAGE_SIZE),
+        lambda s: s.list_rounds(st.session_state.player, before_id=cursors[-1], limit=ROUNDS_PAGE_SIZE),
+    )
+except Exception as e:
+    rounds = None
+    st.error(f"一覧エラー: {e}")
+if rounds is not None:
+    if not rounds:
+        st.info("ラウンドがありません")
+    for r in rounds:
+        status = "🏁" if r.status == "finished" else "⛳"
+        holes = int(r.holes or 0)
+        score = f"{r.score} ({r.over_par:+d})" if holes else "-"
+        c_info, c_btn = st.columns([3, 1])
+        with c_info:
+            st.markdown(f"{status} **{r.round_date}** {r.course_name} ({r.green_type}) — {holes}H / {score}")
+            if holes:
+                # ラウンドのサマリ (1ラウンド1行) をそのまま出す
+                st.caption(
+                    f"OUT {r.front_score} / IN {r.back_score} ・ パット {r.putts} ・ パーオン {r.gir} ・ ペナルティ {r.penalties}"
+                )
+        with c_btn:
+            if st.button("再開" if r.status != "finished" else "開く", key=f"resume_{r.round_uid}"):
+                resume_round(r)
+                go_input()
+    c_newer, c_older = st.columns(2)
+    with c_newer:
+        if len(cursors) > 1 and st.button("◀ 新しい"):
+            cursors.pop()
+            st.rerun()
+    with c_older:
+        if len(rounds) == ROUNDS_PAGE_SIZE and st.button("古い ▶"):
+            cursors.append(rounds[-1].id)
+            st.rerun()
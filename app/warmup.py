@@ -0,0 +1,222 @@
+"""DB の暖機 (サーバレス Postgres の休止からの復帰を、最初の画面より先に済ませる)
+
+    python warmup.py            # 暖機して段階ごとの所要時間を表示する (朝、スタート前に cron から叩くなど)
+
+アプリでは main.py がプロセスで1回、裏のスレッドで走らせる (WARMUP_WAIT_SECONDS を指定すれば
+最初の画面をその秒数まで待たせる)。KEEP_WARM_SECONDS を指定すると、ラウンド中 (最後の登録から
+KEEP_WARM_ACTIVE_MINUTES 分以内) はその間隔で DB に軽い問い合わせを送り、休止させない。
+"""
+import argparse
+import json
+import threading
+import time
+
+from cache import get_cache
+from config import get_secret, get_int, get_float, storage_backend
+from courses import get_catalog
+from db import get_pool, get_connection
+from rounds import DEFAULT_PLAYER, ROUNDS_PAGE_SIZE
+from telemetry import get_telemetry
+
+# ==========================================
+# 🔥 暖機とキープウォーム
+# ==========================================
+# 暖機の段階:
+#   pool    プールの最小接続数まで接続する (休止中ならここで起こす。再試行はプール側のジッタつき指数バックオフ)
+#   probe   SELECT 1
+#   schema  マイグレーションの確認 (最初のフラッシュの前に済ませる)
+#   catalog コースカタログが古ければ読み直す
+#   recent  ラウンド一覧の1ページ目をキャッシュに入れ、推移の状態を用意する
+# pool / probe が失敗したら (DB が起きない・ブレーカーが開いた) 残りは飛ばす。
+# 入力画面は DB を使わない (ジャーナルに書く) ので、暖機が終わらなくても記録はできる。
+
+
+class WarmUp:
+    def __init__(self, players=(DEFAULT_PLAYER,)):
+        self.players = tuple(players)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = None
+        self.steps = {}
+        self.started_at = None
+        self.elapsed = None
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def _step(self, name, fn):
+        started = time.perf_counter()
+        try:
+            fn()
+            error = None
+        except Exception as e:
+            error = str(e)
+        seconds = time.perf_counter() - started
+        get_telemetry().record("warmup", name, seconds)
+        self.steps[name] = {"sec": round(seconds, 3), "error": error}
+        return error is None
+
+    def _probe(self):
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+
+    def _schema(self):
+        from storage import get_storage
+
+        error = get_storage().ensure_schema()
+        if error:
+            raise RuntimeError(error)
+
+    def _catalog(self):
+        catalog = get_catalog()
+        with get_connection() as conn:
+            if catalog.is_stale(conn):
+                catalog.load(conn)
+
+    def _recent(self):
+        # 分析用のモジュール (pandas) はここで読み込む (裏のスレッドなので画面は待たない)
+        from storage import get_storage
+        from trends import get_trends
+
+        storage = get_storage()
+        for player in self.players:
+            # ラウンド一覧のページと同じキーで入れておく
+            get_cache().get_or_load(
+                "list_rounds", (player, None, ROUNDS_PAGE_SIZE),
+                lambda: storage.list_rounds(player, before_id=None, limit=ROUNDS_PAGE_SIZE),
+            )
+        get_trends().ensure(storage)
+
+    def run(self):
+        """暖機を最後まで (この呼び出しの中で) 行う。成功なら True"""
+        self.started_at = time.time()
+        started = time.perf_counter()
+        ok = self._step("pool", lambda: get_pool().fill()) and self._step("probe", self._probe)
+        if ok:
+            for name, fn in (("schema", self._schema), ("catalog", self._catalog), ("recent", self._recent)):
+                ok = self._step(name, fn) and ok
+        self.elapsed = round(time.perf_counter() - started, 3)
+        self._done.set()
+        return ok
+
+    def start(self):
+        """裏のスレッドで1回だけ走らせる"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name="db-warmup", daemon=True)
+                self._thread.start()
+
+    def wait(self, timeout):
+        return self._done.wait(timeout)
+
+    def stats(self):
+        return {"done": self.done, "started_at": self.started_at, "elapsed": self.elapsed, "steps": dict(self.steps)}
+
+
+class KeepWarm:
+    """ラウンド中だけ interval 秒ごとに SELECT 1 を送り、サーバレス Postgres を休止させない"""
+
+    def __init__(self, interval, active_window):
+        self.interval = interval
+        self.active_window = active_window
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_activity = None
+        self._stats = {"pings": 0, "failures": 0, "skipped": 0, "last_ping": None, "last_error": None}
+
+    @property
+    def enabled(self):
+        return self.interval > 0
+
+    def active(self):
+        return self._last_activity is not None and time.monotonic() - self._last_activity < self.active_window
+
+    def touch(self):
+        """ホールを登録したときに呼ぶ (ここからラウンド中とみなす)"""
+        if not self.enabled:
+            return
+        self._last_activity = time.monotonic()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-keep-warm", daemon=True)
+                self._thread.start()
+
+    def idle(self):
+        """ラウンドが終わったら呼ぶ (次の登録まで送らない)"""
+        self._last_activity = None
+
+    def ping(self):
+        started = time.perf_counter()
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            self._stats["pings"] += 1
+            self._stats["last_error"] = None
+        except Exception as e:
+            # 失敗はブレーカーに数えられ、続けば接続を試さなくなる (登録はジャーナルに残る)
+            self._stats["failures"] += 1
+            self._stats["last_error"] = str(e)
+        self._stats["last_ping"] = time.time()
+        get_telemetry().record("warmup", "keep_warm_ping", time.perf_counter() - started)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if self.active():
+                self.ping()
+            else:
+                self._stats["skipped"] += 1
+
+    def stats(self):
+        return {"enabled": self.enabled, "interval": self.interval, "active": self.active(), **self._stats}
+
+
+_warmup = None
+_keep_warm = None
+_state_lock = threading.Lock()
+
+
+def get_warmup():
+    """プロセス共通の暖機を返す (WARMUP_PLAYERS: 一覧を先読みするプレーヤー、カンマ区切り)"""
+    global _warmup
+    if _warmup is None:
+        with _state_lock:
+            if _warmup is None:
+                players = [p.strip() for p in str(get_secret("WARMUP_PLAYERS", DEFAULT_PLAYER)).split(",") if p.strip()]
+                _warmup = WarmUp(players)
+    return _warmup
+
+
+def get_keep_warm():
+    """プロセス共通のキープウォームを返す (KEEP_WARM_SECONDS=0 か SQLite なら何もしない)"""
+    global _keep_warm
+    if _keep_warm is None:
+        with _state_lock:
+            if _keep_warm is None:
+                # 手元の SQLite なら起こす相手がいない
+                interval = get_float("KEEP_WARM_SECONDS", 0) if storage_backend() == "postgres" else 0
+                _keep_warm = KeepWarm(
+                    interval,
+                    get_int("KEEP_WARM_ACTIVE_MINUTES", 30) * 60,
+                )
+    return _keep_warm
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DB の暖機")
+    parser.parse_args(argv)
+    warmup = get_warmup()
+    ok = warmup.run()
+    print(json.dumps(warmup.stats(), ensure_ascii=False, indent=2))
+    print(json.dumps(get_pool().stats()["breaker"], ensure_ascii=False, indent=2))
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()